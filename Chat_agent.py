@@ -1,36 +1,45 @@
 # Import relevant libraries
-import json, os, openai, sqlite3
-import pandas as pd
-import uuid
-from datetime import datetime, date
-from groq import Groq
-from helper_functions.utility import (Chat_OAI_llm, Groq_client, Groq_model, OAI_client, OAI_model, dbfolder, MyError, 
-                                      setup_shared_logger, count_tokens, check_for_malicious_intent)
+import json, os, openai, sqlite3, threading
+from datetime import datetime
+from functools import lru_cache
+from helper_functions.utility import (dbfolder, get_client, get_model, MyError, 
+                                      setup_shared_logger, count_tokens, check_for_malicious_intent, chat_memory_ttl_days,
+                                      chat_memory_max_threads, chat_memory_max_checkpoints, chat_summary_token_threshold,
+                                      make_cache_key, web_search_cache, web_search_memory_cache)
+from helper_functions.checkpoint import SQLiteCheckpointer
+from helper_functions.passages import compact_results
 from helper_functions.prompts import chatagent_sys_msg
-from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
-from langchain_core.tools import tool
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
-from langchain_tavily import TavilySearch, TavilyExtract
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, MessagesState, StateGraph, START
 from langgraph.graph.state import CompiledStateGraph
-from langgraph.prebuilt import create_react_agent, tools_condition, ToolNode
-from strip_markdown import strip_markdown
-from openai import OpenAI
-from openai.types.chat import ChatCompletion
-from operator import add
-from typing import Annotated, Dict, List, Optional, Union
+from langgraph.prebuilt import ToolNode
+from typing import Annotated, Any, Dict, Iterator, List
 from typing_extensions import Literal
 
 # Set up the shared logger
 logger = setup_shared_logger()
 
+def merge_message_tokens(left:Dict[str, int], right:Dict[str, int|None])->Dict[str, int]:
+    """Reducer of the per-message token counts. A count of None removes the message's entry, e.g. once the message is deleted."""
+    merged = dict(left or {})
+    for message_id, tokens in right.items():
+        if tokens is None:
+            merged.pop(message_id, None)
+        else:
+            merged[message_id] = tokens
+    return merged
+
 # Define the state for the langgraph agent
 class State(MessagesState):
     summary: str
-    toolmsg: Annotated[list[ToolMessage], add]
+    # Tool message of the latest web search only, so that the channel does not grow for the life of the thread
+    toolmsg: list[ToolMessage]
     urls: tuple[str, List]
+    # Token count of each message in the history, keyed by message id, so that each message is only counted once
+    message_tokens: Annotated[Dict[str, int], merge_message_tokens]
+    # Running total of the token counts of the messages in the history
+    history_tokens: int
 
 # Defining the Tavily web search tool that is available for use by agent
 def web_search(query:str, topic:Literal['general','news']='general', 
@@ -39,19 +48,39 @@ def web_search(query:str, topic:Literal['general','news']='general',
     """Sends query to Tavily web search API. Filter and return only the results from Tavily
     with relevance score of at least 0.7 and where raw content is not None."""
     try:
-        web_search_tool = TavilySearch(topic=topic, search_depth='advanced', max_results=max_results, include_answer=False,
-                                    include_raw_content=True)
-        response = web_search_tool.invoke({"query":query,"include_domains":include_domains, "exclude_domains":exclude_domains, "time_range":time_range})
+        # Serve repeated searches from the web search cache, keyed by the normalised query and the search options
+        cache_key = make_cache_key(api='tavily_search', query=" ".join(query.casefold().split()), topic=topic,
+                                   include_domains=sorted(include_domains or []), exclude_domains=sorted(exclude_domains or []),
+                                   time_range=time_range, max_results=max_results)
+        cached = web_search_memory_cache.get(cache_key)
+        if cached is None:
+            entry = web_search_cache.get_entry(cache_key)
+            if entry is None:
+                response = get_client('tavily').search(query=query, topic=topic, search_depth='advanced', max_results=max_results,
+                                                       include_answer=False, include_raw_content=True, include_domains=include_domains,
+                                                       exclude_domains=exclude_domains, time_range=time_range)
+                cached, created_at = json.dumps(response), None
+                web_search_cache.set(cache_key, cached)
+            else:
+                cached, created_at = entry
+            # Results read from the database keep their original age, so that they expire from memory at the same time
+            web_search_memory_cache.set(cache_key, cached, created_at=created_at)
+        response = json.loads(cached)
         # Extracts the url list
         urllist = response['results']
         # Updates the content dict with filtered url list, if applicable
         response['results'] = [item for item in urllist if float(item['score']) >= relscore and item.get('raw_content') is not None]
+        # Keep only the page content passages most relevant to the query, within the token budget
+        response['results'] = compact_results(query, response['results'])
         return json.dumps(response)
     except (Exception, BaseException) as e:
         raise MyError(f"Error encountered while running Tavily search: {e}")
 
 tools = [web_search]
-llm_with_tools = Chat_OAI_llm.bind_tools(tools)
+@lru_cache(maxsize=None)
+def llm_with_tools():
+    """Chat model bound to the agent's tools, built on first use so that importing the agent does not read the secrets"""
+    return get_client('chat_openai').bind_tools(tools)
 
 # Defining the components of the LangGraph chat agent
 #1) Define the assistant node
@@ -72,14 +101,14 @@ def assistant(state:State):
         # if so, extract the search urls from the content
             #url = [(state['messages'][-3].content, [item.get("url","") for item in json.loads(state['messages'][-1].content)['results']])]
         urls = (state['messages'][-3].content, json.loads(state['messages'][-1].content)['results'])
-        toolmsg = [state['messages'][-1]]
+        update = {"toolmsg": [state['messages'][-1]]}
     else:
         urls = ()
-        toolmsg = []
+        update = {}
 
     try:
-        response = llm_with_tools.invoke(messages)
-        return {"messages":response, "urls":urls, "toolmsg":toolmsg}
+        response = llm_with_tools().invoke(messages)
+        return {"messages":response, "urls":urls, **update}
     except openai.APIError as e:
             raise MyError(f"Assistant node LLM API error: {e}")
     except (Exception, BaseException) as e:
@@ -87,13 +116,16 @@ def assistant(state:State):
 
 #2) Define the summarisation node
 def summarise_conversation(state:State):
-    # extract text content in messages history
     messages = state['messages']
-    content = " ".join([x.content for x in messages])
-    # Check if token count of messages content history exceeds threshold if so,
-    # proceed to summarise.
+    # Count the tokens of only the messages added since the last turn, and add them to the running total of the history
+    counted = state.get("message_tokens") or {}
     try:
-        if count_tokens(content) > 2048:
+        new_tokens = {m.id: count_tokens(m.content if isinstance(m.content, str) else json.dumps(m.content))
+                      for m in messages if m.id not in counted}
+        history_tokens = state.get("history_tokens", 0) + sum(new_tokens.values())
+        # Check if token count of messages content history exceeds threshold if so,
+        # proceed to summarise.
+        if history_tokens > chat_summary_token_threshold:
             # Get summary of conversation if it exists
             summary = state.get("summary","")
             if summary:
@@ -107,13 +139,16 @@ def summarise_conversation(state:State):
                 summary_message = " Provide a clear and concise summary of the conversation above, covering ALL key points and main ideas presented. "
             # Add prompt to message history (except the last message). Not possible to do message[:-2] because Langgraph will raise error saying that the toolmsg is missing
             messages = messages[:-1] + [HumanMessage(content=summary_message)]  #cannot skip any message in between, e.g. ignore toolmessage, langgraph will give error
-            response = llm_with_tools.invoke(messages)
+            response = llm_with_tools().invoke(messages)
 
-            # Delete all message history, except the most recent one
+            # Delete all message history, except the most recent one, together with their token counts
             delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-1]]
-            return {"summary": response.content, "messages": delete_messages}
+            last = state["messages"][-1].id
+            remaining = new_tokens.get(last, counted.get(last, 0))
+            return {"summary": response.content, "messages": delete_messages,
+                    "message_tokens": {**new_tokens, **{m.id: None for m in delete_messages}, last: remaining}, "history_tokens": remaining}
         else:
-            pass
+            return {"message_tokens": new_tokens, "history_tokens": history_tokens}
     
     except openai.APIError as e:
             raise MyError(f"Summariser node LLM API error: {e}")
@@ -129,78 +164,232 @@ def should_continue(state: State) -> Literal["tools", "summarise_conversation"]:
         return "tools"
     return "summarise_conversation"
 
-#4) Build and compile langgraph agent
-workflow = StateGraph(State)
-# Define the nodes for the langgraph agent
-workflow.add_node("assistant", assistant)
-workflow.add_node("tools", ToolNode(tools))
-workflow.add_node(summarise_conversation)
-# Define the edges for the langgraph agent
-workflow.add_edge(START, "assistant")
-workflow.add_conditional_edges("assistant", should_continue)
-workflow.add_edge("tools", "assistant")
-workflow.add_edge("summarise_conversation", END)
-# Define in-memory to store historical conversation. NB: memory is non-permanent
-memory = MemorySaver()
-graph = workflow.compile(checkpointer=memory)
-
-
-def chatagent_response(query:str, id:str, langgraph:CompiledStateGraph=graph):
-    """This function controls interaction with the chat agent. It takes in the user
-    query and checks for malicious intent. If ok, the query is passed to the langgraph
-    model to elicit LLM response."""
-    output = None
-    conn = None
+#4) Compact tool messages before they are persisted to the chat memory
+# Fields of a web search result kept in the chat memory, i.e. those needed for citations
+persisted_result_fields = ('url', 'title', 'content', 'score')
+
+
+def compact_results_for_memory(results:List)->List:
+    """Keeps only the citation fields of each web search result, dropping its raw page content and relevant passages"""
+    return [{key: value for key, value in item.items() if key in persisted_result_fields} if isinstance(item, dict) else item
+            for item in results]
+
+
+def compact_tool_message(message:Any)->Any:
+    """Drops the raw page content and relevant passages of the Tavily results in a web search tool message, keeping the urls,
+    titles, snippets and scores. The page content is only needed by the assistant in the turn the search is made."""
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return message
     try:
-        # Safeguard the chatbot from malicious prompt
-        # if prompt is deemed to be malicious, exit function with message
-        if check_for_malicious_intent(client=Groq_client, model=Groq_model, user_message=query) == "Y":
-            response, citation = ("Sorry, potentially malicious prompt detected. This request cannot be processed.","")
-            output = response
-        else:
-            # Specify a thread so that historical conversation within memory can be accessed
-            config = {"configurable": {"thread_id": id}}
-            input = [HumanMessage(content=f"<incoming-text>{query}</incoming-text>")]
-            
-            # Get LLM response
-            output = langgraph.invoke({"messages": input},config)
-            response = output['messages'][-1].content
-            # to prevent streamlit from showing anything between $ signs as Latex when not intended to.
-            response = response.replace("$", "\\$")
-            if len(output['urls'])>1 and query in output['urls'][0]:
-                citation = output['urls'][1]
+        content = json.loads(message.content)
+    except ValueError:
+        return message
+    if not isinstance(content, dict) or not isinstance(content.get('results'), list):
+        return message
+    content['results'] = compact_results_for_memory(content['results'])
+    return message.model_copy(update={'content': json.dumps(content)})
+
+
+def compact_channel(channel:str, value:Any)->Any:
+    """Compacts the tool messages held in the messages and toolmsg channels of the state, or written to them, and the web
+    search results kept in the urls channel for citations"""
+    if channel == 'urls':
+        return (value[0], compact_results_for_memory(value[1])) if isinstance(value, (tuple, list)) and len(value) > 1 else value
+    if channel not in ('messages', 'toolmsg'):
+        return value
+    if isinstance(value, list):
+        return [compact_tool_message(message) for message in value]
+    return compact_tool_message(value)
+
+#5) Build and compile langgraph agent
+def build_graph(memory_path:str=f'{dbfolder}/chat_memory.db')->CompiledStateGraph:
+    """Builds and compiles the langgraph agent, with its historical conversations stored in a SQLite database. Callers should
+    build the graph once and share it, e.g. Main.py caches it for the whole Streamlit server."""
+    workflow = StateGraph(State)
+    # Define the nodes for the langgraph agent
+    workflow.add_node("assistant", assistant)
+    tool_node = ToolNode(tools)
+    def gated_tools(state:State, config:RunnableConfig):
+        """Runs the web search only once the query of the turn is cleared of malicious intent"""
+        gate = config["configurable"].get("guard")
+        if gate is not None and not gate.cleared():
+            raise MyError("Web search withheld as the query was not cleared of malicious intent")
+        return tool_node.invoke(state, config)
+    workflow.add_node("tools", gated_tools)
+    workflow.add_node(summarise_conversation)
+    # Define the edges for the langgraph agent
+    workflow.add_edge(START, "assistant")
+    workflow.add_conditional_edges("assistant", should_continue)
+    workflow.add_edge("tools", "assistant")
+    workflow.add_edge("summarise_conversation", END)
+    # Store historical conversation in SQLite, so that it survives restarts, with idle and excess conversations evicted
+    memory = SQLiteCheckpointer(memory_path, ttl_seconds=chat_memory_ttl_days*24*3600, max_threads=chat_memory_max_threads,
+                                max_checkpoints=chat_memory_max_checkpoints, compact=compact_channel)
+    # Pause before summarising, so that the answer can be shown before the summarisation step runs
+    return workflow.compile(checkpointer=memory, interrupt_before=["summarise_conversation"])
+
+
+class GuardGate:
+    """Checks a query for malicious intent in a background thread, so that the agent can run meanwhile. The agent's tool node
+    waits for the verdict before making any web search."""
+
+    def __init__(self, query:str):
+        self.query = query
+        self.verdict = None
+        self.error = None
+        self._done = threading.Event()
+        threading.Thread(target=self._check, daemon=True).start()
+
+    def _check(self):
+        try:
+            self.verdict = check_for_malicious_intent(client=get_client('groq'), model=get_model('groq'), user_message=self.query)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def done(self)->bool:
+        """Whether the verdict is available"""
+        return self._done.is_set()
+
+    def cleared(self)->bool:
+        """Waits for the verdict, and returns whether the query is cleared, i.e. checked without error and not malicious"""
+        self._done.wait()
+        return self.error is None and self.verdict != "Y"
+
+
+class ChatTurn:
+    """One turn of the conversation with the chat agent: stream() yields the answer token by token, citation() returns its sources
+    as soon as it ends, and finish() then summarises and logs the turn."""
+
+    def __init__(self, query:str, id:str, langgraph:CompiledStateGraph):
+        self.query = query
+        self.id = id
+        self.langgraph = langgraph
+        # Specify a thread so that historical conversation within memory can be accessed
+        self.config = {"configurable": {"thread_id": id}}
+        self.blocked = False
+        self.failed = False
+
+    def _agent_output(self, config:RunnableConfig)->Iterator[str]:
+        """Yields the assistant's answer as it is generated, and a note whenever the web search starts or returns"""
+        input = [HumanMessage(content=f"<incoming-text>{self.query}</incoming-text>")]
+        searching = False
+        for chunk, metadata in self.langgraph.stream({"messages": input}, config, stream_mode="messages"):
+            node = metadata.get("langgraph_node")
+            if node == "assistant" and isinstance(chunk, AIMessageChunk):
+                if chunk.tool_call_chunks and not searching:
+                    searching = True
+                    yield "*Searching the web...*\n\n"
+                if isinstance(chunk.content, str) and chunk.content:
+                    # to prevent streamlit from showing anything between $ signs as Latex when not intended to.
+                    yield chunk.content.replace("$", "\\$")
+            elif node == "tools" and isinstance(chunk, ToolMessage):
+                searching = False
+                yield "*Reading the web search results...*\n\n"
+
+    def stream(self)->Iterator[str]:
+        """Yields the assistant's answer as it is generated, held back until the concurrently running guard clears the query. A
+        turn that is not cleared is stopped and removed from the conversation memory."""
+        # Safeguard the chatbot from malicious prompt, checked in the background so that the agent need not wait for it
+        gate = GuardGate(self.query)
+        # Latest checkpoint before this turn, to rewind to if the query is not cleared
+        before = self.langgraph.get_state(self.config).config
+        output = self._agent_output({"configurable": {"thread_id": self.id, "guard": gate}})
+        held = []
+        try:
+            for text in output:
+                if not gate.done():
+                    held.append(text)
+                    continue
+                if not gate.cleared():
+                    break
+                if held:
+                    yield "".join(held)
+                    held = []
+                yield text
+        except Exception as e:
+            # An error of the agent is only reported for a query that is cleared
+            if gate.cleared():
+                self.failed = True
+                logger.error(f"Error while executing {os.path.basename(__file__)}: {e}")
+                yield "Sorry, an error occurred while processing this request. Please try again."
+                return
+        finally:
+            output.close()
+
+        if not gate.cleared():
+            self.langgraph.checkpointer.rewind(before)
+            if gate.error is not None:
+                self.failed = True
+                logger.error(f"Error while executing {os.path.basename(__file__)}: {gate.error}")
+                yield "Sorry, an error occurred while processing this request. Please try again."
             else:
-                citation = ""
-
-        # Log into database, only works for local deployment as this is a local sql database. 
-        # Doesn't work for deployment in streamlit community cloud, need to look for online database to store the chat logs, if really necessary, 
-        # else can still refer to langsmith for the chat log (retention period 14 days)
-        conn = sqlite3.connect(f'{dbfolder}/data.db')
-        cursor = conn.cursor()
-        # Create table if not exists
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS agentlogs (
-                id TEXT,
-                log TEXT NOT NULL,
-                timestamp TEXt NOT NULL
-                )
-            ''')
-        # Insert data
-        cursor.execute("INSERT INTO agentlogs (id, log, timestamp) VALUES (?, ?, ?)", (id,str(output),datetime.now().strftime("%d %b %Y, %H:%M:%S")))
-        conn.commit()
-            
-        return (response, citation)
-        
-    except MyError as e:
-        logger.error(f"Error while executing {os.path.basename(__file__)}: {e}")
-    except sqlite3.Error as e:
-        logger.error(f"Database connection error while executing {os.path.basename(__file__)}: {e}")
-    except (Exception, BaseException) as e:
-        logger.error(f"General error while executing {os.path.basename(__file__)}: {e}")
-    
-    finally:
-        if conn:
-            conn.close()
+                # if prompt is deemed to be malicious, exit function with message
+                self.blocked = True
+                yield "Sorry, potentially malicious prompt detected. This request cannot be processed."
+            return
+        if held:
+            yield "".join(held)
+
+    def citation(self)->List|str:
+        """Returns the web search results cited in the answer, or "" if the answer needed no web search"""
+        if self.blocked or self.failed:
+            return ""
+        urls = self.langgraph.get_state(self.config).values.get('urls', ())
+        if len(urls)>1 and self.query in urls[0]:
+            return urls[1]
+        return ""
+
+    def finish(self):
+        """Runs the summarisation step paused before, once the user has the answer, and logs the turn"""
+        conn = None
+        try:
+            if self.blocked:
+                output = "Sorry, potentially malicious prompt detected. This request cannot be processed."
+            else:
+                if not self.failed and self.langgraph.get_state(self.config).next:
+                    self.langgraph.invoke(None, self.config)
+                output = self.langgraph.get_state(self.config).values
+
+            # Log into database, only works for local deployment as this is a local sql database. 
+            # Doesn't work for deployment in streamlit community cloud, need to look for online database to store the chat logs, if really necessary, 
+            # else can still refer to langsmith for the chat log (retention period 14 days)
+            conn = sqlite3.connect(f'{dbfolder}/data.db')
+            cursor = conn.cursor()
+            # Create table if not exists
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS agentlogs (
+                    id TEXT,
+                    log TEXT NOT NULL,
+                    timestamp TEXt NOT NULL
+                    )
+                ''')
+            # Insert data
+            cursor.execute("INSERT INTO agentlogs (id, log, timestamp) VALUES (?, ?, ?)", (self.id,str(output),datetime.now().strftime("%d %b %Y, %H:%M:%S")))
+            conn.commit()
+
+        except MyError as e:
+            logger.error(f"Error while executing {os.path.basename(__file__)}: {e}")
+        except sqlite3.Error as e:
+            logger.error(f"Database connection error while executing {os.path.basename(__file__)}: {e}")
+        except (Exception, BaseException) as e:
+            logger.error(f"General error while executing {os.path.basename(__file__)}: {e}")
+
+        finally:
+            if conn:
+                conn.close()
+
+
+def chatagent_response(query:str, id:str, langgraph:CompiledStateGraph):
+    """This function controls interaction with the chat agent. It takes in the user
+    query and checks for malicious intent. If ok, the query is passed to the langgraph
+    model to elicit LLM response. See ChatTurn for streaming the response."""
+    turn = ChatTurn(query, id, langgraph)
+    response = "".join(turn.stream())
+    citation = turn.citation()
+    turn.finish()
+    return (response, citation)
 
 if __name__ == "__main__":
      pass
\ No newline at end of file
@@ -1,10 +1,8 @@
-import json, os
-import pandas as pd
-import sqlite3, uuid
+import uuid
 import streamlit as st
-from helper_functions.utility import check_password, dbfolder, tablename, setup_shared_logger
+from helper_functions.utility import check_password, news_page_size, setup_shared_logger
 from helper_functions.prompts import Query1_user_input, Query2_user_input, Query3_user_input
-from Chat_agent import chatagent_response
+from helper_functions.data_access import count_news, data_version, query_news_page, query_research, sortable_columns
 
 st.set_page_config(layout="wide", page_title="CCS Merger Scanning Platform", menu_items={
         'Report a bug': "https://form.gov.sg/690d973dff46ce8978dcd393",
@@ -25,33 +23,28 @@ with st.expander("**Important Note:**", expanded=True):
 if not check_password():
     st.stop()
 
+# Research questions, keyed by the query names used in the research tables
+research_questions = {'Query1': Query1_user_input, 'Query2': Query2_user_input, 'Query3': Query3_user_input}
+
+@st.cache_resource(show_spinner="Starting the chat assistant...")
+def load_chat_agent():
+    """Imports the chat agent and compiles its graph on the first chat submission, once per Streamlit server. The agent pulls
+    in langgraph, langchain and Tavily, so it is kept off the path of rendering the news table."""
+    import Chat_agent
+    return Chat_agent.ChatTurn, Chat_agent.build_graph()
+
 # Setting up variables in session state
 if 'merger_filter_button_clicked' not in st.session_state:
     st.session_state.merger_filter_button_clicked = False
 
+# Page of Table 1, set through session state only, as it is also moved back when the filters leave fewer pages
+if 'news_page' not in st.session_state:
+    st.session_state.news_page = 1
+
 if 'userid' not in st.session_state:
     st.session_state.userid = None 
     #str(uuid.uuid4().hex)
 
-@st.cache_data
-def query_data(tablename:str, published_date:str=None, database:str = f'{dbfolder}/data.db'):
-    """Function to query from database"""
-    try:
-        conn = sqlite3.connect(database)
-        cursor = conn.cursor()
-        if published_date is None:
-            sqlquery = f"SELECT * FROM {tablename} WHERE Published_Date >= DATE('now','-1 month') ORDER BY Published_Date DESC"
-            
-        else:
-            sqlquery = f"SELECT * FROM {tablename} WHERE Published_Date >= '{published_date}' ORDER BY Published_Date DESC"
-        df = pd.read_sql_query(sqlquery, con=conn)
-        return df
-    except (Exception, BaseException, sqlite3.Error) as e:
-        logger.error(f"Error while executing {os.path.basename(__file__)} and querying from the database table named {tablename}: {e}")
-    finally:
-        if conn:
-            conn.close()
-
 def click_merger_filter():
     """Callback function to update session state when the button is clicked."""
     st.session_state.merger_filter_button_clicked = True
@@ -70,6 +63,8 @@ with col_topleft:
     with left_left:
         st.date_input("**Filter news articles from selected publication date onwards** ", value=None, key='published_date_filter', format="YYYY-MM-DD")
         st.write("By default, Table 1 shows past news articles published within 1 month from today.")
+        st.checkbox("**Collapse near-duplicate news articles**", key='collapse_near_duplicates', 
+                    help="Show only the most recent news article among those reporting the same news with slightly different wording")
     with left_right:
         st.button("**Filter merger-related news articles**", key='merger_filter', type="secondary", on_click=click_merger_filter)
         st.button("**Reset to see all news articles**", key='reset_merger_filter', type="primary", on_click=reset_merger_filter)
@@ -79,13 +74,30 @@ with col_topleft:
     st.write("### Table 1: News articles")
     st.write("***Please ONLY select one merger-related (i.e. Merger_Related = 'true') news article, at a time, to view research details***")
 
-    # Querying from database table 'news'
-    df_base = query_data(tablename=tablename, published_date=st.session_state.published_date_filter)
+    # Filtering, sorting and paging are done in the database, so that only the visible page of news articles is loaded
+    db_version = data_version()
+    published_date = st.session_state.published_date_filter
+    news_filter = dict(published_date=str(published_date) if published_date is not None else None,
+                       merger_only=st.session_state.merger_filter_button_clicked,
+                       collapse_near_duplicates=st.session_state.collapse_near_duplicates)
+    total = count_news(**news_filter, db_version=db_version)
+    pages = max(1, -(-total // news_page_size))
+    sort_left, sort_centre, sort_right = st.columns([0.4,0.3,0.3], gap="small")
+    with sort_left:
+        sort_column = st.selectbox("Sort by", sortable_columns, key='sort_column')
+    with sort_centre:
+        descending = st.toggle("Descending", value=True, key='sort_descending')
+    with sort_right:
+        # Go back to the last page if the filters now leave fewer pages
+        if st.session_state.news_page > pages:
+            st.session_state.news_page = pages
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key='news_page')
+    # Querying the page from database table 'news'
+    df_base = query_news_page(**news_filter, sort_column=sort_column, descending=descending, page=page, db_version=db_version)
+    first = (page - 1)*news_page_size
+    st.caption(f"Showing news articles {first + 1 if total > 0 else 0} to {first + len(df_base)} of {total}")
     # Adding a 'Selected' column for selection
     df_base["Selected"] = False
-    # If the "Filter for merger-related news" button is clicked, filter accordingly
-    if st.session_state.merger_filter_button_clicked:
-        df_base = df_base[df_base['Merger_Related'] == 'true']
     # If the value of the cell in "Merger_Related" column is true, highlight cell in blue
     df_base_style = df_base.style.map(lambda x: f"background-color: {'powderBlue' if x =='true' else ''}", subset='Merger_Related')
 
@@ -106,40 +118,29 @@ with col_topleft:
                 )
     
     selected_data = edited_df[edited_df["Selected"]]
-    # if the particular record is selected by clicking on one of the checkboxes
+    # if the particular record is selected by clicking on one of the checkboxes, look up the latest research run of each query for the article
+    research = {}
     if not selected_data.empty:
-        text = selected_data['Text'].values[0]
-        published = selected_data['Published_Date'].values[0]
-        extracted = selected_data['Extracted_Date'].values[0]
-        source = selected_data['Source'].values[0]
-        df_query1 = query_data(tablename=f'{tablename}_websearch_query1', published_date=st.session_state.published_date_filter)
-        df_query1 = df_query1.loc[(df_query1['Published_Date']==published) & (df_query1['Extracted_Date']==extracted) & (df_query1['Source']==source) & (df_query1['Text']==text)]
-        # If there is matching records
-        if len(df_query1)>0:
-                # When there are other queries, query the other tables accordingly and then merge to get df_query_combined. For now, to simulate df_query_combined, do a .copy()
-                df_query_combined = df_query1.copy()
-                merged_df = pd.merge(df_base, df_query_combined, on=['Published_Date','Source','Extracted_Date','Text'], how='inner')#.drop(['Reasons','Source','Selected','Merger_Related'], axis=1, inplace=False)
+        research = query_research(article_key=selected_data['Article_Key'].values[0], db_version=db_version)
     
     st.write("### Table 2: Research related to merger news")
         
     col_bottomleft, col_bottomright = st.columns([0.2,0.8], gap="small")
-    if not selected_data.empty and len(df_query1)>0:
+    if not selected_data.empty and len(research)>0:
         with col_bottomleft:
                 query_option = st.radio(
                                 "Select to view the research details",
-                                [field for field in df_query1.columns if "Query" in field],
+                                list(research.keys()),
                                 key='query_options'
                                 )
             
         with col_bottomright:
             st.write("**Research Question:**")
-            st.write(eval(f"{query_option}_user_input"))
+            st.write(research_questions.get(query_option, ''))
             st.write("**Research Results:**")
-            st.dataframe(data=pd.DataFrame(json.loads(eval(merged_df[query_option].values[0])[2])['response']),key='research_results_table')
+            st.dataframe(data=research[query_option]['findings'],key='research_results_table')
             st.write("**Web Search Urls:**")
-            temp = pd.DataFrame(eval(merged_df[query_option].values[0])[1], columns=['Urls'])
-            temp.index = temp.index+1
-            st.dataframe(data=temp,
+            st.dataframe(data=research[query_option]['citations'],
                          column_config={"Urls": st.column_config.LinkColumn(    
                                         help="Click to visit the web search urls")}, key='url_table') 
             
@@ -161,8 +162,11 @@ with col_topright:
                 st.write("Please input your CCS email address in order to continue...")
             else:
                 st.toast(f"Query Submitted - {user_prompt_chat}")
-                with st.spinner("Fetching results..."):
-                    response, citation = chatagent_response(query=user_prompt_chat, id=st.session_state.userid)
-                    st.write(response)
-                    if len(citation) > 0:
-                        st.write(citation)
+                ChatTurn, graph = load_chat_agent()
+                # Show the answer as it is generated, then its citations, before the conversation is summarised
+                turn = ChatTurn(query=user_prompt_chat, id=st.session_state.userid, langgraph=graph)
+                st.write_stream(turn.stream())
+                citation = turn.citation()
+                if len(citation) > 0:
+                    st.write(citation)
+                turn.finish()
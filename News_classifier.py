@@ -1,19 +1,29 @@
 # Import relevant libraries
-import asyncio, json, openai, os, sqlite3
+import argparse, asyncio, json, openai, os, sqlite3
 import pandas as pd
 import time
+from datetime import datetime
 from groq import Groq
-from helper_functions.utility import (MyError, setup_shared_logger, llm_output, Groq_model, Groq_client, OAI_model, 
-                                      OAI_client, tempscrappedfolder, tablename, dbfolder, WIPfolder, async_llm_output,
-                                      async_OAI_client, async_Groq_client)
-from helper_functions.prompts import classifier_sys_msg
-from News_websearch import main, prompt_generator
+from helper_functions.utility import (MyError, setup_shared_logger, llm_output, get_client, get_model,
+                                      tempscrappedfolder, tablename, dbfolder, WIPfolder, async_llm_output,
+                                      llm_cache, near_duplicate_threshold, 
+                                      near_duplicate_lookback_days, classifier_batch_size, prefilter_enabled, prefilter_threshold,
+                                      prefilter_min_merger_recall, prefilter_min_training_rows, prefilter_model_file)
+from helper_functions.batch_jobs import (BatchBackend, LocalBatchBackend, OpenAIBatchBackend, pending_batch_job, record_batch_job, 
+                                         update_batch_job, write_batch_file)
+from helper_functions.entities import EntityResolver
+from helper_functions.journal import clear_classifications, journaled_classifications, record_classification
+from helper_functions.database import article_key, ensure_news_schema, existing_keys, insert_or_ignore, recent_articles
+from helper_functions.near_duplicates import group_near_duplicates
+from helper_functions.prefilter import MergerPrefilter, atrain_prefilter, train_prefilter
+from helper_functions.prompts import classifier_sys_msg, classifier_batch_sys_msg
+from helper_functions.scheduler import estimate_tokens, get_scheduler
+from News_websearch import prompt_generator
 from openai import OpenAI
 from pathlib import Path
-from pydantic import BaseModel, Field
-from tqdm.asyncio import tqdm_asyncio
+from pydantic import BaseModel, Field, ValidationError, create_model
 from tqdm.auto import tqdm
-from typing import Annotated, Dict, List, Optional, Union, Any
+from typing import Annotated, Callable, Dict, List, Optional, Tuple, Union, Any
 from typing_extensions import Literal
 
 tqdm.pandas()
@@ -33,15 +43,275 @@ class classifier_response(BaseModel):
     Merger_Related: Literal['true', 'false', 'unable to tell'] = Field(...,description="Respond 'true' if given text is merger and acquisition related, 'false' if otherwise. If unsure even after providing reasoning, reply 'unable to tell'.")
     Merger_Entities: Optional[List[str]] = Field(..., description="Captures the list of names of parties involved, if given text is merger and acquisition related.")
 
+# Schema for classifying several indexed input texts in one request, built from the single-text schema with the index as the first field
+classifier_batch_item = create_model('classifier_batch_item', __doc__="Classification of one of the indexed input texts.",
+                                     Index=(int, Field(..., description="The index of the input text, as given in the index attribute of its <incoming-text> tag.")),
+                                     **{name: (field.annotation, field) for name, field in classifier_response.model_fields.items()})
 
-async def output(chunk:List)-> List[Any]:
-    """Processes a list of LLM requests asynchronously."""
-    tasks = [async_llm_output(client=async_OAI_client, model=OAI_model, prompt_messages=p, schema=classifier_response) for p in chunk]
-    results = await tqdm_asyncio.gather(*tasks, desc="Processing tasks")
+class classifier_batch_response(BaseModel):
+    """Pydantic response class to ensure that LLM always responds in the same format when classifying several texts at once."""
+    Results: List[classifier_batch_item] = Field(..., description="Exactly one classification for each indexed input text, in the order of the indexes.")
+
+
+async def output(chunk:List, on_result:Callable[[int, Any], None]|None=None)-> List[Any]:
+    """Processes a list of LLM requests asynchronously, paced within the OpenAI rate limits. A failed request is returned 
+    as its exception, without discarding the other results."""
+    scheduler = get_scheduler('openai')
+    client, model = get_client('openai', asynchronous=True), get_model('openai')
+    calls = [lambda p=p: async_llm_output(client=client, model=model, prompt_messages=p, schema=classifier_response) for p in chunk]
+    results = await scheduler.gather(calls, tokens=[estimate_tokens(p, maxtokens=2048) for p in chunk], return_exceptions=True, on_result=on_result)
+    return results
+
+
+async def groq_output(chunk:List, on_result:Callable[[int, Any], None]|None=None)-> List[Any]:
+    """Processes a list of input texts via the synchronous Groq Responses API, run in worker threads and 
+    paced within the Groq rate limits. A failed request is returned as its exception, without discarding the other results."""
+    scheduler = get_scheduler('groq')
+    client, model = get_client('groq'), get_model('groq')
+    calls = [lambda x=x: asyncio.to_thread(llm_output, client=client, model=model, sys_msg=classifier_sys_msg, 
+                                           input=x, schema=classifier_response) for x in chunk]
+    results = await scheduler.gather(calls, tokens=[estimate_tokens(classifier_sys_msg + x, maxtokens=2048) for x in chunk], 
+                                     return_exceptions=True, on_result=on_result)
+    return results
+
+
+async def batch_output(texts:List[str], batch_size:int=classifier_batch_size, on_result:Callable[[int, Dict], None]|None=None)-> List[Dict|None]:
+    """Classifies the texts by packing batch_size indexed texts into each OpenAI request, re-queuing any text missing or malformed
+    in its batch response as an individual request. Returns the classification of each text in order, or None if it failed."""
+    scheduler = get_scheduler('openai')
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    prompts = [[{"role": "system", "content": classifier_batch_sys_msg},
+                {"role": "user", "content": "\n".join([f'<incoming-text index="{j + 1}">{text}</incoming-text>' for j, text in enumerate(batch)])}]
+               for batch in batches]
+    maxtokens = min(400*batch_size, 16384)
+    client, model = get_client('openai', asynchronous=True), get_model('openai')
+    calls = [lambda p=p: async_llm_output(client=client, model=model, prompt_messages=p, schema=classifier_batch_response, 
+                                          maxtokens=maxtokens) for p in prompts]
+
+    results = [None]*len(texts)
+    def record(i:int, result:Dict):
+        results[i] = result
+        if on_result is not None:
+            on_result(i, result)
+
+    def parse_batch(b:int, response:Any):
+        parsed = classifier_batch_response.model_validate_json(response.choices[0].message.content)
+        for item in parsed.Results:
+            # Keep the first classification returned for each valid index, ignoring any index outside the batch
+            if 1 <= item.Index <= len(batches[b]) and results[b*batch_size + item.Index - 1] is None:
+                record(b*batch_size + item.Index - 1, item.model_dump(exclude={'Index'}))
+
+    responses = await scheduler.gather(calls, tokens=[estimate_tokens(p, maxtokens=maxtokens) for p in prompts], desc="Processing batches",
+                                       return_exceptions=True, on_result=parse_batch)
+    for b, response in enumerate(responses):
+        if isinstance(response, Exception):
+            logger.warning(f"Failed or malformed response for classifier batch {b}, re-queueing its {len(batches[b])} texts individually: {response}")
+
+    # Re-queue the texts whose index did not come back in the batch response, as individual requests
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) > 0:
+        logger.warning(f"{len(missing)} texts missing from classifier batch responses, re-queued as individual requests")
+        await output(prompt_generator(data_list=[texts[i] for i in missing], sys_msg=classifier_sys_msg),
+                     on_result=lambda k, response: record(missing[k], json.loads(response.choices[0].message.content)))
+    return results
+
+
+def batch_job_classification(to_classify:pd.DataFrame, backend:BatchBackend, conn:sqlite3.Connection, poll_interval:float=60)-> Tuple[List[Dict], str]:
+    """Classifies the articles offline via a batch-job API, resuming the pending batch of an interrupted run if any. Returns the
+    classification of each article in order, or None if it could not be classified, together with the batch ID."""
+    batch_id = pending_batch_job(conn, backend=backend.name, purpose='classifier')
+    if batch_id is None:
+        input_path = os.path.join(WIPfolder, f"classifier_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+        prompt_message_list = prompt_generator(data_list=to_classify['Text'].to_list(), sys_msg=classifier_sys_msg)
+        output_json_structure = {"type": "json_schema", "json_schema": {"name": classifier_response.__name__, "schema": classifier_response.model_json_schema()}}
+        model = get_model('openai')
+        write_batch_file(input_path, [(key, {"model": model, "messages": p, "temperature": 0, "max_completion_tokens": 2048, 
+                                             "response_format": output_json_structure}) 
+                                      for key, p in zip(to_classify['Article_Key'], prompt_message_list)])
+        batch_id = backend.submit(input_path)
+        record_batch_job(conn, batch_id, backend=backend.name, purpose='classifier', input_file=input_path)
+        logger.info(f"Batch job {batch_id} with {len(prompt_message_list)} classification requests submitted to '{backend.name}' batch backend")
+    else:
+        logger.info(f"Resuming pending batch job {batch_id} on '{backend.name}' batch backend")
+
+    # Poll the backend until the batch job is done
+    while True:
+        status = backend.status(batch_id)
+        if status == 'completed':
+            break
+        if status in ('failed', 'expired', 'cancelled'):
+            update_batch_job(conn, batch_id, status)
+            raise MyError(f"Batch job {batch_id} ended with status '{status}'")
+        time.sleep(poll_interval)
+    update_batch_job(conn, batch_id, 'completed')
+
+    # Match the results to the articles by article key, keeping only valid classifications
+    responses = {}
+    for line in backend.results(batch_id):
+        try:
+            if line.get('error') is None and line['response']['status_code'] == 200:
+                content = line['response']['body']['choices'][0]['message']['content']
+                responses[line['custom_id']] = classifier_response.model_validate_json(content).model_dump()
+        except (KeyError, IndexError, TypeError, ValidationError):
+            continue
+    results = [responses.get(key) for key in to_classify['Article_Key']]
+
+    # Classify articles missing from the batch results, or with an invalid result, via individual real-time requests
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) > 0:
+        logger.warning(f"{len(missing)} articles without valid result in batch job {batch_id}, classified via real-time requests instead")
+        single_results = asyncio.run(output(prompt_generator(data_list=[to_classify['Text'].iloc[i] for i in missing], sys_msg=classifier_sys_msg)))
+        for i, response in zip(missing, single_results):
+            if not isinstance(response, Exception):
+                results[i] = json.loads(response.choices[0].message.content)
+    return results, batch_id
+
+
+def prepare_articles(combined_df:pd.DataFrame, conn:sqlite3.Connection)-> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Removes the incoming articles already in the database and groups near-duplicate headlines. Returns the cluster representatives
+    to classify, the near-duplicates reusing their representative's labels, and the recently classified articles."""
+    # Remove any duplicated news records, based on the stable article key
+    combined_df = combined_df.copy()
+    combined_df['Article_Key'] = [article_key(published, source, text) for published, source, text 
+                                  in zip(combined_df['Published_Date'], combined_df['Source'], combined_df['Text'])]
+    combined_df = combined_df.drop_duplicates(subset=['Article_Key'])
+
+    # Make sure the news table, if it exists, has the unique article key, then remove articles already in the database 
+    # via an indexed lookup of only the incoming keys
+    ensure_news_schema(conn)
+    seen_keys = existing_keys(conn, combined_df['Article_Key'].to_list())
+    combined_df = combined_df[~combined_df['Article_Key'].isin(seen_keys)].reset_index(drop=True)
+    recent_df = recent_articles(conn, days=near_duplicate_lookback_days)
+    if len(combined_df) == 0:
+        return combined_df.assign(Cluster_ID=None), combined_df.assign(Cluster_ID=None), recent_df
+
+    # Only one representative per near-duplicate group is passed to the LLM, and its labels and entities are copied to the other members of the group.
+    groups = group_near_duplicates(recent_df['Text'].to_list() + combined_df['Text'].to_list(), threshold=near_duplicate_threshold)
+    # The cluster ID is that of the group's representative, i.e. the most recent of its recently classified articles (ordered newest first), if any,
+    # else the first incoming article
+    cluster_ids = recent_df['Cluster_ID'].to_list() + combined_df['Article_Key'].to_list()
+    combined_df['Cluster_ID'] = [cluster_ids[r] for r in groups[len(recent_df):]]
+    to_classify = combined_df[combined_df['Cluster_ID'] == combined_df['Article_Key']].copy()
+    near_duplicates_df = combined_df[combined_df['Cluster_ID'] != combined_df['Article_Key']]
+    logger.info(f"{len(near_duplicates_df)} near-duplicate articles will reuse the classification of their cluster representative")
+    return to_classify, near_duplicates_df, recent_df
+
+
+def load_prefilter(conn:sqlite3.Connection)-> MergerPrefilter|None:
+    """Loads the local pre-filter saved in the database folder, if enabled, retraining it only if LLM labels arrived since it was saved"""
+    if not prefilter_enabled:
+        return None
+    return train_prefilter(conn, threshold=prefilter_threshold, min_rows=prefilter_min_training_rows, min_merger_recall=prefilter_min_merger_recall,
+                           model_path=os.path.join(dbfolder, prefilter_model_file))
+
+
+async def aload_prefilter(conn:sqlite3.Connection)-> MergerPrefilter|None:
+    """As load_prefilter, with the saved pre-filter loaded or retrained in a worker thread, so that the event loop is not blocked"""
+    if not prefilter_enabled:
+        return None
+    return await atrain_prefilter(conn, threshold=prefilter_threshold, min_rows=prefilter_min_training_rows, 
+                                  min_merger_recall=prefilter_min_merger_recall, model_path=os.path.join(dbfolder, prefilter_model_file))
+
+
+def apply_prefilter(to_classify:pd.DataFrame, prefilter:MergerPrefilter|None)-> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Splits off the articles that the local pre-filter scores as confidently non-merger, so that they skip the LLM. Returns the
+    articles still to be classified by the LLM and the pre-filtered articles."""
+    prefiltered_df = to_classify.iloc[0:0].assign(Reasons=None, Merger_Related=None, Merger_Entities=None)
+    if prefilter is None or len(to_classify) == 0:
+        return to_classify, prefiltered_df
+    probabilities = prefilter.non_merger_probability(to_classify['Text'].to_list())
+    skipped = probabilities >= prefilter.threshold
+    # The pre-filter's decision is recorded in 'Reasons', so that these articles are excluded from later retraining
+    prefiltered_df = to_classify[skipped].assign(Reasons=[prefilter.reason(p) for p in probabilities[skipped]], 
+                                                 Merger_Related='false', Merger_Entities='')
+    logger.info(f"{len(prefiltered_df)} articles skipped the LLM as confidently non-merger according to the local pre-filter")
+    return to_classify[~skipped].copy(), prefiltered_df
+
+
+async def label_articles(to_classify:pd.DataFrame, conn:sqlite3.Connection|None=None)-> List[Dict|None]:
+    """Classifies the articles via real-time LLM requests, journaling each classification as it completes if a connection is given.
+    Returns the classification of each article in order, or None for an article whose request failed."""
+    keys = to_classify['Article_Key'].to_list()
+    journaled = journaled_classifications(conn, keys) if conn is not None else {}
+    results = [journaled.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if len(journaled) > 0:
+        logger.info(f"{len(journaled)} classifications resumed from the classifier journal, {len(pending)} articles still to be classified")
+    if len(pending) == 0:
+        return results
+
+    def record(j:int, result:Dict):
+        results[pending[j]] = result
+        if conn is not None:
+            record_classification(conn, keys[pending[j]], result)
+
+    texts = [to_classify['Text'].iloc[i] for i in pending]
+    if len(texts) <= 100:  # time taken around 4min
+    # Use Groq API
+    # As meta-llama/llama-4-scout-17b-16e-instruct is subject to rate limits: 30(RPM), 1K(RPD), 30K(TPM), 500K(TPD), requests are paced by the shared scheduler
+        await groq_output(texts, on_result=lambda j, item: record(j, json.loads(item.output_text)))
+    # Use OpenAI API
+    # gpt-4o-mini (Tier 1) is subject to rate limits : 500 (RPM), 10K (RPD), 200L (TPM). Requests are paced by the shared scheduler.
+    # Several headlines are packed into each request, unless classifier_batch_size is set to 1
+    elif classifier_batch_size > 1:
+        await batch_output(texts, on_result=record)
+    else:
+        await output(prompt_generator(data_list=texts, sys_msg=classifier_sys_msg), 
+                     on_result=lambda j, item: record(j, json.loads(item.choices[0].message.content)))
+
+    failed = sum(result is None for result in results)
+    if failed > 0:
+        logger.warning(f"{failed} articles could not be classified and are left for the next run")
     return results
 
 
+def finalise_articles(to_classify:pd.DataFrame, responses:List[Dict], prefiltered_df:pd.DataFrame, near_duplicates_df:pd.DataFrame, 
+                      recent_df:pd.DataFrame)-> pd.DataFrame:
+    """Combines the classified and pre-filtered articles, and copies the labels and entities of each cluster representative to its
+    near-duplicates. Articles that could not be classified, and their near-duplicates, are left out."""
+    # Leave out the articles that could not be classified, so that they are picked up again by the next run
+    classified = [response is not None for response in responses]
+    to_classify = to_classify[classified] if len(to_classify) > 0 else to_classify
+    responses = [response for response in responses if response is not None]
+    if len(to_classify) == 0:
+        df_final = to_classify.assign(Reasons=None, Merger_Related=None, Merger_Entities=None)
+    else:
+    # Expand the responses, converted to dict, into columns and combine with the original DataFrame
+        responses = [json.loads(x) if isinstance(x, str) else x for x in responses]
+        expanded_response = pd.DataFrame(responses, index=to_classify.index)
+        df_final = pd.concat([to_classify, expanded_response], axis=1)
+        df_final['Merger_Entities'] = df_final['Merger_Entities'].apply(lambda x: ',| '.join(x) if x is not None and len(x)>1 else '')
+    df_final = pd.concat([df_final, prefiltered_df], ignore_index=True)
+
+    # Copy the labels and entities of each cluster representative to the near-duplicate articles in the cluster
+    cluster_labels = pd.concat([recent_df.drop_duplicates(subset=['Cluster_ID']).set_index('Cluster_ID'), df_final.set_index('Cluster_ID')])
+    near_duplicates_df = near_duplicates_df[near_duplicates_df['Cluster_ID'].isin(cluster_labels.index)]
+    near_duplicates_df = near_duplicates_df.join(cluster_labels[['Reasons', 'Merger_Related', 'Merger_Entities']], on='Cluster_ID')
+    return pd.concat([df_final, near_duplicates_df], ignore_index=True)
+
+
+def save_articles(df_final:pd.DataFrame, conn:sqlite3.Connection, resolver:EntityResolver):
+    """Saves the classified articles to the news table, skipping any article already saved, then clears their classifier journal entries
+    and links their merger parties to canonical entities"""
+    df_final.to_sql(f'{tablename}', con=conn, if_exists='append', index=False, method=insert_or_ignore)
+    ensure_news_schema(conn)
+    clear_classifications(conn, df_final['Article_Key'].to_list())
+    mergers = df_final[df_final['Merger_Entities'].notna() & (df_final['Merger_Entities'] != '')]
+    resolver.link_articles(mergers['Article_Key'].to_list(), mergers['Merger_Entities'].to_list())
+
+
 if __name__ == "__main__":
+    # Select the classification mode. 'realtime' sends requests to the LLM API as the articles are processed, while 'batch' submits 
+    # them as an offline batch job, which is cheaper for large backlogs (e.g. historical backfills, new news sources) but can take hours
+    parser = argparse.ArgumentParser(description="Classify scraped news articles as merger related or not")
+    parser.add_argument("--mode", choices=['realtime', 'batch'], default='realtime', help="Classification mode")
+    parser.add_argument("--batch-backend", choices=['openai', 'local'], default='openai', help="Batch-job API used in batch mode. 'local' writes each batch to local_batches/<batch ID>/input.jsonl in the WIP folder "
+                        "and waits until the results, in the OpenAI Batch output format, are saved as output.jsonl next to it")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between polls of the batch job status in batch mode")
+    args = parser.parse_args()
+    batch_id = None
+    conn = None
+
     dfs = []
     try:
         # 1) Read in the CSV files in the temp_scraped_data folder
@@ -62,61 +332,48 @@ if __name__ == "__main__":
             logger.warning(f"No CSV files found in folder '{tempscrappedfolder}'.")
         else:
             combined_df = pd.concat(dfs, ignore_index=True)
-            # remove any duplicated news records
-            combined_df = combined_df.drop_duplicates(subset=['Published_Date', 'Source', 'Text'])
 
         # 2) Establish connection to database 
             conn = sqlite3.connect(f'{dbfolder}/data.db')
-            cursor = conn.cursor()
 
-        # Check if the database table containing the historical scrapped news data and relevant information exists
-            tablelist = cursor.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
-            if f'{tablename}' not in [table[0] for table in tablelist]:
-                pass
-        # if there is historical data, check and remove potential duplicates by comparing with the historical data
-            else:
-                query = f"SELECT Published_Date, Source, Text FROM {tablename}" # WHERE Extracted_Date = (SELECT MAX(Extracted_Date) FROM {tablename})"
-                past_df = pd.read_sql_query(query, conn)
-                combined_df = combined_df[~((combined_df['Text'].isin(past_df['Text'])) & (combined_df['Source'].isin(past_df['Source'])) & (combined_df['Published_Date'].isin(past_df['Published_Date'])))]
+        # 3) Remove articles already in the database and group near-duplicate headlines, within the incoming articles and against 
+        # recently classified articles
+            to_classify, near_duplicates_df, recent_df = prepare_articles(combined_df, conn)
             
-            if len(combined_df) == 0:  #skip if there is no news article after deduplication
+            if len(to_classify) + len(near_duplicates_df) == 0:  #skip if there is no news article after deduplication
                     logger.warning("No news article to be classified")
             else:
-            # 3) Pass the text in each data point in the combined DataFrame to LLM to decide if the text is related to merger and acquisition, and if so, extract the entities involved
-            
-            # Check the number of data points, for small dataset, to save money, use free version of Groq models (subject to rate limit capped at 30 RPM).
-            # For larger dataset, use OpenAI (subject to rate limit capped at 500 RPM)
-                if len(combined_df) <= 100:  # time taken around 4min
-            # Use Groq API
-            # As meta-llama/llama-4-scout-17b-16e-instruct is subject to rate limits: 30(RPM), 1K(RPD), 30K(TPM), 500K(TPD), need to introduce time delays to ensure wont overshoot limit
-                    rate_limit_per_minute = 30
-                    delay = (60.0 / rate_limit_per_minute)*0.8
-                    combined_df['response'] = combined_df.progress_apply(lambda x: json.loads(llm_output(client=Groq_client, model=Groq_model, 
-                                                        sys_msg=classifier_sys_msg, input=x['Text'], schema=classifier_response, 
-                                                        delay_in_seconds=delay).output_text), axis=1)
-                else:
-            # Use OpenAI API
-            # gpt-4o-mini (Tier 1) is subject to rate limits : 500 (RPM), 10K (RPD), 200L (TPM).                     
-                    prompt_message_list = prompt_generator(data_list=combined_df['Text'].to_list(), sys_msg=classifier_sys_msg)
-                    classifier_results = asyncio.run(main(data_list=prompt_message_list,func=output, chunk_size=10, pause_duration=1)) # set the chunksize and duration to balance speed and the 500RPM openai limit
-                    combined_df['response'] = [item.choices[0].message.content for item in classifier_results]
-            
-            # Expand the 'response' column
-            # convert to dict before expanding the column
-                combined_df['response'] = combined_df['response'].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
-                expanded_response = combined_df['response'].apply(pd.Series)
-            # Combine with the original DataFrame
-                df_final = pd.concat([combined_df.drop(['response'], axis=1), expanded_response], axis=1)
-                df_final['Merger_Entities'] = df_final['Merger_Entities'].apply(lambda x: ',| '.join(x) if x is not None and len(x)>1 else '')
+            # 4) Skip the LLM for representatives that the local pre-filter, retrained on the LLM labels stored so far, scores as confidently non-merger
+                to_classify, prefiltered_df = apply_prefilter(to_classify, load_prefilter(conn) if len(to_classify) > 0 else None)
+
+            # 5) Pass the text in each representative data point to LLM to decide if the text is related to merger and acquisition, and if so, extract the entities involved
+                responses = []
+                if len(to_classify) > 0:
+                    if args.mode == 'batch':
+            # Use the batch-job API, with the batch ID saved so that an interrupted run resumes the same batch job
+                        backend = OpenAIBatchBackend(get_client('openai')) if args.batch_backend == 'openai' else LocalBatchBackend(os.path.join(WIPfolder, 'local_batches'))
+                        responses, batch_id = batch_job_classification(to_classify, backend=backend, conn=conn, poll_interval=args.poll_interval)
+                    else:
+                        responses = asyncio.run(label_articles(to_classify, conn=conn))
+                failed = sum(response is None for response in responses)
+
+            # 6) Combine the classifications, and copy the labels and entities of each cluster representative to the near-duplicate articles in the cluster
+                df_final = finalise_articles(to_classify, responses, prefiltered_df, near_duplicates_df, recent_df)
 
             # Write to CSV for as well as save to database
                 df_final.to_csv(os.path.join(WIPfolder,f'{tablename}.csv'), index=False) 
-                df_final.to_sql(f'{tablename}', con=conn, if_exists='append', index=False)
+                save_articles(df_final, conn, EntityResolver(conn))
+                if batch_id is not None:
+                    update_batch_job(conn, batch_id, 'ingested')
             
             # Update log upon successful execution
-                logger.info(f"{str(len(combined_df))} articles successfully classified")
+                logger.info(f"{str(len(df_final))} articles successfully classified, of which {len(to_classify)} via LLM and {len(prefiltered_df)} via the local pre-filter")
+                logger.info(f"LLM response cache statistics: {llm_cache.stats()}")
             
-            # Once done, remove CSV files from temp_scraped_data folder
+            # Once done, remove CSV files from temp_scraped_data folder, unless some articles could not be classified, in which case the 
+            # CSV files are kept for the next run to classify the remaining articles
+                if failed > 0:
+                    raise MyError(f"{failed} articles could not be classified. Rerun to classify the remaining articles")
             for file_path in directory_path.glob("**/*.csv"):
                 try:
                     os.remove(file_path)
@@ -135,4 +392,4 @@ if __name__ == "__main__":
     # Ensure the database connection is closed
         if conn:
             conn.close()
-            logger.info('SQLite Connection closed')
\ No newline at end of file
+            logger.info('SQLite Connection closed')
@@ -1,9 +1,11 @@
 # Import relevant libraries
-import os
-import pandas as pd
+import os, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from helper_functions.utility import MyError, setup_shared_logger, set_collection_date, tempscrappedfolder, scrapped_from_date
 from pathlib import Path
-from scrapers import ACCC_scrapper
+from scrapers.fetcher import Cancellation
+from scrapers.registry import ScraperPlugin, discover_scrapers
+from typing import Dict, List
 
 # Set up the shared logger
 logger = setup_shared_logger()
@@ -13,17 +15,62 @@ date = set_collection_date(date=scrapped_from_date)
 # Create folder used to temporarily store scrapped data, if it does't exist
 Path(tempscrappedfolder).mkdir(parents=True, exist_ok=True)
 
+
+def _timed_collect(plugin:ScraperPlugin, fromdate:str, folder:str, cancellation:Cancellation)->Dict:
+    """Runs a single scraper plugin and measures the time taken"""
+    start = time.monotonic()
+    rows = plugin.collect(fromdate, folder, cancellation=cancellation)
+    return {'rows': rows, 'seconds': round(time.monotonic() - start, 1)}
+
+
+def run_collectors(plugins:Dict[str, ScraperPlugin], fromdate:str, folder:str)->List[Dict]:
+    """Runs all scraper plugins concurrently, each subject to its own timeout, so that a slow or failing news source
+    does not block or abort the others. A source that times out is cancelled, so that it stops fetching and saves neither its CSV
+    nor its high-water mark. Returns the outcome of each source, i.e. status, row count and duration."""
+    report = []
+    if len(plugins) == 0:
+        return report
+    executor = ThreadPoolExecutor(max_workers=len(plugins))
+    start = time.monotonic()
+    # All sources start together, so each source's deadline is measured from the common start time
+    cancellations = {name: Cancellation(plugin.timeout) for name, plugin in plugins.items()}
+    futures = {name: executor.submit(_timed_collect, plugin, fromdate, folder, cancellations[name]) for name, plugin in plugins.items()}
+    try:
+        for name, future in futures.items():
+            try:
+                try:
+                    result = future.result(timeout=cancellations[name].remaining())
+                except TimeoutError:
+                    # A source that has already started saving its CSV is not cancelled, and is waited for instead
+                    if cancellations[name].cancel():
+                        report.append({'source': name, 'status': 'timed out', 'rows': 0, 'seconds': round(time.monotonic() - start, 1),
+                                       'error': f"exceeded {plugins[name].timeout}s timeout"})
+                        continue
+                    result = future.result()
+                report.append({'source': name, 'status': 'ok', 'rows': result['rows'], 'seconds': result['seconds'], 'error': ''})
+            except (Exception, BaseException) as e:
+                report.append({'source': name, 'status': 'failed', 'rows': 0, 'seconds': round(time.monotonic() - start, 1), 'error': str(e)})
+    finally:
+        # Do not wait for sources that timed out. They stop at their next page request, without saving anything
+        executor.shutdown(wait=False, cancel_futures=True)
+    return report
+
+
 if __name__ == "__main__":
     try:
-        # 1): Extract news articles from relevant sources
-        # a) Extracting news articles from ACCC
-        ACCC_scrapper.get_ACCC_press_release(fromdate = date, folder=tempscrappedfolder)
-        
-        # b) Extracting news articles from X
-        # Scrapper for X to be called here. To augment with scrappers for other sources
-        
+        # 1): Extract news articles from all registered news sources (e.g. ACCC). To add a news source, add a module to the
+        # scrapers folder containing a ScraperPlugin subclass decorated with @register_scraper
+        plugins = discover_scrapers()
+        report = run_collectors(plugins, fromdate=date, folder=tempscrappedfolder)
+
+        # 2): Report the row count and duration for each news source
+        for item in report:
+            if item['status'] == 'ok':
+                logger.info(f"Collector - {item['source']}: {item['rows']} news articles in {item['seconds']}s")
+            else:
+                logger.error(f"Collector - {item['source']} {item['status']} after {item['seconds']}s: {item['error']}")
+
     except MyError as e:
         logger.error(f"{e}")
     except (Exception, BaseException) as e:
         logger.error(f"General error while executing {os.path.basename(__file__)} : {e}")
-
@@ -0,0 +1,191 @@
+# Import relevant libraries
+import argparse, asyncio, contextlib, os, sqlite3, time
+import pandas as pd
+from helper_functions.utility import (MyError, setup_shared_logger, set_collection_date, scrapped_from_date, tablename, dbfolder,
+                                      WIPfolder, llm_cache, research_cache)
+from helper_functions.entities import EntityResolver
+from News_classifier import prepare_articles, aload_prefilter, apply_prefilter, label_articles, finalise_articles, save_articles
+from News_websearch import merger_articles, research_articles, research_frame, save_research
+from pathlib import Path
+from scrapers.fetcher import Cancellation
+from scrapers.registry import ScraperPlugin, discover_scrapers
+from typing import Dict
+
+# Set up the shared logger
+logger = setup_shared_logger()
+
+# Create database folder, if it does't exist
+Path(dbfolder).mkdir(parents=True, exist_ok=True)
+# Create temp folder, if it does't exist
+Path(WIPfolder).mkdir(parents=True, exist_ok=True)
+
+_done = None    # Sentinel put on a queue by a stage once it has no more items for the next stage
+
+
+def _debug_csv(df:pd.DataFrame, name:str, debug:bool):
+    """Appends the stage output to a CSV in the temp folder, if debug output is enabled"""
+    if debug and len(df) > 0:
+        path = os.path.join(WIPfolder, f'{name}.csv')
+        df.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+
+async def scrape_stage(plugin:ScraperPlugin, fromdate:str, out_queue:asyncio.Queue, newest:Dict[str, pd.DataFrame], debug:bool=False):
+    """Scrapes the news source one batch (e.g. listing page) at a time in a worker thread, and puts each batch on the queue as soon as
+    it is scraped. A failing or slow source only stops itself."""
+    start = time.monotonic()
+    rows = 0
+    cancellation = Cancellation(plugin.timeout)
+    batches = plugin.iter_since(fromdate, cancellation=cancellation)
+    try:
+        while True:
+            df = await asyncio.to_thread(next, batches, None)
+            if df is None:
+                break
+            # The newest batch is kept, so that the source's high-water mark is advanced once the whole pipeline has succeeded
+            if plugin.name not in newest:
+                newest[plugin.name] = df
+            rows += len(df)
+            _debug_csv(df, f'{plugin.name}_from_{fromdate}', debug)
+            await out_queue.put(df)    # waits while the classifier is behind, i.e. the queue is full
+            cancellation.check()
+        logger.info(f"Pipeline - {plugin.name}: {rows} news articles scraped in {round(time.monotonic() - start, 1)}s")
+    except Exception as e:
+        # Stop the worker thread from fetching further pages
+        cancellation.cancel()
+        newest.pop(plugin.name, None)
+        logger.error(f"Pipeline - {plugin.name} failed after {rows} news articles and {round(time.monotonic() - start, 1)}s: {e}")
+    finally:
+        # If the pipeline is cancelled, the worker thread may still be advancing the generator, which then cannot be closed
+        with contextlib.suppress(ValueError):
+            batches.close()
+    await out_queue.put(_done)
+
+
+async def classify_stage(in_queue:asyncio.Queue, out_queue:asyncio.Queue, conn:sqlite3.Connection, resolver:EntityResolver, sources:int,
+                         debug:bool=False)->Dict:
+    """Classifies and saves the scraped articles in micro-batches of whatever is waiting on the queue, and puts the merger related
+    articles on the research queue. Returns the article counts."""
+    counts = {'articles': 0, 'llm': 0, 'prefiltered': 0, 'failed': 0, 'merger_related': 0}
+    finished = 0
+    prefilter, prefilter_loaded = None, False
+    while finished < sources:
+        items = [await in_queue.get()]
+        while not in_queue.empty():
+            items.append(in_queue.get_nowait())
+        finished += sum(item is _done for item in items)
+        frames = [item for item in items if item is not _done]
+        if len(frames) == 0:
+            continue
+
+        # Each micro-batch is saved before the next one is prepared, so that near-duplicates are matched against the articles classified earlier in the run
+        to_classify, near_duplicates_df, recent_df = prepare_articles(pd.concat(frames, ignore_index=True), conn)
+        if len(to_classify) + len(near_duplicates_df) == 0:
+            continue
+        # The local pre-filter is loaded once per run, on the first micro-batch needing classification, and only retrained if new LLM labels arrived
+        if len(to_classify) > 0 and not prefilter_loaded:
+            prefilter, prefilter_loaded = await aload_prefilter(conn), True
+        to_classify, prefiltered_df = apply_prefilter(to_classify, prefilter)
+        responses = await label_articles(to_classify, conn=conn) if len(to_classify) > 0 else []
+        df_final = finalise_articles(to_classify, responses, prefiltered_df, near_duplicates_df, recent_df)
+        save_articles(df_final, conn, resolver)
+        _debug_csv(df_final, tablename, debug)
+
+        mergers_df = merger_articles(df_final)
+        counts['articles'] += len(df_final)
+        counts['llm'] += len(to_classify)
+        counts['prefiltered'] += len(prefiltered_df)
+        counts['failed'] += sum(response is None for response in responses)
+        counts['merger_related'] += len(mergers_df)
+        logger.info(f"Pipeline - {len(df_final)} articles classified, of which {len(mergers_df)} merger related")
+        if len(mergers_df) > 0:
+            await out_queue.put(mergers_df)
+    await out_queue.put(_done)
+    return counts
+
+
+async def research_stage(in_queue:asyncio.Queue, conn:sqlite3.Connection, resolver:EntityResolver, debug:bool=False)->int:
+    """Runs the query 1 research for each batch of merger related articles as soon as it is labelled, and saves the results. A failed
+    batch is logged and skipped, as its articles are already saved in the news table. Returns the number of articles researched."""
+    researched = 0
+    while True:
+        df1 = await in_queue.get()
+        if df1 is _done:
+            return researched
+        try:
+            df1 = await research_articles(df1[['Published_Date', 'Source', 'Extracted_Date', 'Text', 'Merger_Related', 'Merger_Entities', 'Article_Key', 
+                                               'Cluster_ID']], resolver=resolver)
+            save_research(df1, conn)
+            _debug_csv(research_frame(df1), f'{tablename}_websearch', debug)
+            researched += len(df1)
+        except Exception as e:
+            logger.error(f"Pipeline - research failed for {len(df1)} merger related articles: {e}")
+
+
+async def run_pipeline(plugins:Dict[str, ScraperPlugin], fromdate:str, conn:sqlite3.Connection, queue_size:int=4, debug:bool=False)->Dict:
+    """Runs the scrapers, the classifier and the query 1 research as concurrent stages connected by bounded queues, so that a fast stage
+    waits for a slower one instead of piling up work in memory. Returns the article counts."""
+    scraped_queue = asyncio.Queue(maxsize=queue_size)
+    labelled_queue = asyncio.Queue(maxsize=queue_size)
+    newest: Dict[str, pd.DataFrame] = {}
+    # One entity resolver for the run, shared by the classifier, which links merger parties, and the research, which caches by entity
+    resolver = EntityResolver(conn)
+
+    async with asyncio.TaskGroup() as tg:
+        for plugin in plugins.values():
+            tg.create_task(scrape_stage(plugin, fromdate, scraped_queue, newest, debug))
+        classify_task = tg.create_task(classify_stage(scraped_queue, labelled_queue, conn, resolver, sources=len(plugins), debug=debug))
+        research_task = tg.create_task(research_stage(labelled_queue, conn, resolver, debug))
+
+    # Record the newest news article of each source as the high-water mark for the next run, only after its articles are saved. If some 
+    # articles could not be classified, the high-water marks are kept, so that the next run scrapes those articles again
+    counts = classify_task.result() | {'researched': research_task.result()}
+    if counts['failed'] > 0:
+        logger.warning(f"Pipeline - {counts['failed']} articles could not be classified, high-water marks not advanced")
+        return counts
+    for name, df in newest.items():
+        plugins[name].record_high_water_mark(df)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape, classify and research news articles in a single streaming pipeline")
+    parser.add_argument("--sources", nargs='*', default=None, help="Names of the news sources to scrape, e.g. ACCC. Defaults to all registered sources")
+    parser.add_argument("--queue-size", type=int, default=4, help="Maximum number of batches waiting between two stages")
+    parser.add_argument("--debug-csv", action='store_true', help="Also write the output of each stage to CSV files in the temp folder")
+    args = parser.parse_args()
+    conn = None
+
+    try:
+        # 1) Select the registered news sources. To add a news source, add a module to the scrapers folder containing a ScraperPlugin
+        # subclass decorated with @register_scraper
+        plugins = discover_scrapers()
+        if args.sources:
+            plugins = {name: plugin for name, plugin in plugins.items() if name in args.sources}
+        if len(plugins) == 0:
+            raise MyError(f"No registered news source among {args.sources}")
+
+        # 2) Establish connection to database
+        conn = sqlite3.connect(f'{dbfolder}/data.db')
+
+        # 3) Run the streaming pipeline
+        counts = asyncio.run(run_pipeline(plugins, fromdate=set_collection_date(date=scrapped_from_date), conn=conn,
+                                          queue_size=args.queue_size, debug=args.debug_csv))
+
+        # Update log upon successful execution
+        logger.info(f"Pipeline - {counts['articles']} articles classified, of which {counts['llm']} via LLM and {counts['prefiltered']} via the local pre-filter. "
+                    f"{counts['merger_related']} merger related, of which {counts['researched']} researched")
+        logger.info(f"LLM response cache statistics: {llm_cache.stats()}")
+        logger.info(f"Merger party research cache statistics: {research_cache.stats()}")
+
+    except MyError as e:
+        logger.error(f"Error while executing {os.path.basename(__file__)}: {e}")
+    except sqlite3.Error as e:
+        logger.error(f"Database connection error while executing {os.path.basename(__file__)}: {e}")
+    except (Exception, BaseException) as e:
+        logger.error(f"General error while executing {os.path.basename(__file__)}: {e}")
+
+    finally:
+    # Ensure the database connection is closed
+        if conn:
+            conn.close()
+            logger.info('SQLite Connection closed')
@@ -1,25 +1,16 @@
 # Import relevant libraries
-import asyncio, json, openai, os, sqlite3
+import asyncio, os, sqlite3
 import pandas as pd
-import time
-from groq import Groq
 from google import genai
 from google.genai import errors
 from google.genai.types import Tool, GoogleSearch, GenerateContentConfig, GenerateContentResponse, GroundingChunk, GroundingSupport
-from helper_functions.utility import (MyError, setup_shared_logger, Groq_model, Groq_client, OAI_model, OAI_client, 
-                                      async_Groq_client, async_OAI_client, async_Perplexity_client, Perplexity_model, 
-                                      async_llm_output, tablename, dbfolder, WIPfolder, Gemini_model, Google_client)
-from helper_functions.prompts import (websearch_raw_sys_msg, query1_structoutput_sys_msg, Query1_user_input, Query2_user_input, 
-                                      Query3_user_input)
-from openai import OpenAI, AsyncOpenAI
-from openai.types.chat import ChatCompletion
-from pathlib import Path
+from helper_functions.utility import (MyError, setup_shared_logger, get_client, get_model,
+                                      async_llm_output, tablename, dbfolder, WIPfolder)
+from helper_functions.scheduler import estimate_tokens, get_scheduler
+from helper_functions.prompts import websearch_raw_sys_msg, query1_structoutput_sys_msg, Query1_user_input
 from pydantic import BaseModel, Field
 from strip_markdown import strip_markdown
-from tqdm.asyncio import tqdm_asyncio
-from tqdm.auto import tqdm
 from typing import Dict, List, Any
-from typing_extensions import Literal
 
 # Set up the shared logger
 logger = setup_shared_logger()
@@ -97,30 +88,20 @@ async def async_gemini_search(client:genai, model:str, query:str, sysmsg:str=web
 
 
 async def websearch(chunk:List)-> List[Any]:
-    """Processes a list of Gemini web search requests asynchronously."""
-    tasks = [async_gemini_search(client=Google_client, model=Gemini_model,query=p) for p in chunk]
-    results = await tqdm_asyncio.gather(*tasks, desc="Processing web search tasks")
+    """Processes a list of Gemini web search requests asynchronously, paced within the Gemini rate limits."""
+    scheduler = get_scheduler('gemini')
+    client, model = get_client('google'), get_model('google')
+    calls = [lambda p=p: async_gemini_search(client=client, model=model,query=p) for p in chunk]
+    results = await scheduler.gather(calls, tokens=[estimate_tokens(p) for p in chunk], desc="Processing web search tasks")
     return results
 
 
 async def structured_output(chunk:List)-> List[Any]:
-    """Processes a list of LLM requests asynchronously."""
-    tasks = [async_llm_output(client=async_OAI_client, model=OAI_model, prompt_messages=p, schema=query1_response) for p in chunk]
-    results = await tqdm_asyncio.gather(*tasks, desc="Processing structured output tasks")
-    return results
-
-
-# main asynchronous function to iterate through the data list in chunks
-async def main(data_list:List, func, chunk_size:int, pause_duration:float)-> List[Any]:
-    """Processes data list in chunks with pauses between chunks."""
-    results = []
-    for i in range(0, len(data_list), chunk_size):
-        chunk = data_list[i:i + chunk_size]
-        chunk_results = await func(chunk)
-        results.extend(chunk_results)
-        if i + chunk_size < len(data_list):  # Don't pause after the last chunk
-            print(f"Pausing for {pause_duration} seconds, after processing chunk[{str(i)}:{str(i+chunk_size)}]")
-            await asyncio.sleep(pause_duration)
+    """Processes a list of LLM requests asynchronously, paced within the OpenAI rate limits."""
+    scheduler = get_scheduler('openai')
+    client, model = get_client('openai', asynchronous=True), get_model('openai')
+    calls = [lambda p=p: async_llm_output(client=client, model=model, prompt_messages=p, schema=query1_response) for p in chunk]
+    results = await scheduler.gather(calls, tokens=[estimate_tokens(p, maxtokens=2048) for p in chunk], desc="Processing structured output tasks")
     return results
 
 
@@ -178,15 +159,15 @@ if __name__ == "__main__":
                 logger.info(f"List of {len(query1_list)} query 1 prompt messages successfully generated.")
             
                 #3b) Execute Google search for query 1 asynchronously, then parse the processed Google responses via another LLM in order to produce structured outputs with citations
-                # Google API @ Tier 1 are subject to rate limit of 1K RPM
-                query1_websearch_results = asyncio.run(main(data_list=query1_list, func=websearch, chunk_size=20, pause_duration=1))
+                # Google API @ Tier 1 are subject to rate limit of 1K RPM, which is enforced by the shared scheduler
+                query1_websearch_results = asyncio.run(websearch(query1_list))
                 logger.info("Web search for query 1 successfully executed. Preparing to parse Google responses via another LLM.")
                 # Processing the Google search responses
                 query1_websearch_results_processed = [process_search(response) for response in query1_websearch_results]
 
                 query1_struct_prompt_message_list = prompt_generator(data_list=[strip_markdown(item['text_with_citations']) for item in query1_websearch_results_processed], sys_msg=query1_structoutput_sys_msg)
                 # gpt-4o-mini (Tier 1) is subject to rate limits : 500 (RPM), 10K (RPD), 200L (TPM).
-                struct_query1_websearch_results = asyncio.run(main(data_list=query1_struct_prompt_message_list,func=structured_output, chunk_size=10, pause_duration=1))  # can use larger chunks and shorter duration subject to limit of 500 RPM
+                struct_query1_websearch_results = asyncio.run(structured_output(query1_struct_prompt_message_list))  # paced within the OpenAI limit of 500 RPM
                 logger.info("Web search with structured output for query 1 successfully executed")
                 
                 #3c)  Combine raw Google search response with the structured output, then append to dataframe
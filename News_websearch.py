@@ -1,22 +1,19 @@
 # Import relevant libraries
-import asyncio, json, openai, os, sqlite3
+import asyncio, json, openai, os, re, sqlite3
 import pandas as pd
-import time
-from groq import Groq
-from helper_functions.utility import (MyError, setup_shared_logger, Groq_model, Groq_client, OAI_model, OAI_client, 
-                                      async_Groq_client, async_OAI_client, async_Perplexity_client, Perplexity_model, 
-                                      async_llm_output, tablename, dbfolder, WIPfolder)
-from helper_functions.prompts import (websearch_raw_sys_msg, query1_structoutput_sys_msg, Query1_user_input, Query2_user_input, 
-                                      Query3_user_input)
-from openai import OpenAI, AsyncOpenAI
+from dataclasses import asdict
+from helper_functions.utility import (MyError, setup_shared_logger, get_client, get_model,
+                                      async_llm_output, tablename, dbfolder, WIPfolder, llm_cache, research_cache,
+                                      make_cache_key)
+from helper_functions.entities import EntityResolver, normalise_entity, split_entities
+from helper_functions.research_store import ResearchResult, save_research_runs
+from helper_functions.scheduler import estimate_tokens, get_scheduler
+from helper_functions.prompts import websearch_raw_sys_msg, query1_structoutput_sys_msg, Query1_user_input
+from openai import OpenAI
 from openai.types.chat import ChatCompletion
-from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from strip_markdown import strip_markdown
-from tqdm.asyncio import tqdm_asyncio
-from tqdm.auto import tqdm
 from typing import Dict, List, Any
-from typing_extensions import Literal
 
 # Set up the shared logger
 logger = setup_shared_logger()
@@ -81,28 +78,19 @@ async def async_perplexity_search(client:OpenAI, model:str, prompt_messages:List
             raise MyError(f"async_Perplexity_search function error: {e}, while processing text '{prompt_messages[1]['content']}'")
 
 async def websearch(chunk:List)-> List[Any]:
-    """Processes a list of Perplexity requests asynchronously."""
-    tasks = [async_perplexity_search(client=async_Perplexity_client, model=Perplexity_model, prompt_messages=p, schema=None) for p in chunk]
-    results = await tqdm_asyncio.gather(*tasks, desc="Processing tasks")
+    """Processes a list of Perplexity requests asynchronously, paced within the Perplexity rate limits."""
+    scheduler = get_scheduler('perplexity')
+    client, model = get_client('perplexity', asynchronous=True), get_model('perplexity')
+    calls = [lambda p=p: async_perplexity_search(client=client, model=model, prompt_messages=p, schema=None) for p in chunk]
+    results = await scheduler.gather(calls, tokens=[estimate_tokens(p, maxtokens=4096) for p in chunk])
     return results
 
 async def structured_output(chunk:List)-> List[Any]:
-    """Processes a list of LLM requests asynchronously."""
-    tasks = [async_llm_output(client=async_OAI_client, model=OAI_model, prompt_messages=p, schema=query1_response) for p in chunk]
-    results = await tqdm_asyncio.gather(*tasks, desc="Processing tasks")
-    return results
-
-# main asynchronous function to iterate through the data list in chunks
-async def main(data_list:List, func, chunk_size:int, pause_duration:float)-> List[Any]:
-    """Processes data list in chunks with pauses between chunks."""
-    results = []
-    for i in range(0, len(data_list), chunk_size):
-        chunk = data_list[i:i + chunk_size]
-        chunk_results = await func(chunk)
-        results.extend(chunk_results)
-        if i + chunk_size < len(data_list):  # Don't pause after the last chunk
-            print(f"Pausing for {pause_duration} seconds, after processing chunk[{str(i)}:{str(i+chunk_size)}]")
-            await asyncio.sleep(pause_duration)
+    """Processes a list of LLM requests asynchronously, paced within the OpenAI rate limits."""
+    scheduler = get_scheduler('openai')
+    client, model = get_client('openai', asynchronous=True), get_model('openai')
+    calls = [lambda p=p: async_llm_output(client=client, model=model, prompt_messages=p, schema=query1_response) for p in chunk]
+    results = await scheduler.gather(calls, tokens=[estimate_tokens(p, maxtokens=2048) for p in chunk])
     return results
 
 def prompt_generator(data_list:List, sys_msg:str)->List[List[Dict]]:
@@ -112,9 +100,106 @@ def prompt_generator(data_list:List, sys_msg:str)->List[List[Dict]]:
         prompt_message_list.append([{"role": "system", "content": f"{sys_msg}"},{"role": "user", "content": f"<incoming-text>{item}</incoming-text>"}])
     return prompt_message_list
 
+def merger_articles(df:pd.DataFrame)->pd.DataFrame:
+    """Filters for merger related news articles with identified entities"""
+    return df[(df['Merger_Related']=='true') & (df['Merger_Entities'].fillna('')!='')].reset_index(drop=True)
+
+def assemble_query1(records:List[Dict])->ResearchResult:
+    """Assembles the cached research records of an article's merger parties into its query 1 result, renumbering the citations so
+    that each still points to the right url in the combined citation list."""
+    raw_responses, citations, findings = [], [], []
+    offsets = {}
+    for record in records:
+        if record['search_id'] not in offsets:
+            offsets[record['search_id']] = len(citations)
+            raw_responses.append(record['raw_response'])
+            citations.extend(record['citations'])
+        offset = offsets[record['search_id']]
+        party = record['party']
+        findings.append({'subject': party['merger_party'], 
+                         'explanation': re.sub(r"\[(\d+)\]", lambda m: f"[{int(m.group(1)) + offset}]", party['explanation']),
+                         'answer': party['goods_services_sold_in_Singapore']})
+    return ResearchResult(raw_text="\n\n".join(raw_responses), citations=citations, findings=findings)
+
+async def research_articles(df1:pd.DataFrame, resolver:EntityResolver|None=None)->pd.DataFrame:
+    """Runs the query 1 web search once per near-duplicate cluster of the merger related articles, reusing the cached research of each
+    merger party, and returns the articles with the 'Query1' column added."""
+    # The research of each merger party is cached under its canonical entity name, if a resolver is given, so that name variants share it
+    party_key = resolver.canonical_key if resolver is not None else normalise_entity
+    #a) Extract the corresponding news source - merger parties pairs, and look up the cached research of each merger party
+    research_df = df1.drop_duplicates(subset=['Cluster_ID'])
+    article_parties = [split_entities(entities) for entities in research_df['Merger_Entities']]
+    records = {}
+    for party in {party_key(party) for parties in article_parties for party in parties}:
+        cached = research_cache.get(make_cache_key(query='Query1', party=party))
+        if cached is not None:
+            records[party] = json.loads(cached)
+
+    #b) Generate query 1 user prompt messages for the merger parties of each article still to be researched, using the query 1 text supplied
+    # by user. A party shared by several articles is only searched once.
+    searches = []
+    scheduled = set(records)
+    for source, parties in zip(research_df['Source'], article_parties):
+        missing = [party for party in parties if party_key(party) not in scheduled]
+        if len(missing) > 0:
+            scheduled.update(party_key(party) for party in missing)
+            searches.append((source, missing))
+    logger.info(f"Query 1 research of {len(records)} merger parties served from cache, {len(scheduled) - len(records)} merger parties to be searched")
+
+    if len(searches) > 0:
+        query1_list = []
+        for source, parties in searches:
+            query1_list.append(f"The following parties ({',| '.join(parties)}) are involved in the same merger case handled by {source}. {Query1_user_input} Avoid markdown in reply.")
+        
+        query1_prompt_message_list = prompt_generator(data_list=query1_list, sys_msg=websearch_raw_sys_msg)
+        logger.info(f"List of {len(query1_prompt_message_list)} query 1 prompt messages successfully generated.")
+
+        #c) Execute Perplexity search for query 1 asynchronously, then parse the Perplexity responses via another LLM in order to produce structured outputs with citations
+        # Perplexity API @ Tier 0 and Tier 1 are subject to rate limit of 50 RPM, which is enforced by the shared scheduler. Once the 
+        # Perplexity Tier is upgraded, update the limits in helper_functions.scheduler.provider_limits
+        query1_websearch_results = await websearch(query1_prompt_message_list)
+        logger.info("Web search for query 1 successfully executed. Preparing to parse Perplexity responses via another LLM.")
+        
+        query1_struct_prompt_message_list = prompt_generator(data_list=[strip_markdown(item.choices[0].message.content) for item in query1_websearch_results], sys_msg=query1_structoutput_sys_msg)
+        struct_query1_websearch_results = await structured_output(query1_struct_prompt_message_list)  # paced within the OpenAI limit of 500 RPM
+        logger.info("Web search with structured output for query 1 successfully executed")
+
+        #d) Cache the research record of each searched merger party, matched to the requested party by normalised name, else by position
+        for (source, parties), x, y in zip(searches, query1_websearch_results, struct_query1_websearch_results):
+            search_id = make_cache_key(raw_response=x.choices[0].message.content)
+            try:
+                found = query1_response.model_validate_json(y.choices[0].message.content).response
+            except ValidationError as e:
+                logger.warning(f"Malformed query 1 structured output for merger parties {parties}, not cached: {e}")
+                continue
+            by_name = {party_key(item.merger_party): item for item in found}
+            for i, party in enumerate(parties):
+                item = by_name.get(party_key(party), found[i] if len(found) == len(parties) else None)
+                if item is None:
+                    logger.warning(f"No query 1 research returned for merger party '{party}'")
+                    continue
+                record = {'search_id': search_id, 'raw_response': x.choices[0].message.content, 'citations': x.citations, 'party': item.model_dump()}
+                records[party_key(party)] = record
+                research_cache.set(make_cache_key(query='Query1', party=party_key(party)), json.dumps(record))
+
+    #e) Assemble the query 1 answer of each article from the research records of its merger parties, then append to dataframe
+    query1_combined_results = [assemble_query1([records[party_key(party)] for party in parties if party_key(party) in records]) 
+                               for parties in article_parties]
+    return df1.assign(Query1=df1['Cluster_ID'].map(dict(zip(research_df['Cluster_ID'], query1_combined_results))))
+
+def save_research(df1:pd.DataFrame, conn:sqlite3.Connection):
+    """Saves the query 1 research results to the research tables, as a new research run for each article"""
+    save_research_runs(conn, 'Query1', [(key, result) for key, result in zip(df1['Article_Key'], df1['Query1']) 
+                                         if isinstance(result, ResearchResult)])
+
+def research_frame(df1:pd.DataFrame)->pd.DataFrame:
+    """Research results with the query 1 result as JSON, e.g. for CSV output"""
+    return df1.assign(Query1=df1['Query1'].apply(lambda result: json.dumps(asdict(result)) if isinstance(result, ResearchResult) else result))
+
 tempfilepath = os.path.join(WIPfolder,f'{tablename}_websearch.csv')
 
 if __name__ == "__main__":
+    conn = None
     try:
         #0) Establish connection to database
         conn = sqlite3.connect(f'{dbfolder}/data.db')
@@ -124,45 +209,24 @@ if __name__ == "__main__":
         if os.path.exists(tempfilepath):
             df1 = pd.read_csv(tempfilepath).fillna('')
         else:
-            sqlquery = f"SELECT Published_Date, Source, Extracted_Date, Text, Merger_Related, Merger_Entities FROM {tablename} WHERE Extracted_Date = (SELECT MAX(Extracted_Date) FROM {tablename})"    
+            sqlquery = f"SELECT Published_Date, Source, Extracted_Date, Text, Merger_Related, Merger_Entities, Article_Key, Cluster_ID FROM {tablename} WHERE Extracted_Date = (SELECT MAX(Extracted_Date) FROM {tablename})"    
             df = pd.read_sql_query(sqlquery, con=conn)
-            df1 = df[(df['Merger_Related']=='true') & (df['Merger_Entities']!='')].reset_index(inplace=False).drop('index', axis=1)
+            df1 = merger_articles(df)
         
         if len(df1) == 0:  #skip if there is no merger related news article
             logger.warning("No new merger related article to conduct web search for")
         else:
-        #2) Extract the corresponding news source - entities pairs
-            org_entities = df1[['Source','Merger_Entities']].apply(tuple, axis=1).to_list()
-
             if 'Query1' in df1.columns:
                 pass
             else:
-        #3a) Generate query 1 user prompt messages for each of the identified merger-related news , using the query 1 text supplied by user
-                query1_list = []
-                
-                for item in org_entities:
-                    query1_list.append(f"The following parties ({item[1]}) are involved in the same merger case handled by {item[0]}. {Query1_user_input} Avoid markdown in reply.")
-                
-                query1_prompt_message_list = prompt_generator(data_list=query1_list, sys_msg=websearch_raw_sys_msg)
-                logger.info(f"List of {len(query1_prompt_message_list)} query 1 prompt messages successfully generated.")
-            
-                #3b) Execute Perplexity search for query 1 asynchronously, then parse the Perplexity responses via another LLM in order to produce structured outputs with citations
-                # As Perplexity API @ Tier 0 and Tier 1 are subject to rate limit of 50 RPM, need to keep chunk_size small, once there is accumulated expenditure and 
-                # Perplexity Tier is upgraded, can increase chunk size and do away with pauses
-                query1_websearch_results = asyncio.run(main(data_list=query1_prompt_message_list, func=websearch, chunk_size=6, pause_duration=1))
-                logger.info("Web search for query 1 successfully executed. Preparing to parse Perplexity responses via another LLM.")
-                
-                query1_struct_prompt_message_list = prompt_generator(data_list=[strip_markdown(item.choices[0].message.content) for item in query1_websearch_results], sys_msg=query1_structoutput_sys_msg)
-                struct_query1_websearch_results = asyncio.run(main(data_list=query1_struct_prompt_message_list,func=structured_output, chunk_size=10, pause_duration=1))  # can use larger chunks and shorter duration subject to limit of 500 RPM
-                logger.info("Web search with structured output for query 1 successfully executed")
-                
-                #3c)  Combine raw Perplexity search response with the structured output, then append to dataframe
-                query1_combined_results = [str((x.choices[0].message.content, x.citations, y.choices[0].message.content)) for x, y in zip(query1_websearch_results, struct_query1_websearch_results)]
-                df1['Query1'] = query1_combined_results
-
-                #3d) Write to temporary CSV and also to database.
-                df1.to_csv(tempfilepath, index=False)
-                df1.drop(['Merger_Related', 'Merger_Entities'], axis=1).to_sql(f'{tablename}_websearch_query1', con=conn, if_exists='append', index=False)
+        #2) Run the query 1 web search, with structured outputs and citations, for one article per near-duplicate cluster
+                df1 = asyncio.run(research_articles(df1, resolver=EntityResolver(conn)))
+                logger.info(f"LLM response cache statistics: {llm_cache.stats()}")
+                logger.info(f"Merger party research cache statistics: {research_cache.stats()}")
+
+        #3) Write to temporary CSV and also to database.
+                research_frame(df1).to_csv(tempfilepath, index=False)
+                save_research(df1, conn)
 
         #4a) Carry on for the next few questions, 2, 3, 4
 
@@ -0,0 +1,164 @@
+"""Times ACCC news centre backfills against a local HTTP fixture server, comparing the previous sequential requests.get loop
+with the pooled, conditional, prefetching PageFetcher (cold and with all pages answered 304), and checks that a 304 on the first
+page still returns media releases above the high-water mark. No network access is needed.
+Run from the repository root: python benchmarks/accc_fetch.py [--latency 0.2] [--pages 8]"""
+# Import relevant libraries
+import argparse, hashlib, os, statistics, sys, tempfile, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import requests
+import scrapers.ACCC_scrapper as ACCC_scrapper
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scrapers.ACCC_scrapper import parse_ACCC_listing
+from scrapers.fetcher import PageFetcher
+from scrapers.scraper_state import item_fingerprint
+from urllib.parse import parse_qs, urlparse
+
+items_per_page = 25
+newest = date(2025, 7, 1)
+
+
+def listing_html(start:int, count:int)->str:
+    """News centre page in the ACCC markup, with one listing per day going back from the newest date"""
+    cards = []
+    for k in range(start, start + count):
+        published = newest - timedelta(days=k)
+        cards.append(f"""<div class="accc-date-card__header col-12 col-md-2"><span class="accc-date-card--publish--day">{published:%d}</span>
+            <span class="accc-date-card--publish--month">{published:%b}</span><span class="accc-date-card--publish--year">{published:%Y}</span></div>
+            <div class="accc-date-card__body col-12 col-md-10"><div class="field--name-node-title">Media release {k}</div>
+            <div class="field--name-field-acccgov-summary">{'Summary of the media release. ' * 20}</div></div>""")
+    return f"<html><body>{''.join(cards)}{'<p>navigation and footer</p>' * 200}</body></html>"
+
+
+def fixture_server(pages:int, latency:float)->ThreadingHTTPServer:
+    """Keep-alive HTTP/1.1 server for the news centre pages, answering 304 when If-None-Match matches the page's ETag"""
+    bodies = {i: listing_html(i*items_per_page, items_per_page if i < pages else 0).encode('utf-8') for i in range(pages + 1)}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            page = int(parse_qs(urlparse(self.path).query).get('page', ['0'])[0])
+            body = bodies.get(page, bodies[pages])
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def local_fetcher(base_url:str, database:str, min_interval:float|None=None, max_per_host:int|None=None):
+    """PageFetcher class for the scraper, sending requests for www.accc.gov.au to the fixture server, with the PageFetcher
+    defaults unless the spacing or per-host cap is given"""
+    overrides = {name: value for name, value in (('min_interval', min_interval), ('max_per_host', max_per_host)) if value is not None}
+
+    class LocalFetcher(PageFetcher):
+        def __init__(self, headers=None, cancellation=None):
+            super().__init__(headers=headers, database=database, cancellation=cancellation, **overrides)
+
+        def fetch(self, url:str):
+            return super().fetch(url.replace("https://www.accc.gov.au", base_url))
+    return LocalFetcher
+
+
+def sequential_backfill(base_url:str, fromdate:str)->int:
+    """The scraper's previous paging loop: one requests.get per page, without a session, in order"""
+    listing, i = [], 0
+    while True:
+        response = requests.get(f"{base_url}/news-centre?type=accc_news&layout=full_width&view_args=accc_news&items_per_page=25&page={i}")
+        response.raise_for_status()
+        news_extract = parse_ACCC_listing(response.text)
+        if len(news_extract) == 0:
+            break
+        listing += [item for item in news_extract if datetime.strptime(item['Published_Date'], '%d %b %Y') >= datetime.strptime(fromdate, '%d %b %Y')]
+        if datetime.strptime(news_extract[-1]['Published_Date'], '%d %b %Y') < datetime.strptime(fromdate, '%d %b %Y'):
+            break
+        i += 1
+    return len(listing)
+
+
+def timed(function, repeats:int):
+    timings, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fixture server waits before each response")
+    parser.add_argument("--pages", type=int, default=8, help="Number of news centre pages with listings")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs of each backfill")
+    parser.add_argument("--min-interval", type=float, help="PageFetcher spacing between requests to the same host (default: PageFetcher's)")
+    parser.add_argument("--max-per-host", type=int, help="PageFetcher cap on concurrent requests to the same host (default: PageFetcher's)")
+    args = parser.parse_args()
+
+    server = fixture_server(args.pages, args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # Backfill down to the last listing on the last page, so every page is fetched
+    fromdate = (newest - timedelta(days=args.pages*items_per_page - 1)).strftime('%d %b %Y')
+    expected = args.pages*items_per_page
+    failures = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        # 1) Backfill with the previous sequential loop, and with the fetcher with an empty and then a primed page cache
+        seconds, count = timed(lambda: sequential_backfill(base_url, fromdate), args.repeats)
+        print(f"Sequential requests.get:        {seconds:.2f} s for {count} media releases")
+        results = {}
+        for label, primed in (("cold", False), ("all pages 304", True)):
+            def backfill():
+                database = os.path.join(folder, f'{label}.db')
+                if not primed and os.path.exists(database):
+                    os.remove(database)
+                ACCC_scrapper.PageFetcher = local_fetcher(base_url, database, args.min_interval, args.max_per_host)
+                return len(ACCC_scrapper.fetch_ACCC_press_release(fromdate, incremental=False))
+            if primed:
+                backfill()
+            seconds, results[label] = timed(backfill, args.repeats)
+            print(f"PageFetcher ({label}):{' '*(18 - len(label))}{seconds:.2f} s for {results[label]} media releases")
+        if count != expected or any(result != expected for result in results.values()):
+            failures.append(f"a backfill did not return the {expected} media releases")
+
+        # 2) The first page was fetched before, but the high-water mark was not advanced (e.g. the run failed before writing)
+        database = os.path.join(folder, 'missed.db')
+        ACCC_scrapper.PageFetcher = local_fetcher(base_url, database, args.min_interval, args.max_per_host)
+        primer = ACCC_scrapper.PageFetcher()
+        primer.fetch("https://www.accc.gov.au/news-centre?type=accc_news&layout=full_width&view_args=accc_news&items_per_page=25&page=0")
+        primer.close()
+        missed = 5
+        mark = parse_ACCC_listing(listing_html(missed, 1))[0]
+        published = datetime.strptime(mark['Published_Date'], '%d %b %Y').strftime("%Y-%m-%d")
+        ACCC_scrapper.get_high_water_mark = lambda source: (published, item_fingerprint(published, mark['Text']))
+        count = len(ACCC_scrapper.fetch_ACCC_press_release(fromdate))
+        print(f"Incremental run with page 0 answered 304: {count} of {missed} media releases above the high-water mark")
+        if count != missed:
+            failures.append("media releases above the high-water mark were skipped after a 304")
+
+    server.shutdown()
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Checks that a batch classification interrupted while its batch job is pending resumes the same batch job instead of submitting
+a new one, and that its results are ingested into the news table. Uses the file-based LocalBatchBackend with a local responder,
+in a temporary folder, so no API key or network is needed.
+Run from the repository root: python benchmarks/batch_resume.py [--articles 50]"""
+# Import relevant libraries
+import argparse, json, os, sqlite3, sys, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import News_classifier
+from helper_functions.batch_jobs import LocalBatchBackend, pending_batch_job, update_batch_job
+from helper_functions.database import article_key
+from helper_functions.entities import EntityResolver
+
+
+class Interrupted(Exception):
+    pass
+
+
+def responder(body:dict)->dict:
+    """Chat completion response body classifying the headline as merger related if it mentions an acquisition"""
+    text = body['messages'][-1]['content'].removeprefix("<incoming-text>").removesuffix("</incoming-text>")
+    merger = 'acquire' in text
+    content = {"Reasons": "Synthetic classification", "Merger_Related": 'true' if merger else 'false',
+               "Merger_Entities": text.split(" to acquire ")[:2] if merger else []}
+    return {"choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(content)}}]}
+
+
+def interrupting(backend:LocalBatchBackend)->LocalBatchBackend:
+    """Wraps the backend so that the first status poll interrupts the run, as if the process were stopped while the batch is pending"""
+    def status(batch_id:str)->str:
+        raise Interrupted(batch_id)
+    backend.status = status
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--articles", type=int, default=50, help="Number of synthetic articles to classify")
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        News_classifier.WIPfolder = folder
+        batch_folder = os.path.join(folder, 'local_batches')
+        conn = sqlite3.connect(os.path.join(folder, 'data.db'))
+        # Distinct company names, so that the articles are not grouped as near-duplicates and each is a request in the batch
+        texts = [f"Acme{i} Ltd to acquire Beta{i} Pte Ltd" if i % 5 == 0 else f"Shares of Gamma{i} rise after quarterly results" for i in range(args.articles)]
+        df = pd.DataFrame({'Published_Date': '2025-07-01', 'Source': 'Synthetic', 'Extracted_Date': '2025-07-01', 'Text': texts})
+        df['Article_Key'] = [article_key(*row) for row in zip(df['Published_Date'], df['Source'], df['Text'])]
+        to_classify, near_duplicates_df, recent_df = News_classifier.prepare_articles(df, conn)
+
+        # 1) Submit the batch job, then interrupt the run while it is pending
+        try:
+            News_classifier.batch_job_classification(to_classify, backend=interrupting(LocalBatchBackend(batch_folder)), conn=conn, poll_interval=0)
+            failures.append("the interrupted run did not stop")
+        except Interrupted as e:
+            submitted = str(e)
+        print(f"Submitted batch job {submitted} with {len(to_classify)} requests, then interrupted")
+        if pending_batch_job(conn, backend='local', purpose='classifier') != submitted:
+            failures.append("the submitted batch job was not recorded as pending")
+
+        # 2) Resume: the pending batch job is polled again, and answered by the responder
+        responses, batch_id = News_classifier.batch_job_classification(to_classify, backend=LocalBatchBackend(batch_folder, responder=responder),
+                                                                       conn=conn, poll_interval=0)
+        print(f"Resumed batch job {batch_id}, {sum(response is not None for response in responses)} of {len(responses)} classifications")
+        if batch_id != submitted or len(os.listdir(batch_folder)) != 1:
+            failures.append("the resumed run submitted a new batch job")
+        if any(response is None for response in responses):
+            failures.append("some articles were not classified from the batch results")
+
+        # 3) Ingest the results into the news table, and mark the batch job as ingested
+        df_final = News_classifier.finalise_articles(to_classify, responses, to_classify.iloc[0:0], near_duplicates_df, recent_df)
+        News_classifier.save_articles(df_final, conn, EntityResolver(conn))
+        update_batch_job(conn, batch_id, 'ingested')
+        saved, mergers = conn.execute("SELECT COUNT(*), SUM(Merger_Related = 'true') FROM news").fetchone()
+        print(f"Ingested {saved} articles, of which {mergers} merger related")
+        if saved != len(df_final) or mergers != sum('acquire' in text for text in texts):
+            failures.append("the batch results were not saved to the news table")
+        if pending_batch_job(conn, backend='local', purpose='classifier') is not None:
+            failures.append("the ingested batch job is still pending")
+        conn.close()
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
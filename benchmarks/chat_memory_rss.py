@@ -0,0 +1,101 @@
+"""Measures the peak RSS growth of the chat agent over many conversations, each with one web search turn, with its chat memory in
+SQLiteCheckpointer and, for comparison, in langgraph's in-process MemorySaver. Each checkpointer runs in a fresh interpreter.
+The LLM, guard and Tavily client are the local stubs of chat_search_turn.py, so no API key or network is needed.
+Run from the repository root: python benchmarks/chat_memory_rss.py [--threads 600] [--approx-tokens]"""
+# Import relevant libraries
+import argparse, json, os, random, resource, sqlite3, subprocess, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_search_turn import StubChatModel, StubTavily, query, synthetic_page
+from langchain_core.messages import AIMessage, ToolMessage
+
+
+class SearchingChatModel(StubChatModel):
+    """Asks for a web search on every new question, and answers once the search results are in"""
+    responses: list = []
+
+    def _next(self, messages):
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content="Acme is acquiring Beta, which sells industrial valves in Singapore [1].")
+        return AIMessage(content="", tool_calls=[{"name": "web_search", "args": {"query": query}, "id": f"call_{time.monotonic_ns()}"}])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.responses.append(self._next(messages))
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.responses.append(self._next(messages))
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+
+def run(checkpointer:str, threads:int, approx_tokens:bool)->dict:
+    """Runs one search turn in each of the given number of conversations, and returns the peak RSS growth in MB"""
+    import Chat_agent
+    import helper_functions.passages as passages
+    from helper_functions.cache import MemoryCache, SQLiteCache
+    from langgraph.checkpoint.memory import MemorySaver
+    if approx_tokens:
+        approx = lambda text: int(len(text.split())*1.3)
+        passages.count_tokens = approx
+        Chat_agent.count_tokens = approx
+
+    rng = random.Random(1)
+    pages = [synthetic_page(rng) for _ in range(3)]
+    llm = SearchingChatModel()
+    folder = tempfile.mkdtemp()
+    # Every search is a cache miss, as in conversations about different news
+    Chat_agent.web_search_cache = SQLiteCache(os.path.join(folder, 'cache.db'), table='web_search', ttl_seconds=0)
+    Chat_agent.web_search_memory_cache = MemoryCache(max_entries=1, ttl_seconds=0)
+    Chat_agent.get_client = lambda provider, asynchronous=False: StubTavily(pages)
+    Chat_agent.check_for_malicious_intent = lambda **kwargs: "N"
+    Chat_agent.llm_with_tools = lambda: llm
+    if checkpointer == 'memory':
+        Chat_agent.SQLiteCheckpointer = lambda *args, **kwargs: MemorySaver()
+    memory_path = os.path.join(folder, 'chat_memory.db')
+    graph = Chat_agent.build_graph(memory_path)
+
+    # A first conversation, so that the imports and first-use allocations are not counted
+    turn = Chat_agent.ChatTurn(query, "warm-up", graph)
+    "".join(turn.stream())
+    turn.finish()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for i in range(threads):
+        turn = Chat_agent.ChatTurn(query, f"user-{i}", graph)
+        "".join(turn.stream())
+        turn.finish()
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stored = None
+    if checkpointer == 'sqlite':
+        conn = sqlite3.connect(memory_path)
+        stored = conn.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+        conn.close()
+    # ru_maxrss is in kilobytes on Linux
+    return {"rss_growth_mb": (peak - baseline)/1024, "seconds": seconds, "stored_threads": stored}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=600, help="Number of conversations, each with one web search turn")
+    parser.add_argument("--approx-tokens", action="store_true",
+                        help="Count tokens as 1.3 per word, for environments where the tiktoken encoding cannot be downloaded")
+    parser.add_argument("--checkpointer", choices=['sqlite', 'memory'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.checkpointer:
+        print(json.dumps(run(args.checkpointer, args.threads, args.approx_tokens)))
+        return
+
+    for checkpointer in ('memory', 'sqlite'):
+        command = [sys.executable, os.path.abspath(__file__), "--checkpointer", checkpointer, "--threads", str(args.threads)]
+        completed = subprocess.run(command + (["--approx-tokens"] if args.approx_tokens else []), capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr)
+            sys.exit(1)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{'SQLiteCheckpointer' if checkpointer == 'sqlite' else 'MemorySaver':<18} peak RSS +{result['rss_growth_mb']:.0f} MB "
+              f"over {args.threads} conversations in {result['seconds']:.1f} s"
+              + (f", {result['stored_threads']} conversations stored" if result['stored_threads'] is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Checks that a chat turn with a web search stays below the summarisation threshold once checkpointed, and times the BM25
+compaction of the search results. The LLM, guard and Tavily client are replaced by local stubs, so no API key or network is
+needed. Run from the repository root: python benchmarks/chat_search_turn.py [--approx-tokens]"""
+# Import relevant libraries
+import argparse, json, os, random, statistics, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Chat_agent
+import helper_functions.passages as passages
+from helper_functions.cache import MemoryCache, SQLiteCache
+from helper_functions.utility import chat_summary_token_threshold
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+vocab = "the of and to in a is that for on with as by at from company market price report year share said would will".split()
+relevant = ["Acme Holdings agreed to acquire Beta Pte Ltd, which sells industrial valves in Singapore, for S$200 million.",
+            "The Beta acquisition by Acme is subject to approval by the Competition and Consumer Commission of Singapore."]
+query = "Acme acquisition of Beta Singapore valves"
+
+
+def synthetic_page(rng:random.Random, paragraphs:int=60)->str:
+    """Page of filler paragraphs, about 7k words, with the relevant sentences inserted at random positions"""
+    text = [" ".join(rng.choices(vocab, k=rng.randint(30, 200))) for _ in range(paragraphs)]
+    for sentence in relevant:
+        text.insert(rng.randint(0, len(text)), sentence)
+    return "\n\n".join(text)
+
+
+class StubTavily:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def search(self, **kwargs):
+        return {"query": kwargs["query"], "results": [{"url": f"https://example.com/{i}", "title": f"Page {i}", "content": "snippet",
+                                                       "score": 0.9, "raw_content": page} for i, page in enumerate(self.pages)]}
+
+
+class StubChatModel(BaseChatModel):
+    """Asks for one web search, then answers, streaming the answer word by word"""
+    responses: list
+
+    @property
+    def _llm_type(self)->str:
+        return "stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self.responses.pop(0))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self.responses.pop(0)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0} for call in message.tool_calls]))
+            return
+        for word in message.content.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--approx-tokens", action="store_true",
+                        help="Count tokens as 1.3 per word, for environments where the tiktoken encoding cannot be downloaded")
+    parser.add_argument("--repeats", type=int, default=20, help="Number of timed compaction runs")
+    args = parser.parse_args()
+    if args.approx_tokens:
+        approx = lambda text: int(len(text.split())*1.3)
+        passages.count_tokens = approx
+        Chat_agent.count_tokens = approx
+    count_tokens = passages.count_tokens
+
+    rng = random.Random(1)
+    pages = [synthetic_page(rng) for _ in range(3)]
+    results = StubTavily(pages).search(query=query)["results"]
+
+    # 1) Time the BM25 compaction of the search results
+    timings = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        compacted = passages.compact_results(query, results)
+        timings.append(time.perf_counter() - start)
+    raw_tokens = count_tokens(json.dumps({"results": results}))
+    compacted_tokens = count_tokens(json.dumps({"results": compacted}))
+    print(f"Tool result tokens: {raw_tokens} raw -> {compacted_tokens} compacted")
+    print(f"Compaction time: median {statistics.median(timings)*1000:.1f} ms over {args.repeats} runs")
+
+    # 2) Run a search turn through the agent, then read the conversation back from the chat memory
+    with tempfile.TemporaryDirectory() as folder:
+        Chat_agent.web_search_cache = SQLiteCache(os.path.join(folder, 'cache.db'), table='web_search')
+        Chat_agent.web_search_memory_cache = MemoryCache(max_entries=16)
+        Chat_agent.get_client = lambda provider, asynchronous=False: StubTavily(pages)
+        Chat_agent.check_for_malicious_intent = lambda **kwargs: "N"
+        llm = StubChatModel(responses=[
+            AIMessage(content="", tool_calls=[{"name": "web_search", "args": {"query": query}, "id": "call_1"}]),
+            AIMessage(content="Acme is acquiring Beta, which sells industrial valves in Singapore [1].")])
+        Chat_agent.llm_with_tools = lambda: llm
+        memory_path = os.path.join(folder, 'chat_memory.db')
+        turn = Chat_agent.ChatTurn(query, "benchmark", Chat_agent.build_graph(memory_path))
+        "".join(turn.stream())
+        stored = [m for m in turn.langgraph.get_state(turn.config).values["messages"] if isinstance(m, ToolMessage)]
+        turn.finish()
+        state = Chat_agent.build_graph(memory_path).get_state(turn.config).values
+
+    persisted_tokens = sum(count_tokens(m.content if isinstance(m.content, str) else json.dumps(m.content)) for m in state["messages"])
+    print(f"Checkpointed search turn: {persisted_tokens} tokens in {len(state['messages'])} messages, "
+          f"history_tokens {state.get('history_tokens')}, summarised {bool(state.get('summary'))}")
+    failures = []
+    if any('passages' in result or 'raw_content' in result for m in stored for result in json.loads(m.content)['results']):
+        failures.append("page content was persisted with the tool message")
+    if persisted_tokens >= chat_summary_token_threshold or state.get('summary'):
+        failures.append(f"the checkpointed turn reaches the summarisation threshold of {chat_summary_token_threshold} tokens")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: the checkpointed turn stays below the summarisation threshold of {chat_summary_token_threshold} tokens")
+
+
+if __name__ == "__main__":
+    main()
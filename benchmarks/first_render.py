@@ -0,0 +1,86 @@
+"""Times the first render and a rerun of the dashboard with streamlit's AppTest, on a news table seeded with synthetic articles in a
+temporary folder. Each run starts a fresh interpreter, so that the first render includes the imports. Also checks that paging past
+the last page renders without exceptions or widget warnings. Dummy secrets are used, and no API is called.
+To compare with an earlier commit, check it out in a worktree (git worktree add /tmp/before <commit>) and pass --repo /tmp/before.
+Run from the repository root: python benchmarks/first_render.py [--rows 5000] [--runs 3] [--repo PATH]"""
+# Import relevant libraries
+import argparse, json, os, random, sqlite3, statistics, subprocess, sys, tempfile
+import pandas as pd
+from datetime import date, timedelta
+
+secret_names = ['password', 'GROQ_API_KEY', 'OPENAI_API_KEY', 'PERPLEXITY_API_KEY', 'GROQ_MODEL_NAME', 'GEMINI_MODEL_NAME',
+                'OPENAI_MODEL_NAME', 'PERPLEXITY_MODEL_NAME']
+
+# Renders the dashboard twice in a fresh interpreter, then once more with the page number set past the last page
+probe = """
+import json, os, sys, time
+repo, folder, secret_names = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+os.chdir(folder)
+sys.path.insert(0, repo)
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join(repo, 'Main.py'), default_timeout=300)
+for name in secret_names:
+    at.secrets[name] = 'benchmark'
+at.session_state['password_correct'] = True
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+at.session_state['news_page'] = 10**6
+at.run()
+print(json.dumps({"first": first, "rerun": rerun, "exceptions": [str(e.value) for e in at.exception],
+                  "warnings": [str(w.value) for w in at.warning]}))
+"""
+
+
+def seed_news(database:str, rows:int):
+    """News table of synthetic articles published over the past year, a tenth of them merger related"""
+    rng = random.Random(1)
+    today = date.today()
+    words = "acquire merger company market shares deal regulator approval announced group holdings sale stake industry".split()
+    published = [(today - timedelta(days=rng.randint(0, 365))).strftime("%Y-%m-%d") for _ in range(rows)]
+    merger = [rng.random() < 0.1 for _ in range(rows)]
+    df = pd.DataFrame({'Published_Date': published, 'Source': 'Synthetic', 'Extracted_Date': published,
+                       'Text': [f"Article {i}. " + " ".join(rng.choices(words, k=40)) for i in range(rows)],
+                       'Reasons': 'Synthetic article', 'Merger_Related': ['true' if m else 'false' for m in merger],
+                       'Merger_Entities': ['Acme Ltd,| Beta Pte Ltd' if m else '' for m in merger]})
+    conn = sqlite3.connect(database)
+    df.to_sql('news', con=conn, if_exists='replace', index=False)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000, help="Number of news articles in the seeded news table")
+    parser.add_argument("--runs", type=int, default=3, help="Number of cold runs")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), help="Checkout to render")
+    args = parser.parse_args()
+    repo = os.path.abspath(args.repo)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, 'database'))
+        seed_news(os.path.join(folder, 'database', 'data.db'), args.rows)
+        env = dict(os.environ, PYTHONPATH=repo, TAVILY_API_KEY='benchmark', OPENAI_API_KEY='benchmark', GROQ_API_KEY='benchmark')
+        for _ in range(args.runs):
+            completed = subprocess.run([sys.executable, "-c", probe, repo, folder, json.dumps(secret_names)], env=env,
+                                       capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stderr)
+                sys.exit(1)
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"First render: mean {statistics.mean(run['first'] for run in runs):.2f} s over {args.runs} cold runs of {args.rows} news articles")
+    print(f"Rerun:        mean {statistics.mean(run['rerun'] for run in runs):.2f} s")
+    failures = [f"exception: {message}" for message in runs[-1]['exceptions']] + [f"warning: {message}" for message in runs[-1]['warnings']]
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
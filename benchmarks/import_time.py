@@ -0,0 +1,54 @@
+"""Times the import of the pipeline scripts, each in a fresh interpreter, and checks that importing them reads no secret.
+To compare with an earlier commit, check it out in a worktree (git worktree add /tmp/before <commit>) and pass --repo /tmp/before.
+Run from the repository root: python benchmarks/import_time.py [--repeats 5] [--repo PATH]"""
+# Import relevant libraries
+import argparse, json, os, statistics, subprocess, sys
+
+modules = ['helper_functions.utility', 'News_classifier', 'News_websearch', 'Chat_agent']
+
+# Imports the module with st.secrets lookups recorded, then prints the import time and the secrets that were read
+probe = """
+import json, sys, time
+import streamlit as st
+secrets = type(st.secrets)
+read = []
+lookup = secrets.__getitem__
+secrets.__getitem__ = lambda self, key: (read.append(key), lookup(self, key))[1]
+start = time.perf_counter()
+try:
+    __import__(sys.argv[1])
+    error = None
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+print(json.dumps({"seconds": time.perf_counter() - start, "secrets": read, "error": error}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed imports of each module")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), help="Checkout to import from")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=args.repo)
+    failures = []
+    for module in modules:
+        runs = []
+        for _ in range(args.repeats):
+            completed = subprocess.run([sys.executable, "-c", probe, module], cwd=args.repo, env=env, capture_output=True, text=True)
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        secrets = sorted({key for run in runs for key in run["secrets"]})
+        error = runs[-1]["error"]
+        print(f"{module:<26} {statistics.median(run['seconds'] for run in runs):.2f} s   "
+              f"secrets read: {', '.join(secrets) or 'none'}{'   import failed: ' + error if error else ''}")
+        if secrets:
+            failures.append(f"importing {module} reads secrets")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Import relevant libraries
+import json, os, shutil, sqlite3, uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from openai import OpenAI
+from typing import Callable, Dict, List, Tuple
+
+batchtable = 'batch_jobs'    # Set the tablename for the sqlite database table used to keep track of submitted batch jobs
+
+
+class BatchBackend(ABC):
+    """Interface for a batch-job API, to which a JSONL file of chat completion requests (OpenAI Batch format, each line
+    with custom_id, method, url and body) is submitted, and from which the results are retrieved once completed."""
+    name: str = ''
+
+    @abstractmethod
+    def submit(self, input_path:str)->str:
+        """Submits the JSONL file of requests and returns the batch ID"""
+
+    @abstractmethod
+    def status(self, batch_id:str)->str:
+        """Returns the batch status, i.e. one of 'validating', 'in_progress', 'finalizing', 'completed', 'failed', 'expired' or 'cancelled'"""
+
+    @abstractmethod
+    def results(self, batch_id:str)->List[Dict]:
+        """Returns the result lines of a completed batch, each with custom_id, response and error"""
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Batch backend using the OpenAI Batch API, with results returned within the 24h completion window"""
+    name = 'openai'
+
+    def __init__(self, client:OpenAI, endpoint:str="/v1/chat/completions", completion_window:str="24h"):
+        self.client = client
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+
+    def submit(self, input_path:str)->str:
+        with open(input_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=self.endpoint, completion_window=self.completion_window)
+        return batch.id
+
+    def status(self, batch_id:str)->str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id:str)->List[Dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(json.loads(line) for line in self.client.files.content(file_id).text.splitlines() if line.strip())
+        return lines
+
+
+class LocalBatchBackend(BatchBackend):
+    """File-based stand-in for a batch-job API, for tests and offline runs. Each batch is a folder holding input.jsonl;
+    the batch is completed once output.jsonl appears in the folder. If a responder is given, which maps a request body
+    to a chat completion response body, the batch is processed locally the first time its status is polled."""
+    name = 'local'
+
+    def __init__(self, folder:str, responder:Callable[[Dict], Dict]|None=None):
+        self.folder = folder
+        self.responder = responder
+
+    def submit(self, input_path:str)->str:
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.folder, batch_id), exist_ok=True)
+        shutil.copyfile(input_path, os.path.join(self.folder, batch_id, 'input.jsonl'))
+        return batch_id
+
+    def status(self, batch_id:str)->str:
+        batch_folder = os.path.join(self.folder, batch_id)
+        if not os.path.exists(os.path.join(batch_folder, 'input.jsonl')):
+            return 'failed'
+        if not os.path.exists(os.path.join(batch_folder, 'output.jsonl')) and self.responder is not None:
+            with open(os.path.join(batch_folder, 'input.jsonl'), encoding='utf-8') as f:
+                requests = [json.loads(line) for line in f if line.strip()]
+            with open(os.path.join(batch_folder, 'output.jsonl'), 'w', encoding='utf-8') as f:
+                for request in requests:
+                    f.write(json.dumps({"custom_id": request['custom_id'],
+                                        "response": {"status_code": 200, "body": self.responder(request['body'])}, "error": None}) + "\n")
+        return 'completed' if os.path.exists(os.path.join(batch_folder, 'output.jsonl')) else 'in_progress'
+
+    def results(self, batch_id:str)->List[Dict]:
+        with open(os.path.join(self.folder, batch_id, 'output.jsonl'), encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def write_batch_file(path:str, requests:List[Tuple[str, Dict]], url:str="/v1/chat/completions"):
+    """Writes (custom_id, request body) pairs as a JSONL batch input file"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": url, "body": body}) + "\n")
+
+
+def _create_table(conn:sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {batchtable} (
+            Batch_ID TEXT PRIMARY KEY,
+            Backend TEXT NOT NULL,
+            Purpose TEXT NOT NULL,
+            Input_File TEXT NOT NULL,
+            Status TEXT NOT NULL,
+            Created TEXT NOT NULL,
+            Updated TEXT NOT NULL
+            )
+        """)
+
+
+def pending_batch_job(conn:sqlite3.Connection, backend:str, purpose:str)->str|None:
+    """Returns the ID of the most recent batch job for the purpose whose results have not been ingested yet, so that
+    a restarted run resumes polling it instead of submitting a new batch"""
+    _create_table(conn)
+    row = conn.execute(f"""SELECT Batch_ID FROM {batchtable} WHERE Backend = ? AND Purpose = ? AND Status NOT IN ('ingested', 'failed', 'expired', 'cancelled')
+                       ORDER BY Created DESC LIMIT 1""", (backend, purpose)).fetchone()
+    return row[0] if row else None
+
+
+def record_batch_job(conn:sqlite3.Connection, batch_id:str, backend:str, purpose:str, input_file:str, status:str='submitted'):
+    """Saves the submitted batch ID, so that the run can resume after a restart"""
+    _create_table(conn)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute(f"INSERT OR REPLACE INTO {batchtable} (Batch_ID, Backend, Purpose, Input_File, Status, Created, Updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (batch_id, backend, purpose, input_file, status, now, now))
+    conn.commit()
+
+
+def update_batch_job(conn:sqlite3.Connection, batch_id:str, status:str):
+    """Updates the status of a saved batch job, e.g. to 'ingested' once its results are saved in the database"""
+    _create_table(conn)
+    conn.execute(f"UPDATE {batchtable} SET Status = ?, Updated = ? WHERE Batch_ID = ?", (status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), batch_id))
+    conn.commit()
@@ -0,0 +1,135 @@
+# Import relevant libraries
+import hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+
+def make_cache_key(**parts:Any)->str:
+    """Content-addressed cache key, i.e. the SHA-256 hash of the canonical JSON form of the given parts."""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SQLiteCache:
+    """Persistent key-value cache backed by a SQLite table, with time-to-live expiry and size-based eviction of the
+    least recently used entries. Keeps hit and miss counters so that savings can be reported."""
+
+    def __init__(self, path:str, table:str='cache', ttl_seconds:float|None=None, max_entries:int|None=None, prune_every:int=50):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self)->sqlite3.Connection:
+        """Opens the database on first use, so that importing the module does not touch the file system."""
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                    )
+                """)
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_accessed ON {self.table} (last_accessed)")
+            self._conn.commit()
+            self._prune()
+        return self._conn
+
+    def _prune(self):
+        """Removes expired entries, then the least recently used entries beyond the size cap."""
+        if self.ttl_seconds is not None:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self._conn.execute(f"""DELETE FROM {self.table} WHERE key IN
+                               (SELECT key FROM {self.table} ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+        self._conn.commit()
+
+    def get(self, key:str)->str|None:
+        """Returns the cached value for the key, or None if absent or expired."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key:str)->Tuple[str, float]|None:
+        """Returns the cached value for the key with the time it was stored, or None if absent or expired."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.ttl_seconds is not None and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            conn.execute(f"UPDATE {self.table} SET last_accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key:str, value:str):
+        """Stores the value under the key, replacing any existing entry."""
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                         (key, value, now, now))
+            conn.commit()
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune()
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+
+    def stats(self)->Dict[str, Any]:
+        """Returns the hit and miss counters for this process, together with the number of stored entries."""
+        with self._lock:
+            entries = self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': round(self.hits/lookups, 3) if lookups else 0.0, 'entries': entries}
+
+
+class MemoryCache:
+    """In-process key-value cache with time-to-live expiry and eviction of the least recently used entries beyond max_entries,
+    e.g. in front of a SQLiteCache so that values read again within the process skip the database."""
+
+    def __init__(self, max_entries:int, ttl_seconds:float|None=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key:str)->str|None:
+        """Returns the cached value for the key, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl_seconds is not None and time.time() - entry[0] > self.ttl_seconds):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key:str, value:str, created_at:float|None=None):
+        """Stores the value under the key, replacing any existing entry, then evicts the least recently used entries beyond the cap.
+        created_at is the time the value was first stored, e.g. in the SQLiteCache it is read from, so that it expires on time."""
+        with self._lock:
+            self._entries[key] = (created_at if created_at is not None else time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
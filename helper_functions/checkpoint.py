@@ -0,0 +1,240 @@
+# Import relevant libraries
+import asyncio, os, sqlite3, threading, time
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (WRITES_IDX_MAP, BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata,
+                                       CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata)
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Sequence, Tuple
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """LangGraph checkpointer backed by SQLite, keeping the latest max_checkpoints of each thread and evicting threads idle for
+    longer than ttl_seconds or least recently used beyond max_threads. If given, compact(channel, value) is applied before saving."""
+
+    def __init__(self, path:str, ttl_seconds:float|None=None, max_threads:int|None=None, max_checkpoints:int|None=None,
+                 compact:Callable[[str, Any], Any]|None=None, prune_every:int=50):
+        super().__init__()
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.max_checkpoints = max_checkpoints
+        self.compact = compact
+        self.prune_every = prune_every
+        self._puts = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self)->sqlite3.Connection:
+        """Opens the database on first use, so that building the graph does not touch the file system."""
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                    )
+                """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                    )
+                """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    last_accessed REAL NOT NULL
+                    )
+                """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_threads_last_accessed ON threads (last_accessed)")
+            self._conn.commit()
+            self._prune()
+        return self._conn
+
+    def _touch(self, thread_id:str):
+        self._conn.execute("INSERT OR REPLACE INTO threads (thread_id, last_accessed) VALUES (?, ?)", (thread_id, time.time()))
+
+    def _delete_threads(self, thread_ids:List[str]):
+        params = [(thread_id,) for thread_id in thread_ids]
+        for table in ('checkpoints', 'writes', 'threads'):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", params)
+
+    def _prune(self):
+        """Removes the threads idle for longer than the time-to-live, then the least recently used threads beyond the cap."""
+        expired = []
+        if self.ttl_seconds is not None:
+            expired += [row[0] for row in self._conn.execute("SELECT thread_id FROM threads WHERE last_accessed < ?",
+                                                             (time.time() - self.ttl_seconds,)).fetchall()]
+        if self.max_threads is not None:
+            expired += [row[0] for row in self._conn.execute("SELECT thread_id FROM threads ORDER BY last_accessed DESC LIMIT -1 OFFSET ?",
+                                                             (self.max_threads,)).fetchall()]
+        self._delete_threads(expired)
+        self._conn.commit()
+
+    def _trim_thread(self, thread_id:str, checkpoint_ns:str):
+        """Removes the checkpoints of the thread, and their pending writes, beyond the latest max_checkpoints."""
+        if self.max_checkpoints is None:
+            return
+        old = self._conn.execute("""SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                                 ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?""", (thread_id, checkpoint_ns, self.max_checkpoints)).fetchall()
+        params = [(thread_id, checkpoint_ns, row[0]) for row in old]
+        for table in ('checkpoints', 'writes'):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params)
+
+    def _to_tuple(self, thread_id:str, checkpoint_ns:str, row:Tuple)->CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self._conn.execute("""SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ?
+                                    AND checkpoint_id = ? ORDER BY task_id, idx""", (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                           if parent_checkpoint_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((value_type, value))) for task_id, channel, value_type, value in writes])
+
+    def get_tuple(self, config:RunnableConfig)->CheckpointTuple|None:
+        """Returns the checkpoint given by the config's checkpoint ID, or the latest checkpoint of the thread if it has none."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            conn = self._connect()
+            if checkpoint_id := get_checkpoint_id(config):
+                row = conn.execute(f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                                   (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = conn.execute(f"""SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                                   ORDER BY checkpoint_id DESC LIMIT 1""", (thread_id, checkpoint_ns)).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            conn.commit()
+            return self._to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config:RunnableConfig|None, *, filter:Dict[str, Any]|None=None, before:RunnableConfig|None=None,
+             limit:int|None=None)->Iterator[CheckpointTuple]:
+        """Lists the checkpoints matching the config's thread and namespace (all threads if no config is given), most recent first"""
+        where, params = [], []
+        if config is not None:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        sqlquery = (f"""SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                    FROM checkpoints {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY checkpoint_id DESC""")
+        with self._lock:
+            rows = self._connect().execute(sqlquery, params).fetchall()
+        found = 0
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and found >= limit:
+                break
+            with self._lock:
+                checkpoint_tuple = self._to_tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and any(checkpoint_tuple.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            found += 1
+            yield checkpoint_tuple
+
+    def put(self, config:RunnableConfig, checkpoint:Checkpoint, metadata:CheckpointMetadata, new_versions:ChannelVersions)->RunnableConfig:
+        """Saves the checkpoint, with its channel values compacted, then trims the thread to its latest checkpoints"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        if self.compact is not None:
+            checkpoint = {**checkpoint, "channel_values": {channel: self.compact(channel, value)
+                                                           for channel, value in checkpoint["channel_values"].items()}}
+        type_, serialised = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialised_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            conn = self._connect()
+            conn.execute("""INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type,
+                         checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                         (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"), type_, serialised,
+                          metadata_type, serialised_metadata))
+            self._trim_thread(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            conn.commit()
+            self._puts += 1
+            if self._puts % self.prune_every == 0:
+                self._prune()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config:RunnableConfig, writes:Sequence[Tuple[str, Any]], task_id:str, task_path:str="")->None:
+        """Saves the pending writes of a task against the checkpoint, compacted. Special writes (e.g. errors) replace any earlier
+        write of the same kind, while regular writes already saved are kept."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            if self.compact is not None:
+                value = self.compact(channel, value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+                         *self.serde.dumps_typed(value), task_path))
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(f"""{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            conn.commit()
+
+    def delete_thread(self, thread_id:str)->None:
+        """Removes all checkpoints and writes of the thread"""
+        with self._lock:
+            self._connect()
+            self._delete_threads([thread_id])
+            self._conn.commit()
+
+    def rewind(self, config:RunnableConfig)->None:
+        """Removes the checkpoints of the config's thread saved after the config's checkpoint, or all of them if the config has
+        no checkpoint, together with their writes, e.g. to forget a turn that was aborted"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_id = get_checkpoint_id(config) or ''
+        with self._lock:
+            conn = self._connect()
+            for table in ('checkpoints', 'writes'):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id > ?", (thread_id, checkpoint_id))
+            conn.commit()
+
+    # The asynchronous methods run the synchronous ones in a worker thread, as each call is a short local SQLite transaction
+    async def aget_tuple(self, config:RunnableConfig)->CheckpointTuple|None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config:RunnableConfig|None, *, filter:Dict[str, Any]|None=None, before:RunnableConfig|None=None,
+                    limit:int|None=None)->AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield checkpoint_tuple
+
+    async def aput(self, config:RunnableConfig, checkpoint:Checkpoint, metadata:CheckpointMetadata,
+                   new_versions:ChannelVersions)->RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config:RunnableConfig, writes:Sequence[Tuple[str, Any]], task_id:str, task_path:str="")->None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id:str)->None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,112 @@
+# Import relevant libraries
+import logging, sqlite3, threading
+import pandas as pd
+import streamlit as st
+from helper_functions.database import ensure_news_schema, table_exists
+from helper_functions.research_store import ensure_research_schema, research_for_article
+from helper_functions.utility import dbfolder, news_page_size, tablename
+from typing import Dict, Tuple
+
+# Columns Table 1 can be sorted by. The sort column is interpolated into the SQL, so it must be one of these
+sortable_columns = ('Published_Date', 'Extracted_Date', 'Merger_Related', 'Source')
+
+# The cached connection is shared by all Streamlit sessions, which run in separate threads, so queries on it are serialised
+_lock = threading.Lock()
+
+
+def ensure_dashboard_indexes(conn:sqlite3.Connection, table:str=tablename):
+    """Creates the indexes used by the dashboard queries on the news table, if they don't exist"""
+    if not table_exists(conn, table):
+        return
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_published_date ON {table} (Published_Date)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_extracted_date ON {table} (Extracted_Date)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_merger_related ON {table} (Merger_Related, Published_Date)")
+    conn.commit()
+
+
+@st.cache_resource
+def get_connection(database:str=f'{dbfolder}/data.db')->sqlite3.Connection:
+    """Opens the database connection once per Streamlit server, and makes sure the news table columns, dashboard indexes and
+    research tables exist"""
+    conn = sqlite3.connect(database, check_same_thread=False)
+    with _lock:
+        ensure_news_schema(conn)
+        ensure_dashboard_indexes(conn)
+        ensure_research_schema(conn)
+    return conn
+
+
+def data_version(database:str=f'{dbfolder}/data.db')->int:
+    """Returns SQLite's data version of the database, which changes whenever another connection (e.g. the classifier or research
+    scripts) commits a change. Passed to the cached queries so that their results are refreshed once the database changes."""
+    try:
+        conn = get_connection(database)
+        with _lock:
+            return conn.execute("PRAGMA data_version").fetchone()[0]
+    except (Exception, sqlite3.Error) as e:
+        logging.getLogger('shared_app_logger').error(f"Error while reading the data version of the database {database}: {e}")
+        return 0
+
+
+def _news_filter(published_date:str|None, merger_only:bool, collapse_near_duplicates:bool)->Tuple[str, tuple]:
+    """SQL selecting the news articles that pass the Table 1 filters, with its parameters. Near-duplicates are collapsed to the
+    most recent article of each cluster among the articles that pass the other filters."""
+    where = "Published_Date >= COALESCE(?, DATE('now','-1 month'))"
+    if merger_only:
+        where += " AND Merger_Related = 'true'"
+    sqlquery = f"SELECT rowid AS Row_ID, * FROM {tablename} WHERE {where}"
+    if collapse_near_duplicates:
+        sqlquery = f"""SELECT * FROM (SELECT rowid AS Row_ID, *, ROW_NUMBER() OVER (PARTITION BY COALESCE(Cluster_ID, Article_Key)
+                       ORDER BY Published_Date DESC, rowid DESC) AS Cluster_Rank FROM {tablename} WHERE {where}) WHERE Cluster_Rank = 1"""
+    return sqlquery, (published_date,)
+
+
+@st.cache_data(max_entries=50)
+def count_news(published_date:str|None, merger_only:bool, collapse_near_duplicates:bool, db_version:int,
+               database:str=f'{dbfolder}/data.db')->int:
+    """Counts the news articles that pass the Table 1 filters. db_version is only part of the cache key."""
+    try:
+        conn = get_connection(database)
+        with _lock:
+            if not table_exists(conn, tablename):
+                return 0
+            sqlquery, params = _news_filter(published_date, merger_only, collapse_near_duplicates)
+            return conn.execute(f"SELECT COUNT(*) FROM ({sqlquery})", params).fetchone()[0]
+    except (Exception, sqlite3.Error) as e:
+        logging.getLogger('shared_app_logger').error(f"Error while counting from the database table named {tablename}: {e}")
+        return 0
+
+
+@st.cache_data(max_entries=200)
+def query_news_page(published_date:str|None, merger_only:bool, collapse_near_duplicates:bool, sort_column:str, descending:bool,
+                    page:int, db_version:int, page_size:int=news_page_size, database:str=f'{dbfolder}/data.db')->pd.DataFrame:
+    """Queries one page (numbered from 1) of the news articles published from the given date (in the format YYYY-MM-DD) onwards,
+    or within 1 month from today if no date is given, that pass the other Table 1 filters, sorted by the sort column. Ties are
+    broken by insertion order, so that pages neither overlap nor skip articles. db_version is only part of the cache key."""
+    if sort_column not in sortable_columns:
+        raise ValueError(f"Table 1 cannot be sorted by {sort_column}, only by one of {sortable_columns}")
+    try:
+        conn = get_connection(database)
+        with _lock:
+            if not table_exists(conn, tablename):
+                return pd.DataFrame()
+            sqlquery, params = _news_filter(published_date, merger_only, collapse_near_duplicates)
+            direction = "DESC" if descending else "ASC"
+            sqlquery = f"{sqlquery} ORDER BY {sort_column} {direction}, Row_ID {direction} LIMIT ? OFFSET ?"
+            df = pd.read_sql_query(sqlquery, con=conn, params=params + (page_size, (max(page, 1) - 1)*page_size))
+            return df.drop(columns=['Row_ID', 'Cluster_Rank'], errors='ignore')
+    except (Exception, sqlite3.Error) as e:
+        logging.getLogger('shared_app_logger').error(f"Error while querying from the database table named {tablename}: {e}")
+        return pd.DataFrame()
+
+
+@st.cache_data(max_entries=200)
+def query_research(article_key:str, db_version:int, database:str=f'{dbfolder}/data.db')->Dict[str, Dict[str, pd.DataFrame]]:
+    """Looks up the latest research run of each query for the news article by its article key. db_version is only part of the cache key."""
+    try:
+        conn = get_connection(database)
+        with _lock:
+            return research_for_article(conn, article_key)
+    except (Exception, sqlite3.Error) as e:
+        logging.getLogger('shared_app_logger').error(f"Error while querying the research for article {article_key}: {e}")
+        return {}
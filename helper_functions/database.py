@@ -0,0 +1,76 @@
+# Import relevant libraries
+import hashlib, sqlite3
+import pandas as pd
+from helper_functions.utility import tablename
+from typing import Iterable, List, Set
+
+
+def article_key(published_date:str, source:str, text:str)->str:
+    """Stable key of a news article, i.e. the SHA-256 hash of its whitespace-normalised, casefolded source,
+    published date and text"""
+    normalised = "|".join(" ".join(str(part).split()).casefold() for part in (source, published_date, text))
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+def table_exists(conn:sqlite3.Connection, table:str)->bool:
+    """Checks if the database table exists"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def ensure_news_schema(conn:sqlite3.Connection, table:str=tablename):
+    """Makes sure the news table, if it exists, has an Article_Key column with a UNIQUE index and an indexed Cluster_ID
+    column. News tables created before these columns were introduced are migrated once: keys are backfilled, any
+    duplicated articles removed, and each article starts as its own near-duplicate cluster."""
+    if not table_exists(conn, table):
+        return
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if 'Article_Key' not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN Article_Key TEXT")
+        rows = conn.execute(f"SELECT rowid, Published_Date, Source, Text FROM {table}").fetchall()
+        conn.executemany(f"UPDATE {table} SET Article_Key = ? WHERE rowid = ?",
+                         [(article_key(published, source, text), rowid) for rowid, published, source, text in rows])
+        # Keep only the earliest copy of any duplicated article, so that the unique index can be created
+        conn.execute(f"DELETE FROM {table} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table} GROUP BY Article_Key)")
+    if 'Cluster_ID' not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN Cluster_ID TEXT")
+        conn.execute(f"UPDATE {table} SET Cluster_ID = Article_Key")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_article_key ON {table} (Article_Key)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_cluster_id ON {table} (Cluster_ID)")
+    conn.commit()
+
+
+def existing_keys(conn:sqlite3.Connection, keys:Iterable[str], table:str=tablename, column:str='Article_Key', chunk_size:int=500)->Set[str]:
+    """Returns the subset of the given keys that are already stored in the table. Uses an indexed lookup on only the
+    incoming keys, instead of loading the table's history."""
+    if not table_exists(conn, table):
+        return set()
+    return {row[0] for row in select_in(conn, f"SELECT {column} FROM {table} WHERE {column} IN ({{}})", keys, chunk_size)}
+
+
+def select_in(conn:sqlite3.Connection, sqlquery:str, keys:Iterable, chunk_size:int=500)->List[tuple]:
+    """Runs a query whose IN clause is written as IN ({}) for the given keys, and returns the rows of all the keys"""
+    keys = list(keys)
+    rows = []
+    # Query in chunks to stay within SQLite's limit on the number of bound parameters
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        rows += conn.execute(sqlquery.format(", ".join("?" for _ in chunk)), chunk).fetchall()
+    return rows
+
+
+def insert_or_ignore(pd_table, conn, keys:List[str], data_iter)->int:
+    """Insertion method for pandas DataFrame.to_sql that skips rows violating a UNIQUE constraint, e.g. an article
+    that is already in the news table."""
+    columns = ", ".join(f'"{key}"' for key in keys)
+    placeholders = ", ".join("?" for _ in keys)
+    result = conn.executemany(f'INSERT OR IGNORE INTO "{pd_table.name}" ({columns}) VALUES ({placeholders})', list(data_iter))
+    return result.rowcount
+
+
+def recent_articles(conn:sqlite3.Connection, days:int, table:str=tablename)->pd.DataFrame:
+    """Returns the classified news articles published within the given number of days, for near-duplicate matching"""
+    if not table_exists(conn, table):
+        return pd.DataFrame(columns=['Article_Key', 'Cluster_ID', 'Text', 'Reasons', 'Merger_Related', 'Merger_Entities'])
+    sqlquery = (f"SELECT Article_Key, COALESCE(Cluster_ID, Article_Key) AS Cluster_ID, Text, Reasons, Merger_Related, Merger_Entities "
+                f"FROM {table} WHERE Published_Date >= DATE('now', ?) ORDER BY Published_Date DESC")
+    return pd.read_sql_query(sqlquery, conn, params=(f'-{int(days)} days',))
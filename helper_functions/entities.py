@@ -0,0 +1,175 @@
+# Import relevant libraries
+import math, re, sqlite3, unicodedata
+from collections import defaultdict
+from datetime import datetime
+from helper_functions.database import ensure_news_schema, table_exists
+from helper_functions.utility import entity_match_threshold, tablename
+from typing import Dict, List, Set, Tuple
+
+entitytable = 'entities'               # Set the tablename for the sqlite database table used to store the canonical merger parties
+linktable = 'article_entities'         # Set the tablename for the sqlite database table linking news articles to their merger parties
+
+# Legal form suffixes stripped from the end of entity names, so that e.g. "Microsoft Corporation", "Microsoft Corp." and "Microsoft" match
+legal_suffixes = {'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'ltd', 'limited', 'llc', 'llp', 'lp', 'plc', 'pty',
+                  'pte', 'proprietary', 'private', 'public', 'gmbh', 'ag', 'sa', 'sas', 'spa', 'nv', 'bv', 'kk', 'bhd', 'sdn', 'tbk', 'ab', 'asa', 'oy'}
+
+
+def normalise_entity(name:str)->str:
+    """Normalised entity name, i.e. accents removed, casefolded, '&' spelt out, punctuation removed, and any leading 'the' and trailing
+    legal form suffixes (e.g. Inc, Corp., Pte. Ltd.) stripped"""
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode('ascii').casefold()
+    text = text.replace('&', ' and ')
+    # Join dotted abbreviations, e.g. "S.A." and "Pty." before removing punctuation
+    tokens = re.sub(r"[^\w\s]", " ", text.replace('.', '')).split()
+    if len(tokens) > 1 and tokens[0] == 'the':
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in legal_suffixes:
+        tokens = tokens[:-1]
+    return " ".join(tokens)
+
+
+def trigrams(normalised:str)->Set[str]:
+    """Character trigrams of the normalised name, padded so that short names still have several trigrams"""
+    padded = f"  {normalised} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityIndex:
+    """In-memory index from normalised names to entity IDs. Exact matches are a dictionary lookup. Fuzzy matches use an inverted
+    index of name trigrams with prefix filtering: a name with trigram Jaccard similarity of at least the threshold must share one
+    of the query's rarest (n - ceil(threshold*n) + 1) trigrams, so only the short posting lists of those trigrams are scanned."""
+
+    def __init__(self, threshold:float=entity_match_threshold):
+        self.threshold = threshold
+        self._exact: Dict[str, int] = {}
+        self._names: List[Tuple[str, Set[str], int]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+
+    def __len__(self)->int:
+        return len(self._exact)
+
+    def add(self, normalised:str, entity_id:int):
+        """Adds a normalised name (canonical name or alias) of the entity to the index"""
+        if normalised in self._exact:
+            return
+        self._exact[normalised] = entity_id
+        grams = trigrams(normalised)
+        position = len(self._names)
+        self._names.append((normalised, grams, entity_id))
+        for gram in grams:
+            self._postings[gram].append(position)
+
+    def lookup(self, normalised:str)->Tuple[int, float]|None:
+        """Returns the (entity ID, similarity) of the exact or most similar indexed name, or None if no name reaches the threshold"""
+        if normalised in self._exact:
+            return self._exact[normalised], 1.0
+        grams = trigrams(normalised)
+        prefix = len(grams) - math.ceil(self.threshold*len(grams)) + 1
+        rarest = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))[:prefix]
+        candidates = {position for gram in rarest for position in self._postings.get(gram, ())}
+        best = None
+        for position in candidates:
+            _, other, entity_id = self._names[position]
+            similarity = len(grams & other) / len(grams | other)
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (entity_id, similarity)
+        return best
+
+
+def _create_tables(conn:sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {entitytable} (
+            Entity_ID INTEGER PRIMARY KEY,
+            Canonical_Name TEXT NOT NULL,
+            Normalised_Name TEXT NOT NULL UNIQUE,
+            Created TEXT NOT NULL
+            )
+        """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {linktable} (
+            Article_Key TEXT NOT NULL,
+            Entity_ID INTEGER NOT NULL REFERENCES {entitytable} (Entity_ID),
+            Raw_Name TEXT NOT NULL,
+            PRIMARY KEY (Article_Key, Entity_ID, Raw_Name)
+            )
+        """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{linktable}_entity_id ON {linktable} (Entity_ID)")
+
+
+class EntityResolver:
+    """Resolves merger party names to canonical entity IDs, creating a new entity for a name that matches no known entity. The index
+    is loaded from the entities table and the names already linked to articles, so that previously seen variants resolve exactly.
+    When the entities tables are first created, the articles already in the news table are linked once."""
+
+    def __init__(self, conn:sqlite3.Connection, threshold:float=entity_match_threshold):
+        self.conn = conn
+        migrate = not table_exists(conn, linktable)
+        _create_tables(conn)
+        self.index = EntityIndex(threshold)
+        self.canonical: Dict[int, str] = {}
+        for entity_id, normalised in conn.execute(f"SELECT Entity_ID, Normalised_Name FROM {entitytable}").fetchall():
+            self.index.add(normalised, entity_id)
+            self.canonical[entity_id] = normalised
+        for raw_name, entity_id in conn.execute(f"SELECT DISTINCT Raw_Name, Entity_ID FROM {linktable}").fetchall():
+            self.index.add(normalise_entity(raw_name), entity_id)
+        if migrate:
+            link_unlinked_articles(conn, self)
+
+    def resolve(self, name:str, create:bool=True)->int|None:
+        """Returns the entity ID of the name. An unknown name becomes a new entity if create, else None is returned."""
+        normalised = normalise_entity(name)
+        if normalised == '':
+            return None
+        match = self.index.lookup(normalised)
+        if match is not None:
+            # Remember the variant, so that it resolves exactly next time
+            self.index.add(normalised, match[0])
+            return match[0]
+        if not create:
+            return None
+        entity_id = self.conn.execute(f"INSERT INTO {entitytable} (Canonical_Name, Normalised_Name, Created) VALUES (?, ?, ?)",
+                                      (str(name).strip(), normalised, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))).lastrowid
+        self.index.add(normalised, entity_id)
+        self.canonical[entity_id] = normalised
+        return entity_id
+
+    def canonical_key(self, name:str)->str:
+        """Normalised canonical name of the entity the name resolves to, or the normalised name itself for an unknown entity, e.g. for
+        use in cache keys"""
+        entity_id = self.resolve(name, create=False)
+        return self.canonical[entity_id] if entity_id is not None else normalise_entity(name)
+
+    def link_articles(self, keys:List[str], merger_entities:List[str])->int:
+        """Resolves the merger parties of each article, given as the Merger_Entities strings saved by the classifier, and links them
+        to the article. Returns the number of links added."""
+        links = []
+        for key, entities in zip(keys, merger_entities):
+            for raw_name in split_entities(entities):
+                entity_id = self.resolve(raw_name)
+                if entity_id is not None:
+                    links.append((key, entity_id, raw_name))
+        result = self.conn.executemany(f"INSERT OR IGNORE INTO {linktable} (Article_Key, Entity_ID, Raw_Name) VALUES (?, ?, ?)", links)
+        self.conn.commit()
+        return result.rowcount
+
+
+def split_entities(merger_entities:str|None)->List[str]:
+    """Splits the Merger_Entities string saved by the classifier into the individual merger parties"""
+    if merger_entities is None:
+        return []
+    return [party.strip() for party in str(merger_entities).split(',|') if party.strip() != '']
+
+
+def link_unlinked_articles(conn:sqlite3.Connection, resolver:EntityResolver|None=None, table:str=tablename)->int:
+    """Links the merger parties of every news article with Merger_Entities that is not yet linked, e.g. articles saved before the
+    entities tables were introduced. Returns the number of links added."""
+    if not table_exists(conn, table):
+        return 0
+    ensure_news_schema(conn, table)
+    resolver = resolver or EntityResolver(conn)
+    rows = conn.execute(f"""SELECT n.Article_Key, n.Merger_Entities FROM {table} n
+                        WHERE n.Merger_Entities IS NOT NULL AND n.Merger_Entities != '' AND n.Article_Key IS NOT NULL
+                        AND NOT EXISTS (SELECT 1 FROM {linktable} l WHERE l.Article_Key = n.Article_Key)""").fetchall()
+    if len(rows) == 0:
+        return 0
+    return resolver.link_articles([row[0] for row in rows], [row[1] for row in rows])
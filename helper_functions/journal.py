@@ -0,0 +1,40 @@
+# Import relevant libraries
+import json, sqlite3
+from datetime import datetime
+from helper_functions.database import select_in
+from typing import Dict, Iterable
+
+journaltable = 'classifier_journal'    # Set the tablename for the sqlite database table used to persist each classification as it completes
+
+
+def ensure_journal_schema(conn:sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {journaltable} (
+            Article_Key TEXT PRIMARY KEY,
+            Response TEXT NOT NULL,
+            Updated TEXT NOT NULL
+            )
+        """)
+
+
+def record_classification(conn:sqlite3.Connection, key:str, response:Dict):
+    """Persists the classification of an article as soon as it completes, so that it survives a crash before the run
+    saves its articles to the news table. The journal table is created by journaled_classifications."""
+    conn.execute(f"INSERT OR REPLACE INTO {journaltable} (Article_Key, Response, Updated) VALUES (?, ?, ?)",
+                 (key, json.dumps(response), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+
+
+def journaled_classifications(conn:sqlite3.Connection, keys:Iterable[str], chunk_size:int=500)->Dict[str, Dict]:
+    """Returns the journaled classifications of the given articles, keyed by article key, so that a rerun only
+    classifies the articles that are not finished yet"""
+    ensure_journal_schema(conn)
+    return {key: json.loads(response) for key, response in
+            select_in(conn, f"SELECT Article_Key, Response FROM {journaltable} WHERE Article_Key IN ({{}})", keys, chunk_size)}
+
+
+def clear_classifications(conn:sqlite3.Connection, keys:Iterable[str]):
+    """Removes the journaled classifications of articles once they are saved to the news table"""
+    ensure_journal_schema(conn)
+    conn.executemany(f"DELETE FROM {journaltable} WHERE Article_Key = ?", [(key,) for key in keys])
+    conn.commit()
@@ -0,0 +1,109 @@
+# Import relevant libraries
+import hashlib, re
+import numpy as np
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Set
+
+_PRIME = (1 << 31) - 1    # Mersenne prime used for the universal hash permutations, small enough for products to fit in uint64
+_COMPANY_SUFFIXES = {'ltd', 'limited', 'pty', 'inc', 'plc', 'corp', 'corporation', 'co', 'group', 'holdings', 'llc', 'ag', 'sa', 'nv', 'bhd'}    # Not compared as proper nouns
+
+
+def shingles(text:str, k:int=5)->Set[str]:
+    """Character k-shingles of the casefolded text with punctuation and repeated whitespace removed, so that small
+    differences in wording or punctuation only affect a few shingles"""
+    normalised = " ".join(re.sub(r"[^\w\s]", " ", str(text).casefold()).split())
+    if len(normalised) <= k:
+        return {normalised}
+    return {normalised[i:i + k] for i in range(len(normalised) - k + 1)}
+
+
+def proper_nouns(text:str)->FrozenSet[str]:
+    """Capitalised words of the text, other than the first word of each sentence and company suffixes such as Ltd, with any
+    possessive 's removed, i.e. mostly the names of the companies, regulators and places it mentions"""
+    words = set()
+    for sentence in re.split(r"[.!?:;]\s+", re.sub(r"['’]s\b", "", str(text))):
+        words.update(word.casefold() for word in re.findall(r"[\w&'’-]+", sentence)[1:] if word[0].isupper())
+    return frozenset(words - _COMPANY_SUFFIXES)
+
+
+def same_names(a:FrozenSet[str], b:FrozenSet[str])->bool:
+    """Whether the proper nouns of one headline include all those of the other, so that a name only missed as the first word
+    of a sentence (e.g. "ACCC clears ..." and "The ACCC clears ...") does not keep near-duplicates apart"""
+    return a <= b or b <= a
+
+
+def jaccard(a:Set[str], b:Set[str])->float:
+    """Jaccard similarity of two shingle sets"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashLSH:
+    """Locality-sensitive hashing index over MinHash signatures of headline shingles. Headlines that share at least one
+    band of their signature become candidate near-duplicates, which are then verified on their exact Jaccard similarity."""
+
+    def __init__(self, num_perm:int=128, bands:int=32, k:int=5, seed:int=1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.k = k
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[tuple, List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self.shingle_sets: List[Set[str]] = []
+
+    def signature(self, shingle_set:Set[str])->np.ndarray:
+        """MinHash signature, i.e. the minimum of each hash permutation over the shingles"""
+        hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') % _PRIME
+                           for s in shingle_set], dtype=np.uint64)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def add(self, text:str)->int:
+        """Adds a headline to the index and returns its position"""
+        position = len(self.shingle_sets)
+        shingle_set = shingles(text, self.k)
+        self.shingle_sets.append(shingle_set)
+        signature = self.signature(shingle_set)
+        for band in range(self.bands):
+            self._buckets[band][tuple(signature[band*self.rows:(band + 1)*self.rows])].append(position)
+        return position
+
+    def candidate_pairs(self)->Set[tuple]:
+        """Pairs of positions that share at least one signature band"""
+        pairs = set()
+        for buckets in self._buckets:
+            for members in buckets.values():
+                for i in range(len(members)):
+                    for j in range(i + 1, len(members)):
+                        pairs.add((members[i], members[j]))
+        return pairs
+
+
+def group_near_duplicates(texts:List[str], threshold:float=0.8)->List[int]:
+    """Groups near-duplicate headlines, i.e. those with a shingle Jaccard similarity of at least the threshold and the same proper
+    nouns, including transitively. Returns, for each headline, the position of its group's earliest headline."""
+    index = MinHashLSH()
+    for text in texts:
+        index.add(text)
+    names = [proper_nouns(text) for text in texts]
+
+    # Union-find over verified candidate pairs, keeping the earliest position as the root of each group
+    parent = list(range(len(texts)))
+    def find(i:int)->int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in index.candidate_pairs():
+        # Templated headlines about different companies (e.g. "ACCC will not oppose X's proposed acquisition of Y") share most of
+        # their shingles, so the proper nouns must also match
+        if same_names(names[i], names[j]) and jaccard(index.shingle_sets[i], index.shingle_sets[j]) >= threshold:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+    return [find(i) for i in range(len(texts))]
@@ -0,0 +1,56 @@
+# Import relevant libraries
+import re
+from helper_functions.utility import count_tokens, web_search_passage_words, web_search_token_budget
+from rank_bm25 import BM25Okapi
+from typing import Dict, List
+
+
+def _words(text:str)->List[str]:
+    """Casefolded word tokens of the text, used for BM25 scoring"""
+    return re.findall(r"\w+", text.casefold())
+
+
+def split_passages(text:str, passage_words:int=web_search_passage_words)->List[str]:
+    """Splits page content into passages of about passage_words words. Consecutive short paragraphs are joined into one
+    passage, and paragraphs longer than passage_words are split."""
+    passages, current = [], []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        words = paragraph.split()
+        while len(words) > passage_words:
+            if current:
+                passages.append(" ".join(current))
+                current = []
+            passages.append(" ".join(words[:passage_words]))
+            words = words[passage_words:]
+        current += words
+        if len(current) >= passage_words:
+            passages.append(" ".join(current))
+            current = []
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def compact_results(query:str, results:List[Dict], token_budget:int=web_search_token_budget,
+                    passage_words:int=web_search_passage_words)->List[Dict]:
+    """Replaces the raw content of the web search results with the passages most relevant to the query, scored with BM25 across
+    all results and kept best first until the token budget is spent. Each result keeps its url, title, snippet and score for
+    citations, with its kept passages in page order."""
+    passages = [(i, j, passage) for i, item in enumerate(results)
+                for j, passage in enumerate(split_passages(item.get('raw_content') or '', passage_words))]
+    kept = set()
+    if passages:
+        scores = BM25Okapi([_words(passage) for _, _, passage in passages]).get_scores(_words(query))
+        spent = 0
+        for position in sorted(range(len(passages)), key=lambda position: scores[position], reverse=True):
+            tokens = count_tokens(passages[position][2])
+            if spent + tokens > token_budget:
+                continue
+            kept.add(position)
+            spent += tokens
+    compacted = []
+    for i, item in enumerate(results):
+        item = {key: value for key, value in item.items() if key != 'raw_content'}
+        item['passages'] = [passage for position, (k, _, passage) in enumerate(passages) if k == i and position in kept]
+        compacted.append(item)
+    return compacted
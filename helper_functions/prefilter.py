@@ -0,0 +1,159 @@
+# Import relevant libraries
+import asyncio, logging, os, pickle, sqlite3
+import numpy as np
+import pandas as pd
+from helper_functions.database import table_exists
+from helper_functions.utility import tablename
+from pathlib import Path
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from typing import Dict, List, Tuple
+
+prefilter_reason_prefix = "Skipped by local pre-filter"    # Start of the 'Reasons' recorded for headlines that skip the LLM
+
+
+class MergerPrefilter:
+    """Lightweight local text classifier (hashed word and bigram TF-IDF features with logistic regression), trained on the
+    Merger_Related labels given by the LLM. Headlines scored as non-merger with at least the threshold probability can
+    skip the LLM. Headlines labelled 'unable to tell' are treated as merger related, i.e. never to be skipped."""
+
+    def __init__(self, threshold:float=0.95):
+        self.threshold = threshold
+        self.pipeline = make_pipeline(HashingVectorizer(ngram_range=(1, 2), alternate_sign=False, n_features=2**18),
+                                      TfidfTransformer(sublinear_tf=True),
+                                      LogisticRegression(class_weight='balanced', max_iter=1000))
+
+    @staticmethod
+    def _needs_llm(merger_related:pd.Series)->np.ndarray:
+        return (merger_related != 'false').astype(int).to_numpy()
+
+    def fit(self, texts:List[str], merger_related:pd.Series)->'MergerPrefilter':
+        self.pipeline.fit(texts, self._needs_llm(merger_related))
+        return self
+
+    def non_merger_probability(self, texts:List[str])->np.ndarray:
+        """Probability that each headline is not merger related"""
+        proba = self.pipeline.predict_proba(texts)
+        return proba[:, list(self.pipeline.classes_).index(0)]
+
+    def skip(self, texts:List[str])->np.ndarray:
+        """Whether each headline is confidently non-merger, and can thus skip the LLM"""
+        return self.non_merger_probability(texts) >= self.threshold
+
+    def evaluate(self, texts:List[str], merger_related:pd.Series)->Dict:
+        """Compares the skip decisions against the LLM labels. Precision is the share of skipped headlines that the LLM
+        labelled 'false', and merger recall is the share of merger related (or 'unable to tell') headlines not skipped."""
+        needs_llm = self._needs_llm(merger_related)
+        skipped = self.skip(texts)
+        mergers = needs_llm.sum()
+        return {'rows': int(len(needs_llm)),
+                'skip_rate': round(float(skipped.mean()), 3) if len(needs_llm) else 0.0,
+                'precision': round(float(((skipped) & (needs_llm == 0)).sum() / skipped.sum()), 3) if skipped.sum() else 1.0,
+                'merger_recall': round(float(1 - ((skipped) & (needs_llm == 1)).sum() / mergers), 3) if mergers else 1.0}
+
+    def reason(self, probability:float)->str:
+        return f"{prefilter_reason_prefix}: probability of not being merger related is {probability:.3f} (threshold {self.threshold})"
+
+
+def _training_filter(table:str)->str:
+    """Rows of the news table labelled by the LLM, i.e. excluding headlines previously skipped by the pre-filter itself"""
+    return f"FROM {table} WHERE Merger_Related IS NOT NULL AND (Reasons IS NULL OR Reasons NOT LIKE ?)"
+
+
+def training_signature(conn:sqlite3.Connection, table:str=tablename)->Tuple[int, int]|None:
+    """Returns the number and the largest rowid of the LLM labels in the news table, which change whenever new labels arrive,
+    or None if the news table doesn't exist"""
+    if not table_exists(conn, table):
+        return None
+    rows, max_rowid = conn.execute(f"SELECT COUNT(*), MAX(rowid) {_training_filter(table)}", (f"{prefilter_reason_prefix}%",)).fetchone()
+    return rows, max_rowid or 0
+
+
+def training_labels(conn:sqlite3.Connection, table:str=tablename)->pd.DataFrame:
+    """Returns the headlines and their LLM labels from the news table"""
+    return pd.read_sql_query(f"SELECT Text, Merger_Related {_training_filter(table)}", conn, params=(f"{prefilter_reason_prefix}%",))
+
+
+def fit_prefilter(df:pd.DataFrame, threshold:float, min_rows:int=200, min_merger_recall:float=0.98, holdout:float=0.2)->MergerPrefilter|None:
+    """Trains the pre-filter on the LLM labels. The model is first checked on held-out labels, and is only returned (refitted on all 
+    labels) if its merger recall meets the required minimum. Returns None if there is too little data or the check fails."""
+    logger = logging.getLogger('shared_app_logger')
+    labels = (df['Merger_Related'] != 'false')
+    if len(df) < min_rows or labels.sum() < 10 or (~labels).sum() < 10:
+        logger.info(f"Pre-filter not used, as there are too few LLM labels to train on ({len(df)} rows)")
+        return None
+
+    train_df, test_df = train_test_split(df, test_size=holdout, random_state=0, stratify=labels)
+    metrics = MergerPrefilter(threshold).fit(train_df['Text'].to_list(), train_df['Merger_Related']).evaluate(test_df['Text'].to_list(), test_df['Merger_Related'])
+    logger.info(f"Pre-filter held-out evaluation at threshold {threshold}: {metrics}")
+    if metrics['merger_recall'] < min_merger_recall:
+        logger.warning(f"Pre-filter not used, as its held-out merger recall {metrics['merger_recall']} is below {min_merger_recall}")
+        return None
+    return MergerPrefilter(threshold).fit(df['Text'].to_list(), df['Merger_Related'])
+
+
+def load_saved_prefilter(model_path:str, key:tuple)->Tuple[bool, MergerPrefilter|None]:
+    """Returns whether a pre-filter was saved for the given training signature and settings, and the saved pre-filter (None if the
+    saved outcome was not to use one). A missing, stale or unreadable file (e.g. saved by another scikit-learn version) is not found."""
+    try:
+        with open(model_path, 'rb') as f:
+            saved = pickle.load(f)
+    except FileNotFoundError:
+        return False, None
+    except Exception as e:
+        logging.getLogger('shared_app_logger').warning(f"Saved pre-filter {model_path} could not be read and is refitted: {e}")
+        return False, None
+    if saved.get('key') != key:
+        return False, None
+    return True, saved['prefilter']
+
+
+def save_prefilter(model_path:str, key:tuple, prefilter:MergerPrefilter|None):
+    """Saves the fitted pre-filter, or the outcome of not using one, with its training signature and settings. The file is replaced
+    atomically, so that a concurrent run never reads a partly written model."""
+    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+    temp_path = f"{model_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump({'key': key, 'prefilter': prefilter}, f)
+    os.replace(temp_path, model_path)
+
+
+def train_prefilter(conn:sqlite3.Connection, threshold:float, min_rows:int=200, min_merger_recall:float=0.98,
+                    holdout:float=0.2, table:str=tablename, model_path:str|None=None)->MergerPrefilter|None:
+    """Trains the pre-filter on the LLM labels stored in the news table (see fit_prefilter). If model_path is given, the fitted
+    pre-filter is saved there, and reused by later runs until new LLM labels arrive or the settings change."""
+    signature = training_signature(conn, table)
+    if signature is None:
+        return None
+    key = (signature, threshold, min_rows, min_merger_recall, holdout)
+    if model_path is not None:
+        found, prefilter = load_saved_prefilter(model_path, key)
+        if found:
+            logging.getLogger('shared_app_logger').info(f"Pre-filter reused from {model_path}, as no new LLM labels arrived ({signature[0]} rows)")
+            return prefilter
+    prefilter = fit_prefilter(training_labels(conn, table), threshold, min_rows=min_rows, min_merger_recall=min_merger_recall, holdout=holdout)
+    if model_path is not None:
+        save_prefilter(model_path, key, prefilter)
+    return prefilter
+
+
+async def atrain_prefilter(conn:sqlite3.Connection, threshold:float, min_rows:int=200, min_merger_recall:float=0.98,
+                           holdout:float=0.2, table:str=tablename, model_path:str|None=None)->MergerPrefilter|None:
+    """As train_prefilter, for use on an event loop. The database is read on the calling thread, which owns the connection, while
+    loading the saved pre-filter and fitting run in a worker thread, so that the other pipeline stages keep running."""
+    signature = training_signature(conn, table)
+    if signature is None:
+        return None
+    key = (signature, threshold, min_rows, min_merger_recall, holdout)
+    if model_path is not None:
+        found, prefilter = await asyncio.to_thread(load_saved_prefilter, model_path, key)
+        if found:
+            logging.getLogger('shared_app_logger').info(f"Pre-filter reused from {model_path}, as no new LLM labels arrived ({signature[0]} rows)")
+            return prefilter
+    prefilter = await asyncio.to_thread(fit_prefilter, training_labels(conn, table), threshold, min_rows=min_rows,
+                                        min_merger_recall=min_merger_recall, holdout=holdout)
+    if model_path is not None:
+        await asyncio.to_thread(save_prefilter, model_path, key, prefilter)
+    return prefilter
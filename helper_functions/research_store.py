@@ -0,0 +1,130 @@
+# Import relevant libraries
+import ast, json, logging, sqlite3
+import pandas as pd
+from dataclasses import dataclass
+from datetime import datetime
+from helper_functions.database import article_key, table_exists
+from helper_functions.utility import tablename
+from typing import Dict, List, Tuple
+
+runtable = 'research_runs'              # Set the tablename for the sqlite database table holding one row per research query run for an article
+rawtable = 'research_raw'               # Set the tablename for the sqlite database table holding the raw web search response of each run
+findingtable = 'research_findings'      # Set the tablename for the sqlite database table holding the structured findings of each run
+citationtable = 'research_citations'    # Set the tablename for the sqlite database table holding the citation urls of each run
+legacytable = f'{tablename}_websearch_query1'    # Table of query 1 results previously saved as str(tuple) blobs
+
+
+@dataclass
+class ResearchResult:
+    """Result of one research query for an article. Each finding has a subject (e.g. the merger party, or '' if the query covers
+    all parties), an explanation with [citation source number] references into citations, and an answer. The field names are kept
+    so that the findings can be shown with the query's own column names."""
+    raw_text: str
+    citations: List[str]
+    findings: List[Dict[str, str]]
+    subject_field: str = 'merger_party'
+    answer_field: str = 'goods_services_sold_in_Singapore'
+
+
+def _create_tables(conn:sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {runtable} (
+            Run_ID INTEGER PRIMARY KEY,
+            Article_Key TEXT NOT NULL,
+            Query TEXT NOT NULL,
+            Subject_Field TEXT NOT NULL,
+            Answer_Field TEXT NOT NULL,
+            Created TEXT NOT NULL
+            )
+        """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{runtable}_article_key ON {runtable} (Article_Key, Query)")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {rawtable} (
+            Run_ID INTEGER PRIMARY KEY REFERENCES {runtable} (Run_ID),
+            Raw_Text TEXT NOT NULL
+            )
+        """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {findingtable} (
+            Run_ID INTEGER NOT NULL REFERENCES {runtable} (Run_ID),
+            Finding_No INTEGER NOT NULL,
+            Subject TEXT NOT NULL,
+            Explanation TEXT NOT NULL,
+            Answer TEXT NOT NULL,
+            PRIMARY KEY (Run_ID, Finding_No)
+            )
+        """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {citationtable} (
+            Run_ID INTEGER NOT NULL REFERENCES {runtable} (Run_ID),
+            Citation_No INTEGER NOT NULL,
+            Url TEXT NOT NULL,
+            PRIMARY KEY (Run_ID, Citation_No)
+            )
+        """)
+
+
+def _insert_run(conn:sqlite3.Connection, key:str, query:str, result:ResearchResult, created:str):
+    run_id = conn.execute(f"INSERT INTO {runtable} (Article_Key, Query, Subject_Field, Answer_Field, Created) VALUES (?, ?, ?, ?, ?)",
+                          (key, query, result.subject_field, result.answer_field, created)).lastrowid
+    conn.execute(f"INSERT INTO {rawtable} (Run_ID, Raw_Text) VALUES (?, ?)", (run_id, result.raw_text))
+    conn.executemany(f"INSERT INTO {findingtable} (Run_ID, Finding_No, Subject, Explanation, Answer) VALUES (?, ?, ?, ?, ?)",
+                     [(run_id, i + 1, item.get('subject') or '', item.get('explanation') or '', item.get('answer') or '')
+                      for i, item in enumerate(result.findings)])
+    conn.executemany(f"INSERT INTO {citationtable} (Run_ID, Citation_No, Url) VALUES (?, ?, ?)",
+                     [(run_id, i + 1, url) for i, url in enumerate(result.citations)])
+
+
+def save_research_runs(conn:sqlite3.Connection, query:str, results:List[Tuple[str, ResearchResult]]):
+    """Saves the research results of a query, given as (article key, result) pairs, each as a new run of the query for the article"""
+    ensure_research_schema(conn)
+    created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        for key, result in results:
+            _insert_run(conn, key, query, result, created)
+
+
+def _parse_legacy_query1(blob:str)->ResearchResult:
+    """Parses a query 1 result saved as str((raw text, citations, structured output JSON)), without evaluating any code"""
+    raw_text, citations, structured = ast.literal_eval(blob)
+    findings = [{'subject': item.get('merger_party', ''), 'explanation': item.get('explanation', ''),
+                 'answer': item.get('goods_services_sold_in_Singapore', '')} for item in json.loads(structured)['response']]
+    return ResearchResult(raw_text=raw_text, citations=list(citations or []), findings=findings)
+
+
+def ensure_research_schema(conn:sqlite3.Connection):
+    """Creates the research tables, if they don't exist, and migrates the query 1 results previously saved as str(tuple) blobs
+    once. The legacy table is then renamed, so that it is kept but not migrated again."""
+    _create_tables(conn)
+    if not table_exists(conn, legacytable):
+        return
+    logger = logging.getLogger('shared_app_logger')
+    results, failed = [], 0
+    for published, source, text, blob in conn.execute(f"SELECT Published_Date, Source, Text, Query1 FROM {legacytable}").fetchall():
+        try:
+            results.append((article_key(published, source, text), _parse_legacy_query1(blob)))
+        except (ValueError, SyntaxError, TypeError, KeyError) as e:
+            failed += 1
+            logger.warning(f"Research migration - unable to parse query 1 result of '{text}': {e}")
+    created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        for key, result in results:
+            _insert_run(conn, key, 'Query1', result, created)
+        conn.execute(f"ALTER TABLE {legacytable} RENAME TO {legacytable}_migrated")
+    logger.info(f"Research migration - {len(results)} query 1 results migrated to the research tables, {failed} unparseable")
+
+
+def research_for_article(conn:sqlite3.Connection, key:str)->Dict[str, Dict[str, pd.DataFrame]]:
+    """Returns the latest run of each research query for the article, keyed by query, each with its 'findings' (named with the query's
+    own field names) and 'citations' (numbered from 1) dataframes"""
+    runs = conn.execute(f"""SELECT Run_ID, Query, Subject_Field, Answer_Field FROM {runtable}
+                        WHERE Run_ID IN (SELECT MAX(Run_ID) FROM {runtable} WHERE Article_Key = ? GROUP BY Query) ORDER BY Query""", (key,)).fetchall()
+    research = {}
+    for run_id, query, subject_field, answer_field in runs:
+        findings = pd.read_sql_query(f"SELECT Subject, Explanation, Answer FROM {findingtable} WHERE Run_ID = ? ORDER BY Finding_No", conn, params=(run_id,))
+        findings = findings.rename(columns={'Subject': subject_field, 'Explanation': 'explanation', 'Answer': answer_field})
+        if (findings[subject_field] == '').all():
+            findings = findings.drop(columns=[subject_field])
+        citations = pd.read_sql_query(f"SELECT Citation_No, Url AS Urls FROM {citationtable} WHERE Run_ID = ? ORDER BY Citation_No", conn, params=(run_id,))
+        research[query] = {'findings': findings, 'citations': citations.set_index('Citation_No').rename_axis(None)}
+    return research
@@ -0,0 +1,151 @@
+# Import relevant libraries
+import asyncio, time
+from collections import deque
+from helper_functions.utility import count_tokens
+from tqdm.asyncio import tqdm_asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Rate limits for each LLM / search provider, based on the account tiers currently in use. Update when a tier is upgraded.
+# rpm - requests per minute, tpm - tokens per minute (None if not enforced by provider), max_in_flight - cap on concurrent requests
+provider_limits = {
+    'groq': {'rpm': 30, 'tpm': 30000, 'max_in_flight': 5},            # meta-llama/llama-4-scout-17b-16e-instruct free tier: 30 RPM, 30K TPM
+    'openai': {'rpm': 500, 'tpm': 200000, 'max_in_flight': 50},        # gpt-4o-mini Tier 1: 500 RPM, 200K TPM
+    'perplexity': {'rpm': 50, 'tpm': None, 'max_in_flight': 10},       # sonar-pro Tier 0 and Tier 1: 50 RPM
+    'gemini': {'rpm': 1000, 'tpm': 1000000, 'max_in_flight': 50},      # Gemini Tier 1: 1K RPM, 1M TPM
+}
+
+
+def estimate_tokens(prompt:List[Dict]|str, maxtokens:int=0)->int:
+    """Rough estimate of the tokens a request consumes against the provider's TPM limit, i.e. the prompt tokens
+    plus the maximum number of completion tokens requested."""
+    if isinstance(prompt, str):
+        text = prompt
+    else:
+        text = " ".join([str(message.get('content', '')) for message in prompt])
+    return count_tokens(text) + maxtokens
+
+
+def _usage_tokens(response:Any)->int|None:
+    """Extracts the actual number of tokens used from a provider response, if reported."""
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        total = getattr(usage, 'total_tokens', None)
+        if total is None and getattr(usage, 'input_tokens', None) is not None:
+            total = usage.input_tokens + (usage.output_tokens or 0)
+        return total
+    usage_metadata = getattr(response, 'usage_metadata', None)
+    if usage_metadata is not None:
+        return getattr(usage_metadata, 'total_token_count', None)
+    return None
+
+
+def _is_rate_limit_error(error:BaseException)->bool:
+    """Checks whether the error, or any error it was raised from, is a HTTP 429 rate limit response."""
+    while error is not None:
+        if getattr(error, 'status_code', None) == 429 or getattr(error, 'code', None) == 429:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class RateLimitScheduler:
+    """Asynchronous scheduler that paces requests to a provider within its requests-per-minute and tokens-per-minute
+    limits over a sliding window, while keeping a steady number of requests in flight."""
+
+    def __init__(self, name:str, rpm:int, tpm:int|None=None, max_in_flight:int=10, window:float=60.0,
+                 safety_margin:float=0.9, max_retries:int=3):
+        self.name = name
+        # Keep some headroom below the published limits, since token counts are only estimates
+        self.rpm = max(1, int(rpm*safety_margin))
+        self.tpm = int(tpm*safety_margin) if tpm else None
+        self.max_in_flight = max_in_flight
+        self.window = window
+        self.max_retries = max_retries
+        # Each ledger entry is [start time, tokens] for a request started within the sliding window
+        self._ledger = deque()
+        self._cooldown_until = 0.0
+        self._loop = None
+
+    def _bind_loop(self):
+        """asyncio primitives are tied to an event loop, and the scripts call asyncio.run() more than once,
+        so recreate them whenever the scheduler is used from a new event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def _reserve(self, tokens:int)->List:
+        """Waits until a request of the given size fits within both limits, then records it in the ledger."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._cooldown_until:
+                    await asyncio.sleep(self._cooldown_until - now)
+                    continue
+                while self._ledger and now - self._ledger[0][0] >= self.window:
+                    self._ledger.popleft()
+                tokens_in_window = sum(entry[1] for entry in self._ledger)
+                if len(self._ledger) < self.rpm and (self.tpm is None or not self._ledger or tokens_in_window + tokens <= self.tpm):
+                    entry = [now, tokens]
+                    self._ledger.append(entry)
+                    return entry
+                # Sleep until the oldest request leaves the sliding window
+                await asyncio.sleep(max(self.window - (now - self._ledger[0][0]), 0.01))
+
+    async def submit(self, request:Callable[[], Awaitable[Any]], tokens:int=0)->Any:
+        """Runs the request coroutine once it fits within the rate limits. The token reservation is replaced by the
+        actual usage when the provider reports it, and rate limit (HTTP 429) errors pause the scheduler before retrying."""
+        self._bind_loop()
+        async with self._in_flight:
+            attempt = 0
+            while True:
+                entry = await self._reserve(tokens)
+                try:
+                    response = await request()
+                except Exception as e:
+                    if attempt < self.max_retries and _is_rate_limit_error(e):
+                        self._cooldown_until = max(self._cooldown_until, time.monotonic() + 5*2**attempt)
+                        attempt += 1
+                        continue
+                    raise
+                if getattr(response, '_from_cache', False):
+                    # Served from the LLM response cache without a network call, so release the reserved slot
+                    try:
+                        self._ledger.remove(entry)
+                    except ValueError:
+                        pass
+                else:
+                    actual_tokens = _usage_tokens(response)
+                    if actual_tokens is not None:
+                        entry[1] = actual_tokens
+                return response
+
+    async def gather(self, requests:List[Callable[[], Awaitable[Any]]], tokens:List[int], desc:str="Processing tasks", 
+                     return_exceptions:bool=False, on_result:Callable[[int, Any], None]|None=None)->List[Any]:
+        """Submits all requests to the scheduler and returns their results in the same order. If given, on_result is called
+        with the position and result of each request as soon as it completes, e.g. to persist it. If return_exceptions, a failed 
+        request (including a failure in on_result) is returned as its exception instead of discarding all other results."""
+        async def run(i:int, request:Callable[[], Awaitable[Any]], token:int)->Any:
+            try:
+                result = await self.submit(request, token)
+                if on_result is not None:
+                    on_result(i, result)
+                return result
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        tasks = [run(i, request, token) for i, (request, token) in enumerate(zip(requests, tokens))]
+        return await tqdm_asyncio.gather(*tasks, desc=desc)
+
+
+# Shared scheduler instances, one per provider, so that all scripts in the same process draw from the same budget
+_schedulers: Dict[str, RateLimitScheduler] = {}
+
+def get_scheduler(provider:str)->RateLimitScheduler:
+    """Returns the shared rate limit scheduler for the given provider."""
+    if provider not in _schedulers:
+        _schedulers[provider] = RateLimitScheduler(name=provider, **provider_limits[provider])
+    return _schedulers[provider]
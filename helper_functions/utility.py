@@ -1,40 +1,152 @@
 # Import relevant libraries
-import hmac, logging, openai, os, time, tiktoken
+from __future__ import annotations
+import hmac, logging, openai, os, threading, time, tiktoken
 import streamlit as st
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from google import genai
-from groq import Groq
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+from functools import lru_cache
+from helper_functions.cache import MemoryCache, SQLiteCache, make_cache_key
 from openai import OpenAI, AsyncOpenAI
 from openai.types.chat import ChatCompletion
-from pydantic import BaseModel
-from typing import Dict, List, Literal
+from openai.types.responses import ParsedResponse, Response
+from pydantic import BaseModel, ValidationError
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Literal
+
+if TYPE_CHECKING:
+    from groq import Groq
 
 # Load environment variables
 if not load_dotenv(".env"):
     pass
 
 # Define variables
-Groq_model = st.secrets['GROQ_MODEL_NAME']                      #os.getenv("GROQ_MODEL_NAME")
-Gemini_model = st.secrets['GEMINI_MODEL_NAME']                  #os.getenv("GEMINI_MODEL_NAME")    
-OAI_model = st.secrets['OPENAI_MODEL_NAME']                     #os.getenv("OPENAI_MODEL_NAME")
-Perplexity_model = st.secrets['PERPLEXITY_MODEL_NAME']              #os.getenv("PERPLEXITY_MODEL_NAME")  
-Groq_client = OpenAI(api_key=st.secrets['GROQ_API_KEY'], base_url="https://api.groq.com/openai/v1")   #os.getenv("GROQ_API_KEY")
-Google_client = genai.Client()
-OAI_client = OpenAI(api_key=st.secrets['OPENAI_API_KEY'])                                             #os.getenv("OPENAI_API_KEY")
-Perplexity_client = OpenAI(api_key=st.secrets['PERPLEXITY_API_KEY'], base_url="https://api.perplexity.ai")             #os.getenv("PERPLEXITY_API_KEY")
-async_Groq_client = AsyncOpenAI(api_key=st.secrets['GROQ_API_KEY'], base_url="https://api.groq.com/openai/v1")   #os.getenv("GROQ_API_KEY")
-async_OAI_client = AsyncOpenAI(api_key=st.secrets['OPENAI_API_KEY'])                                             #os.getenv("OPENAI_API_KEY")
-async_Perplexity_client = AsyncOpenAI(api_key=st.secrets['PERPLEXITY_API_KEY'], base_url="https://api.perplexity.ai")    #os.getenv("PERPLEXITY_API_KEY")
-Chat_Groq_llm = ChatGroq(model=Groq_model, temperature=0,max_retries=1, max_tokens=1024, n=1)  
-Chat_OAI_llm = ChatOpenAI(model=OAI_model, temperature=0,max_retries=1, max_tokens=1024, n=1)
+# Secrets holding the model name of each provider, read at call time by get_model so that a missing secret only fails the calls that need it
+_model_secrets = {'groq': 'GROQ_MODEL_NAME',                 #os.getenv("GROQ_MODEL_NAME")
+                  'google': 'GEMINI_MODEL_NAME',             #os.getenv("GEMINI_MODEL_NAME")
+                  'openai': 'OPENAI_MODEL_NAME',             #os.getenv("OPENAI_MODEL_NAME")
+                  'perplexity': 'PERPLEXITY_MODEL_NAME'}     #os.getenv("PERPLEXITY_MODEL_NAME")
+
+
+def _google_client():
+    # google.genai takes about a second to import, so it is only imported by the scripts that use it
+    from google import genai
+    return genai.Client()
+
+
+def _tavily_client(asynchronous:bool):
+    from tavily import AsyncTavilyClient, TavilyClient
+    return AsyncTavilyClient() if asynchronous else TavilyClient()       #os.getenv("TAVILY_API_KEY")
+
+
+def _chat_groq():
+    from langchain_groq import ChatGroq
+    return ChatGroq(model=get_model('groq'), temperature=0,max_retries=1, max_tokens=1024, n=1)
+
+
+def _chat_openai():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=get_model('openai'), temperature=0,max_retries=1, max_tokens=1024, n=1)
+
+
+# Factories of the provider clients, keyed by (provider, asynchronous). Each client is built on first use and shared afterwards.
+_client_factories: Dict[tuple, Callable[[], Any]] = {
+    ('groq', False): lambda: OpenAI(api_key=st.secrets['GROQ_API_KEY'], base_url="https://api.groq.com/openai/v1"),             #os.getenv("GROQ_API_KEY")
+    ('groq', True): lambda: AsyncOpenAI(api_key=st.secrets['GROQ_API_KEY'], base_url="https://api.groq.com/openai/v1"),
+    ('openai', False): lambda: OpenAI(api_key=st.secrets['OPENAI_API_KEY']),                                                    #os.getenv("OPENAI_API_KEY")
+    ('openai', True): lambda: AsyncOpenAI(api_key=st.secrets['OPENAI_API_KEY']),
+    ('perplexity', False): lambda: OpenAI(api_key=st.secrets['PERPLEXITY_API_KEY'], base_url="https://api.perplexity.ai"),      #os.getenv("PERPLEXITY_API_KEY")
+    ('perplexity', True): lambda: AsyncOpenAI(api_key=st.secrets['PERPLEXITY_API_KEY'], base_url="https://api.perplexity.ai"),
+    ('google', False): _google_client,
+    ('google', True): lambda: get_client('google').aio,
+    ('tavily', False): lambda: _tavily_client(asynchronous=False),
+    ('tavily', True): lambda: _tavily_client(asynchronous=True),
+    ('chat_groq', False): _chat_groq,
+    ('chat_openai', False): _chat_openai,
+}
+_clients: Dict[tuple, Any] = {}
+_clients_lock = threading.RLock()
+
+# Client names previously built at import, kept so that existing imports still work, mapped to their (provider, asynchronous)
+_legacy_clients = {'Groq_client': ('groq', False), 'async_Groq_client': ('groq', True),
+                   'OAI_client': ('openai', False), 'async_OAI_client': ('openai', True),
+                   'Perplexity_client': ('perplexity', False), 'async_Perplexity_client': ('perplexity', True),
+                   'Google_client': ('google', False), 'Chat_Groq_llm': ('chat_groq', False), 'Chat_OAI_llm': ('chat_openai', False)}
+# Model names previously read at import, kept so that existing imports still work, mapped to their provider
+_legacy_models = {'Groq_model': 'groq', 'Gemini_model': 'google', 'OAI_model': 'openai', 'Perplexity_model': 'perplexity'}
+
+
+def get_client(provider:Literal['groq','openai','perplexity','google','tavily','chat_groq','chat_openai'], asynchronous:bool=False)->Any:
+    """Returns the shared client of the provider, building it on first use. The OpenAI compatible providers, Google and Tavily
+    have a synchronous and an asynchronous client; chat_groq and chat_openai are the LangChain chat models used by the chat agent."""
+    key = (provider, asynchronous)
+    if key not in _client_factories:
+        raise MyError(f"No {'asynchronous' if asynchronous else 'synchronous'} client is available for provider '{provider}'")
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            # Another thread may have built the client while this one waited for the lock
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _client_factories[key]()
+    return client
+
+
+def get_model(provider:Literal['groq','openai','perplexity','google'])->str:
+    """Returns the name of the model used with the provider, read from the secrets on each call. Call it where the model is used
+    rather than at import, so that importing a script does not read the secrets."""
+    if provider not in _model_secrets:
+        raise MyError(f"No model is configured for provider '{provider}'")
+    return st.secrets[_model_secrets[provider]]
+
+
+def __getattr__(name:str)->Any:
+    """Resolves the legacy model names and provider clients lazily, e.g. `from helper_functions.utility import OAI_client`.
+    Importing a name resolves it, so scripts should call get_model and get_client at the point of use instead."""
+    if name in _legacy_models:
+        return get_model(_legacy_models[name])
+    if name in _legacy_clients:
+        return get_client(*_legacy_clients[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 tempscrappedfolder = 'temp_scraped_data'    # Set the folder name used to temporarily store scrapped data
 WIPfolder = 'temp' # Set the folder name used to hold temporary files
 tablename = 'news'    # Set the base tablename for the sqlite database table used to store web scrapped data 
 dbfolder = 'database'
 scrapped_from_date =  '18 Nov 2025'     # Set the date from which news are to be scrapped, in the format day month year, e.g. 01 Jan 2025 or None
+llm_cache_enabled = True               # Set to False to bypass the persistent LLM response cache for all calls
+llm_cache_ttl_days = 30                # Cached LLM responses older than this are treated as stale and refetched
+llm_cache_max_entries = 50000          # Least recently used LLM responses beyond this number are evicted
+near_duplicate_threshold = 0.8         # Headlines with the same proper nouns and shingle Jaccard similarity of at least this value are treated as near-duplicates
+near_duplicate_lookback_days = 30      # Incoming headlines are matched against news articles published within this number of days
+classifier_batch_size = 10             # Number of headlines packed into each OpenAI classification request. Set to 1 to send one headline per request
+prefilter_enabled = True               # Set to False to send every headline to the LLM, without the local pre-filter
+prefilter_threshold = 0.95             # Headlines scored by the local pre-filter as non-merger with at least this probability skip the LLM
+prefilter_min_merger_recall = 0.98     # The pre-filter is only used if its held-out merger recall is at least this value
+prefilter_min_training_rows = 200      # The pre-filter is only trained once the news table has at least this number of LLM labels
+prefilter_model_file = 'prefilter.pkl' # File in the database folder holding the fitted pre-filter, reused until new LLM labels arrive
+research_cache_ttl_days = 30           # Cached query 1 research of a merger party older than this is treated as stale and searched again
+entity_match_threshold = 0.75          # Merger party names with normalised trigram Jaccard similarity of at least this value resolve to the same entity
+news_page_size = 100                   # Number of news articles shown per page of Table 1 in the dashboard
+chat_memory_ttl_days = 14              # Chat conversations idle for longer than this are removed from the chat memory
+chat_memory_max_threads = 500          # Least recently used chat conversations beyond this number are removed from the chat memory
+chat_memory_max_checkpoints = 20       # Only this number of the latest checkpoints of each chat conversation are kept
+chat_summary_token_threshold = 2048    # The chat conversation is summarised once the messages in its history exceed this number of tokens
+web_search_cache_ttl_days = 1          # Cached Tavily web search results older than this are treated as stale and searched again
+web_search_cache_max_entries = 5000    # Least recently used Tavily web search results beyond this number are evicted from the database
+web_search_memory_max_entries = 256    # Least recently used Tavily web search results beyond this number are evicted from process memory
+web_search_token_budget = 3000         # Maximum number of tokens of page content passages passed to the chat agent per web search
+web_search_passage_words = 120         # Page content of web search results is split into passages of about this number of words
+
+# Persistent cache of LLM responses, keyed by a hash of the full request, so that reruns do not pay for the same call twice
+llm_cache = SQLiteCache(os.path.join(dbfolder, 'llm_cache.db'), table='llm_responses', ttl_seconds=llm_cache_ttl_days*24*3600,
+                        max_entries=llm_cache_max_entries)
+# Persistent cache of the query 1 research of each merger party, keyed by the normalised party name, so that a party appearing in several
+# merger cases or follow-up releases is only searched again once its research is stale
+research_cache = SQLiteCache(os.path.join(dbfolder, 'llm_cache.db'), table='party_research', ttl_seconds=research_cache_ttl_days*24*3600)
+# Cache of the chat agent's Tavily web search results, keyed by the normalised query and search options, held in process memory in
+# front of the database, so that officers asking the same question again are answered without another search
+web_search_cache = SQLiteCache(os.path.join(dbfolder, 'llm_cache.db'), table='web_search', ttl_seconds=web_search_cache_ttl_days*24*3600,
+                               max_entries=web_search_cache_max_entries)
+web_search_memory_cache = MemoryCache(max_entries=web_search_memory_max_entries, ttl_seconds=web_search_cache_ttl_days*24*3600)
                            
 
 # Set up custom exception class
@@ -83,19 +195,60 @@ def set_collection_date(date:str=None, lookback:int=2):
         return temp.strftime("%d %b %Y")
 
 
+@lru_cache(maxsize=None)
+def _encoding(model:str)->tiktoken.Encoding:
+    """Looks up the tiktoken encoding of the model once, instead of on every token count"""
+    return tiktoken.encoding_for_model(model)
+
+
 def count_tokens(text:str, model:str="gpt-4o-mini")->int:
     """This function is for calculating the tokens given the input message. This is a simplified implementation 
     that is good enough for a rough estimation when using OpenAI models.
     """
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    return len(_encoding(model).encode(text))
+
+
+def _complete_response(response:Response, schema:BaseModel|None)->bool:
+    """Whether a Responses API response finished normally and, if a schema is given, was parsed into it, and can thus be cached"""
+    if getattr(response, 'status', None) != 'completed':
+        return False
+    return schema is None or getattr(response, 'output_parsed', None) is not None
+
+
+def _complete_completion(response:ChatCompletion, schema:BaseModel|None)->bool:
+    """Whether a chat completion stopped normally (e.g. was not cut off at max tokens) and, if a schema is given, its content
+    validates against it, and can thus be cached"""
+    if len(response.choices) == 0 or response.choices[0].finish_reason != 'stop':
+        return False
+    if schema is None:
+        return True
+    try:
+        schema.model_validate_json(response.choices[0].message.content or '')
+        return True
+    except ValidationError:
+        return False
 
 
 # Set up synchronous LLM API response
 def llm_output(client:Groq|OpenAI, model:str, sys_msg:str, input:str, schema:BaseModel|None=None, maxtokens:int=2048, 
-               store:bool=False, temperature:int=0, delay_in_seconds:float=0.0)-> BaseModel|ChatCompletion:
-    """ Takes in an input text or query and sends to selected LLM API to get response"""
+               store:bool=False, temperature:int=0, delay_in_seconds:float=0.0, use_cache:bool=True)-> BaseModel|ChatCompletion:
+    """ Takes in an input text or query and sends to selected LLM API to get response. Responses are served from the 
+    persistent LLM response cache where available, unless use_cache is False."""
     try:
+        # Return the cached response, if the identical request has been sent before
+        cache_key = None
+        if use_cache and llm_cache_enabled:
+            cache_key = make_cache_key(api='responses', provider=str(client.base_url), model=model,
+                                       messages=[sys_msg, f"<incoming-text> {input} </incoming-text>"],
+                                       schema=schema.model_json_schema() if schema is not None else None, 
+                                       temperature=temperature, maxtokens=maxtokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                response = (ParsedResponse[schema] if schema is not None else Response).model_validate_json(cached)
+                # Flag the response so that the rate limit scheduler releases the slot reserved for this request
+                object.__setattr__(response, '_from_cache', True)
+                return response
+
          # Introduce time delay, if necessary, so as to keep within rate limit for LLM API request.
         if delay_in_seconds > 0:
              time.sleep(delay_in_seconds)
@@ -135,6 +288,9 @@ def llm_output(client:Groq|OpenAI, model:str, sys_msg:str, input:str, schema:Bas
                 max_output_tokens=maxtokens,
                 store=store
                 )
+        # Truncated or malformed responses are not cached, so that a rerun requests them again
+        if cache_key is not None and _complete_response(response, schema):
+            llm_cache.set(cache_key, response.model_dump_json())
         return response
     
     except openai.APIError as e:
@@ -145,8 +301,23 @@ def llm_output(client:Groq|OpenAI, model:str, sys_msg:str, input:str, schema:Bas
 
 # Set up asynchronous LLM API response
 async def async_llm_output(client:Groq|OpenAI, model:str, prompt_messages:List[Dict], schema:BaseModel|None, 
-                           maxtokens:int=2048, store:bool=False, temperature:int=0)-> BaseModel|ChatCompletion:
+                           maxtokens:int=2048, store:bool=False, temperature:int=0, use_cache:bool=True)-> BaseModel|ChatCompletion:
+    """Sends the prompt messages to selected LLM API asynchronously to get response. Responses are served from the 
+    persistent LLM response cache where available, unless use_cache is False."""
     try:
+        # Return the cached response, if the identical request has been sent before
+        cache_key = None
+        if use_cache and llm_cache_enabled:
+            cache_key = make_cache_key(api='chat.completions', provider=str(client.base_url), model=model, messages=prompt_messages,
+                                       schema=schema.model_json_schema() if schema else None, 
+                                       temperature=temperature, maxtokens=maxtokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                response = ChatCompletion.model_validate_json(cached)
+                # Flag the response so that the rate limit scheduler releases the slot reserved for this request
+                object.__setattr__(response, '_from_cache', True)
+                return response
+
         # The case when LLM response is expected to follow a particular schema
         if schema:
                 output_json_structure = {"type": "json_schema",
@@ -167,6 +338,9 @@ async def async_llm_output(client:Groq|OpenAI, model:str, prompt_messages:List[D
             store=store,
             response_format=output_json_structure
         )
+        # Truncated or malformed completions are not cached, so that a rerun requests them again
+        if cache_key is not None and _complete_completion(response, schema):
+            llm_cache.set(cache_key, response.model_dump_json())
         return response
     
     except openai.APIError as e:
@@ -1,10 +1,15 @@
 # Import relevant libraries
 import pandas as pd
-import logging, os, random, requests
+import logging, random, requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 from helper_functions.utility import MyError
-from typing import List
+from scrapers.fetcher import Cancellation, PageFetcher
+from scrapers.registry import ScraperPlugin, register_scraper
+from scrapers.scraper_state import get_high_water_mark, item_fingerprint
+from typing import Dict, Iterator, List
+
+source_name = 'Australian Competition & Consumer Commission'
 
 # list of user agents to be used when executing html request
 _user_agents = [
@@ -22,67 +27,98 @@ _user_agents = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
 ]
 
-# Function to extract titles and first paragraphs from ACCC media press releases
-def get_ACCC_press_release(fromdate: str, folder:str,  user_agents:List[str]=_user_agents)->pd.DataFrame:
+# Function to parse the news listings on an ACCC news centre page
+def parse_ACCC_listing(html:str)->List[Dict]:
+    """Extracts the published date (in the format day month year, e.g. 01 Jul 2025) and the title and first paragraph
+    of each news listing on an ACCC news centre page, ordered from the most recent"""
+    # parses the extracted html
+    soup = BeautifulSoup(html, "html.parser")
+
+    # Extract the published dates, in the format day month year (e.g. 01 Jul 2025), for all the news listings on the page
+    date = soup.find_all("div", class_="accc-date-card__header col-12 col-md-2")
+    date_component = [{"Published_Date": ele.find("span", class_="accc-date-card--publish--day").get_text().strip() + ' ' + 
+                    ele.find("span", class_="accc-date-card--publish--month").get_text().strip() + ' ' + 
+                    ele.find("span", class_="accc-date-card--publish--year").get_text().strip()} for ele in date]
+
+    # Get the titles and first paragraphs for all the news listings on the page
+    content = soup.find_all("div", class_="accc-date-card__body col-12 col-md-10")
+    text_component = [{"Text": ele.find("div", class_="field--name-node-title").get_text().strip() + '. ' + 
+                    ele.find("div", class_="field--name-field-acccgov-summary").get_text().strip()} for ele in content]
+
+    # For each news listing, merge the dictionary containing the published dates to the dictionary of corresponding text
+    return [item[0]|item[1] for item in zip(date_component,text_component)]
+
+
+def _to_frame(listing:List[Dict], fromdate:str)->pd.DataFrame:
+    """Converts news listings to a dataframe of the media releases published from the given date onwards"""
+    # convert to dataframe
+    df= pd.DataFrame(listing, columns=['Published_Date', 'Text'])
+    # Filter for all news listings with published dates more recent than the specified date
+    df= df[pd.to_datetime(df['Published_Date'], format='%d %b %Y') >= datetime.strptime(fromdate, '%d %b %Y')]
+    # Add the news source
+    df['Source'] = source_name
+    # Add the extraction timestamp
+    df['Extracted_Date'] = datetime.now().date().strftime("%Y-%m-%d")
+    # Convert the publish date format
+    df['Published_Date'] = df['Published_Date'].apply(lambda x: datetime.strptime(x, '%d %b %Y').strftime("%Y-%m-%d"))
+    return df[['Published_Date', 'Source', 'Extracted_Date', 'Text']]
+
+
+# Function to extract titles and first paragraphs from ACCC media press releases, one news centre page at a time
+def iter_ACCC_press_release(fromdate: str, user_agents:List[str]=_user_agents, incremental:bool=True, prefetch:int=3,
+                            cancellation:Cancellation|None=None)->Iterator[pd.DataFrame]:
+    """Scrapes ACCC media releases published from the given date onwards, ordered from the most recent, yielding the media releases
+    of each news centre page as soon as it is parsed. If incremental, paging stops at the source's high-water mark."""
     # Retrieving the shared logger
     logger = logging.getLogger('shared_app_logger')
-    # initialising an empty list to contain the desired media releases
-    listing = []
     # randomising the user agent to be added to the request header
     headers = {"User-Agent": random.choice(user_agents)}
+    fetcher = PageFetcher(headers=headers, cancellation=cancellation)
     
     try:
-        i = 0
-        while True:
-            # Start from the first page of ACCC media release site ,which also contains the most recent news releases.
-            url = f"https://www.accc.gov.au/news-centre?type=accc_news&layout=full_width&view_args=accc_news&items_per_page=25&page={i}" 
-            response = requests.get(url, headers=headers)
-            # raises error in the event of bad responses
-            response.raise_for_status()
-            # parses the extracted html
-            soup = BeautifulSoup(response.text, "html.parser")
-        
-            # Extract the published dates, in the format day month year (e.g. 01 Jul 2025), for all the news listings on the page
-            date = soup.find_all("div", class_="accc-date-card__header col-12 col-md-2")
-            date_component = [{"Published_Date": ele.find("span", class_="accc-date-card--publish--day").get_text().strip() + ' ' + 
-                            ele.find("span", class_="accc-date-card--publish--month").get_text().strip() + ' ' + 
-                            ele.find("span", class_="accc-date-card--publish--year").get_text().strip()} for ele in date]
-        
-            # Get the titles and first paragraphs for all the news listings on the page
-            content = soup.find_all("div", class_="accc-date-card__body col-12 col-md-10")
-            text_component = [{"Text": ele.find("div", class_="field--name-node-title").get_text().strip() + '. ' + 
-                            ele.find("div", class_="field--name-field-acccgov-summary").get_text().strip()} for ele in content]
-        
-            # For each news listing, merge the dictionary containing the published dates to the dictionary of corresponding text
-            news_extract = [item[0]|item[1] for item in zip(date_component,text_component)]
-            listing.extend(news_extract)
-
-            # If the last published date on the page is still more recent than the user input date, then continue to the next page
-            # Else stop if the last published date on the page is already earlier than user input date
-            if datetime.strptime(date_component[-1]['Published_Date'], '%d %b %Y') >= datetime.strptime(fromdate, '%d %b %Y'):
-                i = i+1
-            else:
-                break
-
-        # convert to dataframe
-        df= pd.DataFrame(listing)
-        # Filter for all news listings with published dates more recent than the specified date
-        df= df[pd.to_datetime(df['Published_Date']) >= datetime.strptime(fromdate, '%d %b %Y')]
-        if len(df) == 0:
-            logger.info(f"No media releases dated from '{fromdate}' downloaded from ACCC")
-        else:
-            # Add the news source
-            df['Source'] = 'Australian Competition & Consumer Commission'
-            # Add the extraction timestamp
-            df['Extracted_Date'] = datetime.now().date().strftime("%Y-%m-%d")
-            # Convert the publish date format
-            df['Published_Date'] = df['Published_Date'].apply(lambda x: datetime.strptime(x, '%d %b %Y').strftime("%Y-%m-%d"))
-            df = df[['Published_Date', 'Source', 'Extracted_Date', 'Text']]
-            # Export as csv
-            df.to_csv(os.path.join(folder,f'ACCC_from_{fromdate}.csv'), index=False)
-            # Update log upon successful scraping
-            logger.info(f"Media releases dated from '{fromdate}' successfully downloaded from ACCC")
+        # Retrieve the (published date, fingerprint) of the newest media release seen in previous runs, if any
+        high_water_mark = get_high_water_mark(source_name) if incremental else None
+        # Start from the first page of ACCC media release site ,which also contains the most recent news releases.
+        pages = fetcher.iter_pages(lambda i: f"https://www.accc.gov.au/news-centre?type=accc_news&layout=full_width&view_args=accc_news&items_per_page=25&page={i}",
+                                   prefetch=prefetch)
+        try:
+            for i, page in enumerate(pages):
+                # A 304 only means the page is unchanged since it was last fetched, not that its media releases were saved (e.g. if that
+                # run failed before writing), so the saved body is parsed and the high-water mark decides where to stop
+                if page.not_modified:
+                    logger.info(f"ACCC Scraper - page {i} unchanged since previous fetch (HTTP 304), using the saved page")
+
+                news_extract = parse_ACCC_listing(page.text)
+                # Stop if there are no more news listings
+                if len(news_extract) == 0:
+                    break
+
+                # Keep only the news listings above the high-water mark, i.e. stop at the first listing that was already seen in a previous run
+                # or that was published before the high-water mark date. Listings are ordered from the most recent.
+                listing = []
+                reached_high_water_mark = False
+                for item in news_extract:
+                    published = datetime.strptime(item['Published_Date'], '%d %b %Y').strftime("%Y-%m-%d")
+                    if high_water_mark is not None and (published < high_water_mark[0] or item_fingerprint(published, item['Text']) == high_water_mark[1]):
+                        reached_high_water_mark = True
+                        break
+                    listing.append(item)
+                df = _to_frame(listing, fromdate)
+                if len(df) > 0:
+                    yield df
+                if reached_high_water_mark:
+                    logger.info(f"ACCC Scraper - reached previously scraped media releases on page {i}")
+                    break
+
+                # If the last published date on the page is still more recent than the user input date, then continue to the next page
+                # Else stop if the last published date on the page is already earlier than user input date
+                if datetime.strptime(news_extract[-1]['Published_Date'], '%d %b %Y') < datetime.strptime(fromdate, '%d %b %Y'):
+                    break
+        finally:
+            pages.close()
         
+    except MyError as e:
+        raise MyError(f"ACCC Scraper - {e}")
     except requests.exceptions.ConnectionError as e:
         raise MyError(f"ACCC Scraper - Network connection error: {e}")
     except requests.exceptions.Timeout as e:
@@ -92,4 +128,45 @@ def get_ACCC_press_release(fromdate: str, folder:str,  user_agents:List[str]=_us
     except requests.exceptions.RequestException as e:
         raise MyError(f"ACCC Scraper - An unexpected Requests error occurred: {e}")
     except Exception as e:
-        raise MyError(f"ACCC Scraper - An unexpected general error occurred: {e}")
\ No newline at end of file
+        raise MyError(f"ACCC Scraper - An unexpected general error occurred: {e}")
+    finally:
+        fetcher.close()
+
+
+def fetch_ACCC_press_release(fromdate: str, user_agents:List[str]=_user_agents, incremental:bool=True, prefetch:int=3,
+                             cancellation:Cancellation|None=None)->pd.DataFrame:
+    """Scrapes ACCC media releases published from the given date onwards and not yet scraped, ordered from the most recent"""
+    frames = list(iter_ACCC_press_release(fromdate, user_agents=user_agents, incremental=incremental, prefetch=prefetch,
+                                          cancellation=cancellation))
+    if len(frames) == 0:
+        return _to_frame([], fromdate)
+    return pd.concat(frames, ignore_index=True)
+
+
+@register_scraper
+class ACCCScraper(ScraperPlugin):
+    """Scraper plugin for the media releases in the ACCC news centre"""
+    name = 'ACCC'
+    source = source_name
+
+    def __init__(self, user_agents:List[str]=_user_agents, incremental:bool=True, prefetch:int=3):
+        self.user_agents = user_agents
+        self.incremental = incremental
+        self.prefetch = prefetch
+
+    def parse(self, html:str)->List[Dict]:
+        return parse_ACCC_listing(html)
+
+    def fetch_since(self, fromdate:str, cancellation:Cancellation|None=None)->pd.DataFrame:
+        return fetch_ACCC_press_release(fromdate, user_agents=self.user_agents, incremental=self.incremental, prefetch=self.prefetch,
+                                        cancellation=cancellation)
+
+    def iter_since(self, fromdate:str, cancellation:Cancellation|None=None)->Iterator[pd.DataFrame]:
+        return iter_ACCC_press_release(fromdate, user_agents=self.user_agents, incremental=self.incremental, prefetch=self.prefetch,
+                                       cancellation=cancellation)
+
+
+def get_ACCC_press_release(fromdate: str, folder:str,  user_agents:List[str]=_user_agents, incremental:bool=True, prefetch:int=3)->int:
+    """Scrapes ACCC media releases published from the given date onwards and saves them as CSV in the given folder.
+    Returns the number of media releases saved."""
+    return ACCCScraper(user_agents=user_agents, incremental=incremental, prefetch=prefetch).collect(fromdate, folder)
\ No newline at end of file
@@ -0,0 +1,193 @@
+# Import relevant libraries
+import requests, sqlite3, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from helper_functions.utility import MyError, dbfolder
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterator
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+cachetable = 'http_cache'    # Set the tablename for the sqlite database table used to store the validators and bodies of fetched pages
+
+
+class Cancellation:
+    """Deadline and cancellation flag shared by a scraper run and its caller. The fetcher stops requesting pages once the run is
+    cancelled or past its deadline, and the scraper commits the run before saving its CSV or advancing its high-water mark, so that
+    a run cancelled by its caller (e.g. after a timeout) saves nothing, and a run that has started saving is not cancelled."""
+
+    def __init__(self, timeout:float|None=None):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._committed = False
+
+    def remaining(self)->float|None:
+        """Seconds left before the deadline, or None if there is no deadline"""
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0)
+
+    def check(self):
+        """Raises MyError if the run is cancelled or past its deadline"""
+        if self._cancelled:
+            raise MyError("cancelled")
+        if self.remaining() == 0:
+            raise MyError(f"exceeded {self.timeout}s timeout")
+
+    def cancel(self)->bool:
+        """Cancels the run, unless it has already been committed. Returns whether the run was cancelled."""
+        with self._lock:
+            if not self._committed:
+                self._cancelled = True
+            return self._cancelled
+
+    def commit(self):
+        """Marks the run as saving its results, after which it can no longer be cancelled. Raises MyError if it was cancelled already."""
+        with self._lock:
+            self.check()
+            self._committed = True
+
+
+@dataclass
+class FetchResult:
+    """Outcome of a page fetch. If the server responds 304 Not Modified, text holds the body saved from the previous fetch."""
+    url: str
+    status_code: int
+    text: str
+    not_modified: bool = False
+
+
+class PageFetcher:
+    """Fetches web pages through a pooled, keep-alive requests.Session, conditionally on the validators saved from the previous
+    fetch, with concurrent requests to the same host capped and spaced out for politeness."""
+
+    def __init__(self, headers:Dict[str, str]|None=None, timeout:tuple=(10, 30), max_per_host:int=3, min_interval:float=0.1,
+                 pool_size:int=10, conditional:bool=True, database:str=f'{dbfolder}/data.db', cancellation:Cancellation|None=None):
+        self.timeout = timeout
+        self.cancellation = cancellation
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.conditional = conditional
+        # Pooled session, reusing TCP/TLS connections across pages, with retries on transient server errors
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        # Per-host concurrency cap and spacing between requests
+        self._host_lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_next_start: Dict[str, float] = {}
+        # Validators and bodies of previously fetched pages, for conditional requests
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._database = database
+        # Set by close(), so that prefetches still in flight neither request further pages nor reopen the database
+        self._closed = False
+
+    def _connect(self)->sqlite3.Connection:
+        if self._closed:
+            raise MyError("Page fetcher is closed")
+        if self._conn is None:
+            Path(self._database).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self._database, check_same_thread=False)
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {cachetable} (
+                    Url TEXT PRIMARY KEY,
+                    ETag TEXT,
+                    Last_Modified TEXT,
+                    Body TEXT NOT NULL,
+                    Updated TEXT NOT NULL
+                    )
+                """)
+            self._conn.commit()
+        return self._conn
+
+    def _host_slot(self, host:str)->threading.BoundedSemaphore:
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def _wait_turn(self, host:str):
+        """Spaces out the start of consecutive requests to the same host by at least min_interval seconds."""
+        with self._host_lock:
+            now = time.monotonic()
+            start = max(now, self._host_next_start.get(host, now))
+            self._host_next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    def fetch(self, url:str)->FetchResult:
+        """Fetches a single page, short-circuiting on 304 Not Modified with the previously saved body."""
+        cached = None
+        headers = {}
+        if self.conditional:
+            with self._db_lock:
+                cached = self._connect().execute(f"SELECT ETag, Last_Modified, Body FROM {cachetable} WHERE Url = ?", (url,)).fetchone()
+            if cached is not None:
+                if cached[0]:
+                    headers["If-None-Match"] = cached[0]
+                if cached[1]:
+                    headers["If-Modified-Since"] = cached[1]
+
+        host = urlparse(url).netloc
+        with self._host_slot(host):
+            self._wait_turn(host)
+            if self._closed:
+                raise MyError("Page fetcher is closed")
+            timeout = self.timeout
+            # No page is requested once the run is cancelled or past its deadline, and the timeouts are capped at the time left
+            if self.cancellation is not None:
+                self.cancellation.check()
+                remaining = self.cancellation.remaining()
+                if remaining is not None:
+                    timeout = tuple(max(min(t, remaining), 0.1) for t in self.timeout)
+            response = self.session.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and cached is not None:
+            return FetchResult(url=url, status_code=304, text=cached[2], not_modified=True)
+        # raises error in the event of bad responses
+        response.raise_for_status()
+
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if self.conditional and (etag or last_modified) and not self._closed:
+            with self._db_lock:
+                conn = self._connect()
+                conn.execute(f"INSERT OR REPLACE INTO {cachetable} (Url, ETag, Last_Modified, Body, Updated) VALUES (?, ?, ?, ?, ?)",
+                             (url, etag, last_modified, response.text, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+        return FetchResult(url=url, status_code=response.status_code, text=response.text)
+
+    def iter_pages(self, url_for_page:Callable[[int], str], prefetch:int=3)->Iterator[FetchResult]:
+        """Yields listing pages 0, 1, 2, ... in order. The first page is fetched on its own, as incremental runs often need
+        nothing more. From the second page onwards, the next `prefetch` pages are fetched concurrently ahead of the consumer.
+        Pages not yet requested when the consumer stops iterating are cancelled."""
+        yield self.fetch(url_for_page(0))
+
+        executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+        futures = deque()
+        next_page = 1
+        try:
+            while True:
+                while len(futures) < max(1, prefetch):
+                    futures.append(executor.submit(self.fetch, url_for_page(next_page)))
+                    next_page += 1
+                yield futures.popleft().result()
+        finally:
+            # Cancels the pages not yet started and waits for those in flight, so that none is fetched or saved after close()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        """Releases the pooled connections and the database connection. Pages still being fetched are discarded."""
+        self._closed = True
+        self.session.close()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,75 @@
+# Import relevant libraries
+import importlib, logging, os, pkgutil
+import pandas as pd
+from abc import ABC, abstractmethod
+from pathlib import Path
+from scrapers.fetcher import Cancellation
+from scrapers.scraper_state import item_fingerprint, set_high_water_mark
+from typing import Dict, Iterator, List, Type
+
+
+class ScraperPlugin(ABC):
+    """Base class for news source scrapers. Each plugin sets a short `name` (used in CSV file names), the full `source`
+    name saved in the news table and a per-source `timeout` in seconds, and implements `parse` and `fetch_since`.
+    If a cancellation is given, the plugin stops fetching once it is cancelled or past its deadline."""
+    name: str = ''
+    source: str = ''
+    timeout: float = 300.0
+
+    @abstractmethod
+    def parse(self, html:str)->List[Dict]:
+        """Extracts the news listings, each with 'Published_Date' and 'Text', from a page of the news source"""
+
+    @abstractmethod
+    def fetch_since(self, fromdate:str, cancellation:Cancellation|None=None)->pd.DataFrame:
+        """Returns the news articles published from the given date (in the format day month year, e.g. 01 Jan 2025)
+        and not yet scraped, ordered from the most recent, with columns Published_Date, Source, Extracted_Date and Text"""
+
+    def iter_since(self, fromdate:str, cancellation:Cancellation|None=None)->Iterator[pd.DataFrame]:
+        """Yields the news articles returned by fetch_since in batches, e.g. one listing page at a time, so that they can be
+        processed as soon as they are scraped. Plugins that page through their source override this."""
+        df = self.fetch_since(fromdate, cancellation=cancellation)
+        if len(df) > 0:
+            yield df
+
+    def record_high_water_mark(self, df:pd.DataFrame):
+        """Records the newest of the given news articles, ordered from the most recent, as the source's high-water mark"""
+        newest = df.iloc[0]
+        set_high_water_mark(self.source, newest['Published_Date'], item_fingerprint(newest['Published_Date'], newest['Text']))
+
+    def collect(self, fromdate:str, folder:str, cancellation:Cancellation|None=None)->int:
+        """Fetches the news articles, saves them as CSV in the given folder and then advances the source's high-water mark.
+        Returns the number of news articles saved. If the cancellation is cancelled or past its deadline before saving starts,
+        raises MyError without saving anything."""
+        logger = logging.getLogger('shared_app_logger')
+        df = self.fetch_since(fromdate, cancellation=cancellation)
+        if len(df) == 0:
+            logger.info(f"No news articles dated from '{fromdate}' downloaded from {self.name}")
+            return 0
+        # A run cancelled by its caller must not save its CSV or advance its high-water mark
+        if cancellation is not None:
+            cancellation.commit()
+        # Export as csv
+        df.to_csv(os.path.join(folder, f'{self.name}_from_{fromdate}.csv'), index=False)
+        # Record the newest news article as the high-water mark for the next run, only after the CSV is saved
+        self.record_high_water_mark(df)
+        # Update log upon successful scraping
+        logger.info(f"News articles dated from '{fromdate}' successfully downloaded from {self.name}")
+        return len(df)
+
+
+# Registry of scraper plugins, keyed by plugin name
+_registry: Dict[str, Type[ScraperPlugin]] = {}
+
+def register_scraper(cls:Type[ScraperPlugin])->Type[ScraperPlugin]:
+    """Class decorator that adds a scraper plugin to the registry"""
+    _registry[cls.name] = cls
+    return cls
+
+
+def discover_scrapers()->Dict[str, ScraperPlugin]:
+    """Imports every module in the scrapers package, so that their plugins register themselves, and returns an instance
+    of each registered plugin keyed by name"""
+    for module in pkgutil.iter_modules([str(Path(__file__).parent)]):
+        importlib.import_module(f"scrapers.{module.name}")
+    return {name: cls() for name, cls in _registry.items()}
@@ -0,0 +1,52 @@
+# Import relevant libraries
+import hashlib, sqlite3
+from datetime import datetime
+from helper_functions.utility import dbfolder
+from pathlib import Path
+from typing import Tuple
+
+statetable = 'scraper_state'    # Set the tablename for the sqlite database table used to store the high-water mark of each news source
+
+
+def item_fingerprint(published_date:str, text:str)->str:
+    """Stable fingerprint of a news listing, based on its published date (in the format YYYY-MM-DD) and its
+    whitespace-normalised, casefolded text"""
+    normalised = " ".join(str(text).split()).casefold()
+    return hashlib.sha256(f"{published_date}|{normalised}".encode('utf-8')).hexdigest()
+
+
+def _connect(database:str)->sqlite3.Connection:
+    """Connects to the database and creates the scraper state table, if it doesn't exist"""
+    Path(database).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(database)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {statetable} (
+            Source TEXT PRIMARY KEY,
+            Published_Date TEXT NOT NULL,
+            Fingerprint TEXT NOT NULL,
+            Updated TEXT NOT NULL
+            )
+        """)
+    return conn
+
+
+def get_high_water_mark(source:str, database:str=f'{dbfolder}/data.db')->Tuple[str, str]|None:
+    """Returns the (published date, item fingerprint) of the newest news listing previously scraped from the source,
+    or None if the source has not been scraped before."""
+    conn = _connect(database)
+    try:
+        row = conn.execute(f"SELECT Published_Date, Fingerprint FROM {statetable} WHERE Source = ?", (source,)).fetchone()
+        return tuple(row) if row else None
+    finally:
+        conn.close()
+
+
+def set_high_water_mark(source:str, published_date:str, fingerprint:str, database:str=f'{dbfolder}/data.db'):
+    """Records the newest news listing scraped from the source, to be used as the stopping point for the next run."""
+    conn = _connect(database)
+    try:
+        conn.execute(f"INSERT OR REPLACE INTO {statetable} (Source, Published_Date, Fingerprint, Updated) VALUES (?, ?, ?, ?)",
+                     (source, published_date, fingerprint, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+    finally:
+        conn.close()